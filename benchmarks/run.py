@@ -0,0 +1,238 @@
+"""
+Performance benchmarks of the simulation building blocks.
+
+Run from the repository root:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.25
+
+Every benchmark reports latency percentiles and throughput, results are written as JSON and can be
+compared against a stored baseline, the process exits with status 1 if any benchmark regressed.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from simulations.amm import AMM, black_scholes
+from simulations.monte_carlo import RoundConfig, run_round
+from simulations.price_time_series import generate_price_volatility_process
+from simulations.users import TraderUser
+
+
+SEED = 42
+
+DEFAULT_SIZES = {
+    'repeat': 200,
+    'strikes': [21, 1_000],
+    'book_sizes': [0, 1_000, 10_000],
+    'series_lengths': [1_000, 10_000, 100_000],
+    'round_epochs': 200,
+}
+
+
+def _seed() -> None:
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+
+def measure(
+        fn: Callable[[], Any],
+        repeat: int,
+        setup: Optional[Callable[[], None]] = None,
+        ops_per_call: int = 1
+) -> Dict[str, float]:
+    """Calls fn repeat times (after setup if given, setup is not timed) and summarizes the latencies."""
+    latencies = np.empty(repeat)
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - start
+    total = latencies.sum()
+    return {
+        'calls': repeat,
+        'mean_s': float(latencies.mean()),
+        'p50_s': float(np.percentile(latencies, 50)),
+        'p90_s': float(np.percentile(latencies, 90)),
+        'p99_s': float(np.percentile(latencies, 99)),
+        'throughput_per_s': float(repeat * ops_per_call / total) if total > 0 else float('inf'),
+    }
+
+
+def _amm(book_size: int = 0) -> AMM:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., call_pool_size=1e9, put_pool_size=1e9)
+    for i in range(book_size):
+        strike_price = amm.call_strikes[i % len(amm.call_strikes)]
+        amm.trade(strike_price=strike_price, type_='call', long_short='long', quantity=1.)
+    return amm
+
+
+def bench_black_scholes(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    results = {'black_scholes[scalar]': measure(lambda: black_scholes(.1, 1., 1.1, 0., 100.), sizes['repeat'])}
+    for n_strikes in sizes['strikes']:
+        strikes = np.linspace(.5, 2., n_strikes)
+        results[f'black_scholes[vector, strikes={n_strikes}]'] = measure(
+            lambda: black_scholes(.1, 1., strikes, 0., 100.), sizes['repeat'], ops_per_call=n_strikes
+        )
+    return results
+
+
+def bench_get_premia(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    amm = _amm()
+    results = {
+        'AMM.get_premia[uncached]': measure(
+            lambda: amm.get_premia(1.1, 'call', 'long'), sizes['repeat'], setup=amm.clear_quote_cache
+        ),
+        'AMM.get_premia[cached]': measure(lambda: amm.get_premia(1.1, 'call', 'long'), sizes['repeat']),
+    }
+    n_quotes = 2 * (len(amm.call_strikes) + len(amm.put_strikes))
+    results['AMM.get_premia_surface'] = measure(amm.get_premia_surface, sizes['repeat'], ops_per_call=n_quotes)
+    return results
+
+
+def bench_trade(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for book_size in sizes['book_sizes']:
+        amm = _amm(book_size)
+        trades = iter(range(sizes['repeat']))
+
+        def trade() -> None:
+            i = next(trades)
+            # alternate sides, so that both issuing and netting are measured
+            amm.trade(
+                strike_price=amm.call_strikes[i % len(amm.call_strikes)],
+                type_='call',
+                long_short='long' if i % 2 else 'short',
+                quantity=1.
+            )
+        results[f'AMM.trade[book={book_size}]'] = measure(trade, sizes['repeat'])
+    return results
+
+
+def bench_clear(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for book_size in sizes['book_sizes']:
+        template = _amm(book_size)
+        call_options = template.call_issued_options
+        amm = AMM(time_till_maturity=0., current_underlying_price=1.2)
+
+        def setup() -> None:
+            amm.call_issued_options = call_options
+
+        results[f'AMM.clear[book={book_size}]'] = measure(
+            amm.clear, max(sizes['repeat'] // 10, 1), setup=setup, ops_per_call=max(book_size, 1)
+        )
+    return results
+
+
+def bench_price_process(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for series_len in sizes['series_lengths']:
+        results[f'generate_price_volatility_process[len={series_len}]'] = measure(
+            lambda: generate_price_volatility_process(series_len=series_len),
+            max(sizes['repeat'] // 20, 1),
+            ops_per_call=series_len
+        )
+    return results
+
+
+def bench_trader_user(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    amm = _amm()
+    user = TraderUser(amm=amm, volatility_adjustment=0.1)
+    return {'TraderUser.trade': measure(lambda: user.trade(1., .1), sizes['repeat'])}
+
+
+def bench_round(sizes: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    config = RoundConfig(epochs=sizes['round_epochs'])
+    return {
+        f'run_round[epochs={config.epochs}]': measure(
+            lambda: run_round(0, SEED, config), 3, ops_per_call=config.epochs
+        )
+    }
+
+
+BENCHMARKS = [
+    bench_black_scholes,
+    bench_get_premia,
+    bench_trade,
+    bench_clear,
+    bench_price_process,
+    bench_trader_user,
+    bench_round,
+]
+
+
+def run(sizes: Optional[Dict[str, Any]] = None, only: Sequence[str] = ()) -> Dict[str, Any]:
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    results = {}
+    for benchmark in BENCHMARKS:
+        if only and not any(name in benchmark.__name__ for name in only):
+            continue
+        _seed()
+        results.update(benchmark(sizes))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'seed': SEED,
+            'sizes': sizes,
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Returns benchmarks whose median latency is more than (1 + tolerance) times the baseline's."""
+    regressions = []
+    for name, result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            continue
+        ratio = result['p50_s'] / baseline_result['p50_s']
+        if ratio > 1 + tolerance:
+            regressions.append({'name': name, 'ratio': ratio, 'p50_s': result['p50_s'],
+                                'baseline_p50_s': baseline_result['p50_s']})
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write results as JSON to this file (stdout otherwise)')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown of p50 latency')
+    parser.add_argument('--sizes', type=json.loads, default={}, help='JSON overriding DEFAULT_SIZES')
+    parser.add_argument('--only', nargs='*', default=(), help='run benchmarks whose name contains any of these')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['name']}: p50 {regression['p50_s']:.3g}s vs baseline "
+                f"{regression['baseline_p50_s']:.3g}s ({regression['ratio']:.2f}x)",
+                file=sys.stderr
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,27 +1,287 @@
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import copy
+import io
 import math
 
-import scipy.stats
+import numpy as np
+import scipy.special
 
+from simulations.journal import TradeJournal
 from simulations.option import Option
+from simulations.position_book import PositionBook, quantize_strike, quantize_strikes
+from simulations.series import EpochSeries
+from simulations.strikes import StrikeIndex
+from simulations.timing import StageTimer
+
+
+ArrayLike = Union[float, np.ndarray]
+# arguments of these types are priced with the math module (see black_scholes)
+_SCALAR_TYPES = (float, int)
+
+
+def black_scholes(vol: ArrayLike, s: ArrayLike, k: ArrayLike, r: ArrayLike, t: ArrayLike) -> Tuple[Any, Any]:
+    """
+    Call and put premia of European options.
+
+    All arguments may be scalars or numpy arrays, arrays are broadcast against each other, so a whole strike
+    surface can be priced in one call. scipy.special.ndtr is used instead of scipy.stats.norm.cdf since it is
+    a plain ufunc and does not pay the per-call dispatch overhead of scipy.stats distributions.
+    Scalar arguments (as in AMM.trade) are priced with the math module, which is several times faster
+    than numpy on single values.
+
+    Raises ValueError at or after maturity (t <= 0), for zero volatility and for non-positive prices or strikes,
+    where the formula is not defined: e.g. at the money at maturity the premia would be nan, which passes
+    the pool's capital checks unnoticed.
+    """
+    # checked one by one, this runs for every trade
+    if (
+            isinstance(vol, _SCALAR_TYPES) and isinstance(s, _SCALAR_TYPES) and isinstance(k, _SCALAR_TYPES)
+            and isinstance(r, _SCALAR_TYPES) and isinstance(t, _SCALAR_TYPES)
+    ):
+        if t <= 0 or vol == 0 or s <= 0 or k <= 0:
+            raise ValueError
+        return _black_scholes_scalar(vol, s, k, r, t)
+    if any(np.any(np.less_equal(x, 0)) for x in (t, s, k)) or np.any(np.equal(vol, 0)):
+        raise ValueError
+    sqrt_t = np.sqrt(t)
+    d_1 = 1 / sqrt_t / vol * (np.log(np.divide(s, k)) + (r + np.square(vol) / 2) * t)
+    d_2 = d_1 - vol * sqrt_t
+
+    cdf = scipy.special.ndtr
+    discounted_k = k * np.exp(np.negative(r) * t)
+
+    call_premia = cdf(d_1) * s - cdf(d_2) * discounted_k
+    put_premia = discounted_k - s + call_premia
+
+    return call_premia, put_premia
+
+
+def _normal_cdf(x: float) -> float:
+    return 0.5 * math.erfc(-x / math.sqrt(2))
 
 
-def black_scholes(vol: float, s: float, k: float, r: float, t: int) -> Tuple[float, float]:
-    d_1 = 1 / math.sqrt(t) / vol * (math.log(s / k) + (r + vol ** 2 / 2) * t)
-    d_2 = d_1 - vol * math.sqrt(t)
+def _black_scholes_scalar(vol: float, s: float, k: float, r: float, t: float) -> Tuple[float, float]:
+    sqrt_t = math.sqrt(t)
+    d_1 = 1 / sqrt_t / vol * (math.log(s / k) + (r + vol ** 2 / 2) * t)
+    d_2 = d_1 - vol * sqrt_t
 
-    cdf = scipy.stats.norm.cdf
+    discounted_k = k * math.exp(-r * t)
 
-    call_premia = cdf(d_1) * s - cdf(d_2) * k * math.exp(-r * t)
-    put_premia = k * math.exp(-r * t) - s + call_premia
+    call_premia = _normal_cdf(d_1) * s - _normal_cdf(d_2) * discounted_k
+    put_premia = discounted_k - s + call_premia
 
     return call_premia, put_premia
 
 
+def black_scholes_greeks(
+        vol: ArrayLike, s: ArrayLike, k: ArrayLike, r: ArrayLike, t: ArrayLike
+) -> Tuple[Any, Any, Any, Any]:
+    """
+    Call delta, put delta, gamma and vega of European options (gamma and vega are the same for calls and puts).
+
+    Arguments are the same as for black_scholes and broadcast the same way.
+    """
+    sqrt_t = np.sqrt(t)
+    d_1 = 1 / sqrt_t / vol * (np.log(np.divide(s, k)) + (r + np.square(vol) / 2) * t)
+    pdf = np.exp(-np.square(d_1) / 2) / math.sqrt(2 * math.pi)
+
+    call_delta = scipy.special.ndtr(d_1)
+    put_delta = call_delta - 1
+    gamma = pdf / (np.multiply(s, vol) * sqrt_t)
+    vega = np.multiply(s, pdf) * sqrt_t
+
+    return call_delta, put_delta, gamma, vega
+
+
+def get_new_volatility(
+        volatility: float,
+        pool_size: float,
+        type_: str,
+        long_short: str,
+        quantity: ArrayLike,
+        underlying_price: float,
+        alpha: float
+) -> ArrayLike:
+    """
+    Volatility of the pool after the user trades given quantity.
+
+    See https://carmine-finance.gitbook.io/carmine-options-amm/mechanics-deeper-look/option-pricing-mechanics#volatility-updates
+    """
+    if type_ == 'put':
+        correct_token_quantity = quantity * underlying_price
+    else:
+        correct_token_quantity = quantity
+    new_pool_size = pool_size - correct_token_quantity
+
+    signed_quantity = correct_token_quantity if long_short == 'long' else -correct_token_quantity
+
+    return volatility / (1 - (signed_quantity / new_pool_size) ** alpha)
+
+
+def quote_premia(
+        strike_price: ArrayLike,
+        type_: str,
+        long_short: str,
+        quantity: ArrayLike,
+        volatility: float,
+        pool_size: float,
+        underlying_price: float,
+        time_till_maturity: float,
+        fee_size: float,
+        alpha: float,
+        risk_free_rate: float,
+) -> ArrayLike:
+    """
+    Premia (after fees) of a trade against a pool in given state, this is what AMM.get_premia returns.
+
+    Pure function of the explicit state, strike_price and quantity may be numpy arrays.
+    """
+    new_volatility = get_new_volatility(volatility, pool_size, type_, long_short, quantity, underlying_price, alpha)
+    trade_volatility = (volatility + new_volatility) / 2
+
+    call_premia, put_premia = black_scholes(
+        trade_volatility, underlying_price, strike_price, risk_free_rate, time_till_maturity
+    )
+
+    if type_ == 'call':
+        # call premia is paid in base token, hence:
+        premia = call_premia / underlying_price
+    else:
+        premia = put_premia
+
+    if long_short == 'long':
+        # User goes long -> pool is short and receives premia
+        return premia * (1 + fee_size) * quantity
+    # User goes short -> pool is long and pays premia
+    return premia * (1 - fee_size) * quantity
+
+
+def quote_premia_surface(
+        call_strikes: List[float],
+        put_strikes: List[float],
+        quantities: ArrayLike,
+        call_volatility: float,
+        put_volatility: float,
+        call_pool_size: float,
+        put_pool_size: float,
+        underlying_price: float,
+        time_till_maturity: float,
+        fee_size: float,
+        alpha: float,
+        risk_free_rate: float,
+) -> Dict[Tuple[str, str], np.ndarray]:
+    """
+    Premia for every call and put strike, both sides and all given quantities at once.
+
+    Returns dict keyed by (type_, long_short), values are arrays of shape np.shape(quantities) + (n_strikes,)
+    where [..., i] is equal to quote_premia(strikes[i], type_, long_short, quantity, ...).
+    The whole surface is priced in a single black_scholes evaluation.
+    """
+    quantities = np.asarray(quantities, dtype=float)[..., np.newaxis]
+    keys = [(type_, long_short) for type_ in ('call', 'put') for long_short in ('long', 'short')]
+
+    volatilities = []
+    strikes = []
+    for type_, long_short in keys:
+        if type_ == 'call':
+            type_strikes, volatility, pool_size = call_strikes, call_volatility, call_pool_size
+        else:
+            type_strikes, volatility, pool_size = put_strikes, put_volatility, put_pool_size
+        new_volatility = get_new_volatility(
+            volatility, pool_size, type_, long_short, quantities, underlying_price, alpha
+        )
+        trade_volatility, type_strikes = np.broadcast_arrays(
+            (volatility + new_volatility) / 2, np.asarray(type_strikes, dtype=float)
+        )
+        volatilities.append(trade_volatility)
+        strikes.append(type_strikes)
+    splits = np.cumsum([k.shape[-1] for k in strikes])[:-1]
+
+    call_premia, put_premia = black_scholes(
+        np.concatenate(volatilities, axis=-1),
+        underlying_price,
+        np.concatenate(strikes, axis=-1),
+        risk_free_rate,
+        time_till_maturity
+    )
+    # call premia is paid in base token
+    call_premia = call_premia / underlying_price
+
+    surface = {}
+    for (type_, long_short), call, put in zip(
+            keys, np.split(call_premia, splits, axis=-1), np.split(put_premia, splits, axis=-1)
+    ):
+        premia = call if type_ == 'call' else put
+        fee_multiplier = (1 + fee_size) if long_short == 'long' else (1 - fee_size)
+        surface[(type_, long_short)] = premia * fee_multiplier * quantities
+    return surface
+
+
 class NotEnoughPoolCapitalError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class AMMSnapshot:
+    """State of AMM (without the quote cache and the journal), positions as PositionBook.snapshot arrays."""
+
+    call_strikes: np.ndarray
+    put_strikes: np.ndarray
+    call_volatility: float
+    put_volatility: float
+    call_pool_size: float
+    put_pool_size: float
+    time_till_maturity: float
+    current_underlying_price: float
+    epoch: int
+    call_positions: np.ndarray
+    call_buckets: np.ndarray
+    put_positions: np.ndarray
+    put_buckets: np.ndarray
+    fee_size: float
+    alpha: float
+
+    def to_bytes(self) -> bytes:
+        """Serializes the snapshot to the (uncompressed) .npz format."""
+        buffer = io.BytesIO()
+        np.savez(buffer, **{name: np.asarray(value) for name, value in self.__dict__.items()})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'AMMSnapshot':
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(**{
+                name: arrays[name] if arrays[name].ndim else arrays[name].item()
+                for name in arrays.files
+            })
+
+
+# Keys of AMM.get_exposure
+EXPOSURE_KEYS = (
+    'call_delta', 'call_gamma', 'call_vega', 'put_delta', 'put_gamma', 'put_vega',
+)
+
+# Keys of AMM.get_nav
+NAV_KEYS = ('call_nav', 'put_nav')
+
+# Statuses of orders of AMM.trade_batch
+TRADE_EXECUTED = 0
+TRADE_NOT_ENOUGH_CAPITAL = 1
+TRADE_NOT_RUN = 2
+
+
+@dataclass(frozen=True)
+class TradeBatchResult:
+    """Per-order results of AMM.trade_batch."""
+    # premia after fee, nan for orders that were not executed
+    premia: np.ndarray
+    # TRADE_EXECUTED, TRADE_NOT_ENOUGH_CAPITAL or TRADE_NOT_RUN
+    status: np.ndarray
+    # volatility of the order's type after the order, nan for orders that were not run
+    volatility: np.ndarray
+
+
 class AMM:
     # FEE_SIZE is relative fee from paid/received premia
     FEE_SIZE = 0.03
@@ -43,7 +303,20 @@ class AMM:
             put_volatility: float = 0.1,
             call_pool_size: float = 100,
             put_pool_size: float = 100,
+            journal: Optional[TradeJournal] = None,
+            record_exposure: bool = False,
+            record_nav: bool = False,
+            series_capacity: int = 1024,
+            fee_size: Optional[float] = None,
+            alpha: Optional[float] = None,
+            timer: Optional[StageTimer] = None,
     ) -> None:
+        # fee_size and alpha override FEE_SIZE and ALPHA of this pool
+        if fee_size is not None:
+            self.FEE_SIZE = fee_size
+        if alpha is not None:
+            self.ALPHA = alpha
+
         if call_strikes is None:
             self.call_strikes = [x / 10 for x in range(9, 20)]
         else:
@@ -59,63 +332,165 @@ class AMM:
         self.call_pool_size = call_pool_size
         self.put_pool_size = put_pool_size
 
-        self.call_issued_options = []
-        self.put_issued_options = []
+        self._call_book = PositionBook('call')
+        self._put_book = PositionBook('put')
 
         self.time_till_maturity = time_till_maturity
         self.current_underlying_price = current_underlying_price
 
+        self._quote_cache: Dict[str, Dict[Tuple[float, str, float], float]] = {'call': {}, 'put': {}}
+        self._quote_cache_state: Dict[str, Optional[Tuple[float, ...]]] = {'call': None, 'put': None}
+        self.quote_cache_hits = 0
+        self.quote_cache_misses = 0
+
+        # number of next_epoch calls, trades are recorded with it in the journal (if any)
+        self.epoch = 0
+        self.journal = journal
+        # times the stages of trade if set
+        self.timer = timer
+
+        # exposure and mark-to-market value at the end of every epoch (recorded by next_epoch),
+        # see get_exposure and get_nav
+        self.exposure_series: Optional[EpochSeries] = None
+        if record_exposure:
+            self.exposure_series = EpochSeries(('epoch',) + EXPOSURE_KEYS, series_capacity)
+        self.nav_series: Optional[EpochSeries] = None
+        if record_nav:
+            self.nav_series = EpochSeries(('epoch',) + NAV_KEYS, series_capacity)
+
+    @property
+    def call_strikes(self) -> np.ndarray:
+        """
+        Listed call strikes as a read-only array in the order they were listed, assign a list to replace them.
+        Strikes within STRIKE_TOLERANCE of one listed before them are merged into it (see StrikeIndex).
+        """
+        return self._call_strike_index.strikes
+
+    @call_strikes.setter
+    def call_strikes(self, strikes: Iterable[float]) -> None:
+        self._call_strike_index = StrikeIndex(strikes)
+
+    @property
+    def put_strikes(self) -> np.ndarray:
+        """
+        Listed put strikes as a read-only array in the order they were listed, assign a list to replace them.
+        Strikes within STRIKE_TOLERANCE of one listed before them are merged into it (see StrikeIndex).
+        """
+        return self._put_strike_index.strikes
+
+    @put_strikes.setter
+    def put_strikes(self, strikes: Iterable[float]) -> None:
+        self._put_strike_index = StrikeIndex(strikes)
+
+    def _get_strike_index(self, type_: str) -> StrikeIndex:
+        return self._call_strike_index if type_ == 'call' else self._put_strike_index
+
+    def is_listed(self, strike_price: float, type_: str) -> bool:
+        """Whether options of type_ can be traded at strike_price (within STRIKE_TOLERANCE of a listed strike)."""
+        return self._get_strike_index(type_).find(strike_price) is not None
+
+    @property
+    def call_issued_options(self) -> List[Option]:
+        """Copy of the call options owned by the pool, assign a list to replace them."""
+        return list(self._call_book)
+
+    @call_issued_options.setter
+    def call_issued_options(self, options: List[Option]) -> None:
+        self._call_book = PositionBook('call', options)
+
+    @property
+    def put_issued_options(self) -> List[Option]:
+        """Copy of the put options owned by the pool, assign a list to replace them."""
+        return list(self._put_book)
+
+    @put_issued_options.setter
+    def put_issued_options(self, options: List[Option]) -> None:
+        self._put_book = PositionBook('put', options)
+
+    def _get_book(self, type_: str) -> PositionBook:
+        return self._call_book if type_ == 'call' else self._put_book
+
     def next_epoch(self, time_till_maturity: float, current_underlying_price: float) -> None:
         if time_till_maturity < 0.:
             raise ValueError
         if current_underlying_price <= 0.:
             raise ValueError
+        if self.exposure_series is not None:
+            self.exposure_series.append(epoch=self.epoch, **self.get_exposure())
+        if self.nav_series is not None:
+            self.nav_series.append(epoch=self.epoch, **self.get_nav())
         self.time_till_maturity = time_till_maturity
         self.current_underlying_price = current_underlying_price
+        self.epoch += 1
 
-    def _get_new_volatility(self, type_: str, long_short: str, quantity: float) -> float:
-        """
-        See https://carmine-finance.gitbook.io/carmine-options-amm/mechanics-deeper-look/option-pricing-mechanics#volatility-updates
+    def get_exposure(self) -> Dict[str, float]:
         """
-        if type_ == 'put':
-            correct_token_quantity = quantity * self.current_underlying_price
-        else:
-            correct_token_quantity = quantity
-        if type_ == 'call':
-            current_volatility = self.call_volatility
-            new_pool_size = self.call_pool_size - correct_token_quantity
-        else:
-            current_volatility = self.put_volatility
-            new_pool_size = self.put_pool_size - correct_token_quantity
+        Delta, gamma and vega of the options owned by the pool (see EXPOSURE_KEYS).
 
-        signed_quantity = correct_token_quantity if long_short=='long' else -correct_token_quantity
-
-        new_volatility = current_volatility / (1 - (signed_quantity / new_pool_size) ** self.ALPHA)
-
-        return new_volatility
-
-    def _get_trade_volatility(self, type_: str, long_short: str, quantity: float) -> float:
-        current_volatility = self.call_volatility if type_ == 'call' else self.put_volatility
-        new_volatility = self._get_new_volatility(type_, long_short, quantity)
-        return (current_volatility + new_volatility) / 2
-
-    def _get_price(self, strike: float, type_: str, long_short: str, quantity: float) -> float:
-        trade_volatility = self._get_trade_volatility(type_, long_short, quantity)
-
-        vol = trade_volatility
-        t = self.time_till_maturity
-        r = self.RISK_FREE_RATE
-        s = self.current_underlying_price
-        k = strike
+        Long positions of the pool count positively, short ones negatively. Greeks are Black-Scholes greeks
+        at the current volatilities, i.e. in quote token for both calls and puts.
+        Net positions per strike of the options (not the listed strike) are kept up to date by the position books,
+        so only the strikes with open positions are priced (in a single vectorized call).
+        """
+        exposure = {}
+        for type_, volatility in (('call', self.call_volatility), ('put', self.put_volatility)):
+            strikes, net_quantity = self._get_book(type_).net_quantities()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                call_delta, put_delta, gamma, vega = black_scholes_greeks(
+                    volatility,
+                    self.current_underlying_price,
+                    strikes,
+                    self.RISK_FREE_RATE,
+                    self.time_till_maturity
+                )
+            delta = call_delta if type_ == 'call' else put_delta
+            exposure[f'{type_}_delta'] = float(net_quantity @ delta)
+            exposure[f'{type_}_gamma'] = float(net_quantity @ gamma)
+            exposure[f'{type_}_vega'] = float(net_quantity @ vega)
+        return exposure
 
-        call_premia, put_premia = black_scholes(vol, s, k, r, t)
+    def get_nav(self) -> Dict[str, float]:
+        """
+        Mark-to-market value of the pools (see NAV_KEYS), call pool in base token and put pool in quote token.
 
-        # call premia is paid in base token, hence:
-        call_premia = call_premia / self.current_underlying_price
+        Value of a pool is its size plus the capital locked in its short options plus the Black-Scholes value
+        (at the current volatility, intrinsic value at maturity) of its net position at every strike of its options.
+        At maturity this is what the pool size is after clear. Costs O(number of strikes with open positions).
+        """
+        nav = {}
+        price = self.current_underlying_price
+        at_maturity = math.isclose(self.time_till_maturity, 0., rel_tol=0.00001)
+        for type_, volatility, pool_size in (
+                ('call', self.call_volatility, self.call_pool_size),
+                ('put', self.put_volatility, self.put_pool_size),
+        ):
+            book = self._get_book(type_)
+            strikes, net_quantity = book.net_quantities()
+            if at_maturity:
+                call_value, put_value = np.maximum(price - strikes, 0.), np.maximum(strikes - price, 0.)
+            else:
+                call_value, put_value = black_scholes(
+                    volatility, price, strikes, self.RISK_FREE_RATE, self.time_till_maturity
+                )
+            # call values are in base token, as is the call pool
+            value = call_value / price if type_ == 'call' else put_value
+            nav[f'{type_}_nav'] = pool_size + book.locked_capital() + float(net_quantity @ value)
+        return nav
 
+    def _get_new_volatility(self, type_: str, long_short: str, quantity: float) -> float:
         if type_ == 'call':
-            return call_premia
-        return put_premia
+            current_volatility, pool_size = self.call_volatility, self.call_pool_size
+        else:
+            current_volatility, pool_size = self.put_volatility, self.put_pool_size
+        return get_new_volatility(
+            current_volatility,
+            pool_size,
+            type_,
+            long_short,
+            quantity,
+            self.current_underlying_price,
+            self.ALPHA
+        )
 
     def _update_volatility(self, type_: str, long_short: str, quantity: float) -> None:
         if type_ == 'call':
@@ -123,57 +498,86 @@ class AMM:
         else:
             self.put_volatility = self._get_new_volatility(type_, long_short, quantity)
 
-    def get_premia(self, strike_price: float, type_: str, long_short: str, quantity: float = 1.) -> float:
-        premia = self._get_price(strike=strike_price, type_=type_, long_short=long_short, quantity=quantity)
-
-        if long_short == 'long':
-            # User goes long -> pool is short and receives premia
-            return premia * (1 + self.FEE_SIZE) * quantity
-        # User goes short -> pool is long and pays premia
-        return premia * (1 - self.FEE_SIZE) * quantity
-
-    def _find_options(self, strike_price: float, type_: str, long_short: str) -> List[Option]:
-        """Looks if given option is owned by the AMM, if none exists return None"""
-        if type_ not in {'call', 'put'}:
-            raise ValueError
-        if long_short not in {'long', 'short'}:
-            raise ValueError
-
+    def _get_quote_cache(self, type_: str) -> Dict[Tuple[float, str, float], float]:
+        """
+        Returns memoized premia of given pool, the memo is flushed whenever anything the premia depend on changes
+        (pool's volatility and size, underlying price, time till maturity or the AMM constants).
+        Trades in the call pool therefore do not flush put quotes and vice versa.
+        """
         if type_ == 'call':
-            options = [
-                option
-                for option in self.call_issued_options
-                if option.long_short == long_short
-                if math.isclose(option.strike_price, strike_price, abs_tol=0.001)
-            ]
+            state = (self.call_volatility, self.call_pool_size)
         else:
-            options = [
-                option
-                for option in self.put_issued_options
-                if option.long_short == long_short
-                if math.isclose(option.strike_price, strike_price, abs_tol=0.001)
-            ]
-        return options
-
-    def _remove_option(self, option: Option) -> None:
-        if option.type_ == 'call':
-            size_before = len(self.call_issued_options)
-            self.call_issued_options.remove(option)
-            size_after = len(self.call_issued_options)
-            if size_before - size_after != 1:
-                raise ValueError
-            return
-        size_before = len(self.put_issued_options)
-        self.put_issued_options.remove(option)
-        size_after = len(self.put_issued_options)
-        if size_before - size_after != 1:
-            raise ValueError
+            state = (self.put_volatility, self.put_pool_size)
+        state += (
+            self.current_underlying_price,
+            self.time_till_maturity,
+            self.FEE_SIZE,
+            self.ALPHA,
+            self.RISK_FREE_RATE
+        )
+        if state != self._quote_cache_state[type_]:
+            self._quote_cache_state[type_] = state
+            self._quote_cache[type_] = {}
+        return self._quote_cache[type_]
+
+    def clear_quote_cache(self) -> None:
+        self._quote_cache = {'call': {}, 'put': {}}
+        self._quote_cache_state = {'call': None, 'put': None}
 
-    def _add_option(self, option: Option) -> None:
-        if option.type_ == 'call':
-            self.call_issued_options.append(option)
+    def get_premia(self, strike_price: float, type_: str, long_short: str, quantity: float = 1.) -> float:
+        """
+        Premia (after fees) the user pays for going long or receives for going short.
+
+        Results are cached per pool state, see quote_cache_hits and quote_cache_misses.
+        Use get_premia_surface for pricing arrays of strikes or quantities.
+        """
+        cache = self._get_quote_cache(type_)
+        key = (strike_price, long_short, quantity)
+        premia = cache.get(key)
+        if premia is not None:
+            self.quote_cache_hits += 1
+            return premia
+        self.quote_cache_misses += 1
+
+        premia = self._calculate_premia(strike_price, type_, long_short, quantity)
+        cache[key] = premia
+        return premia
+
+    def _calculate_premia(self, strike_price: float, type_: str, long_short: str, quantity: float = 1.) -> float:
+        if type_ == 'call':
+            volatility, pool_size = self.call_volatility, self.call_pool_size
         else:
-            self.put_issued_options.append(option)
+            volatility, pool_size = self.put_volatility, self.put_pool_size
+        return quote_premia(
+            strike_price,
+            type_,
+            long_short,
+            quantity,
+            volatility=volatility,
+            pool_size=pool_size,
+            underlying_price=self.current_underlying_price,
+            time_till_maturity=self.time_till_maturity,
+            fee_size=self.FEE_SIZE,
+            alpha=self.ALPHA,
+            risk_free_rate=self.RISK_FREE_RATE,
+        )
+
+    def get_premia_surface(self, quantities: ArrayLike = 1.) -> Dict[Tuple[str, str], np.ndarray]:
+        """See quote_premia_surface."""
+        return quote_premia_surface(
+            self.call_strikes,
+            self.put_strikes,
+            quantities,
+            call_volatility=self.call_volatility,
+            put_volatility=self.put_volatility,
+            call_pool_size=self.call_pool_size,
+            put_pool_size=self.put_pool_size,
+            underlying_price=self.current_underlying_price,
+            time_till_maturity=self.time_till_maturity,
+            fee_size=self.FEE_SIZE,
+            alpha=self.ALPHA,
+            risk_free_rate=self.RISK_FREE_RATE,
+        )
 
     def _pay_receive_premia(self, type_: str, signed_premia_after_fee: float) -> None:
         if type_ == 'call':
@@ -188,193 +592,290 @@ class AMM:
         First look if given option is owned by the AMM.
         If no option is found new one is created for user and returned and opposite one is added to the pool.
         """
+        timer = self.timer
+        if timer is not None:
+            start = timer.now()
+
         if type_ not in {'call', 'put'}:
             raise ValueError
         if long_short not in {'long', 'short'}:
             raise ValueError
-        if type_ == 'call':
-            if not [strike for strike in self.call_strikes if math.isclose(strike, strike_price, abs_tol=0.001)]:
-                raise ValueError
-        else:
-            if not [strike for strike in self.put_strikes if math.isclose(strike, strike_price, abs_tol=0.001)]:
-                raise ValueError
+        strike_index = self._get_strike_index(type_)
+        strike_id = strike_index.find(strike_price)
+        if strike_id is None:
+            raise ValueError
+        # quantity is in base (ETH) token, call's locked capital in base (ETH) and put's in (USDC)
+        locked_capital = quantity if type_ == 'call' else quantity * strike_price
+
+        if timer is not None:
+            timer.lap('trade.validate', start)
+
+        _, matched_strike_price = self._execute_trade(
+            strike_price,
+            quantize_strike(strike_index.strikes[strike_id].item()),
+            type_ == 'call',
+            long_short == 'long',
+            quantity,
+            locked_capital
+        )
+        if matched_strike_price is not None:
+            return Option(
+                strike_price=matched_strike_price,
+                type_=type_,
+                long_short=long_short,
+                locked_capital=locked_capital,
+                quantity=quantity
+            )
+        if long_short == 'long':
+            return Option(strike_price, type_, long_short, locked_capital=0., quantity=quantity)
+        return Option(strike_price, type_, long_short, locked_capital=locked_capital, quantity=quantity)
 
-        existing_options = self._find_options(strike_price, type_, long_short)
+    def trade_batch(
+            self,
+            strike_price: ArrayLike,
+            is_call: ArrayLike,
+            is_long: ArrayLike,
+            quantity: ArrayLike = 1.,
+            on_not_enough_capital: str = 'skip',
+    ) -> TradeBatchResult:
+        """
+        Executes orders one after another with the same semantics as trade, arguments are arrays
+        (broadcast against each other) and describe WHAT THE USERS WANT TO DO.
+
+        All strikes are validated before any order is executed. Orders the pool does not have enough
+        capital for are skipped (on_not_enough_capital='skip') or end the batch ('stop').
+        Whatever does not depend on the pools' state (bucket of the listed strike and locked capital)
+        is computed for all orders up front, every order is then executed by _execute_trade.
+        """
+        if on_not_enough_capital not in {'skip', 'stop'}:
+            raise ValueError
+        strike_price, is_call, is_long, quantity = np.broadcast_arrays(
+            np.asarray(strike_price, dtype=float),
+            np.asarray(is_call, dtype=bool),
+            np.asarray(is_long, dtype=bool),
+            np.asarray(quantity, dtype=float),
+        )
+        if strike_price.ndim != 1:
+            raise ValueError
+        strike_ids = np.where(
+            is_call, self._call_strike_index.ids(strike_price), self._put_strike_index.ids(strike_price)
+        )
+        if (strike_ids < 0).any():
+            raise ValueError
+        listed_strike_price = np.empty(len(strike_price))
+        listed_strike_price[is_call] = self.call_strikes[strike_ids[is_call]]
+        listed_strike_price[~is_call] = self.put_strikes[strike_ids[~is_call]]
+        locked_capital = np.where(is_call, quantity, quantity * strike_price)
+
+        stop = on_not_enough_capital == 'stop'
+        premia = np.full(len(strike_price), np.nan)
+        status = np.full(len(strike_price), TRADE_NOT_RUN, dtype=np.int8)
+        volatility = np.full(len(strike_price), np.nan)
+        orders = zip(
+            strike_price.tolist(),
+            quantize_strikes(listed_strike_price).tolist(),
+            is_call.tolist(),
+            is_long.tolist(),
+            quantity.tolist(),
+            locked_capital.tolist(),
+        )
+        for i, (order_strike, strike_key, call, long, order_quantity, order_locked_capital) in enumerate(orders):
+            try:
+                premia[i], _ = self._execute_trade(
+                    order_strike,
+                    strike_key,
+                    call,
+                    long,
+                    order_quantity,
+                    order_locked_capital,
+                    # every executed order changes the volatility, so the quotes would not be reused
+                    use_quote_cache=False
+                )
+                status[i] = TRADE_EXECUTED
+            except NotEnoughPoolCapitalError:
+                status[i] = TRADE_NOT_ENOUGH_CAPITAL
+            volatility[i] = self.call_volatility if call else self.put_volatility
+            if stop and status[i] == TRADE_NOT_ENOUGH_CAPITAL:
+                break
+        return TradeBatchResult(premia=premia, status=status, volatility=volatility)
+
+    def _execute_trade(
+            self,
+            strike_price: float,
+            strike_key: int,
+            call: bool,
+            long: bool,
+            quantity: float,
+            locked_capital: float,
+            use_quote_cache: bool = True
+    ) -> Tuple[float, Optional[float]]:
+        """
+        Executes validated order, see trade, this is the per-order step of both trade and trade_batch.
+        strike_key is the bucket of the listed strike strike_price was validated against (see quantize_strike),
+        options are matched by it. locked_capital is the capital quantity locks in the pool's token.
+
+        Returns premia after fee and the strike of the pool's options the trade was matched against
+        (None if a new option was issued).
+        """
+        timer = self.timer
+        if timer is not None:
+            start = timer.now()
+
+        type_ = 'call' if call else 'put'
+        long_short = 'long' if long else 'short'
+        book = self._call_book if call else self._put_book
+        if timer is not None:
+            start = timer.lap('trade.find_options', start)
 
         # 1) get_premia
         # TODO: FEES ARE VIRTUAL AND ARE NOT "REMOVED" FROM TRADERS
-        premia_after_fee = self.get_premia(strike_price, type_, long_short)
-        # If user goes long, pool receives fee, otherwise pays it
-        signed_premia_after_fee = premia_after_fee if long_short == 'long' else -premia_after_fee
+        if use_quote_cache:
+            premia_after_fee = self.get_premia(strike_price, type_, long_short)
+        else:
+            premia_after_fee = self._calculate_premia(strike_price, type_, long_short)
+        if timer is not None:
+            start = timer.lap('trade.get_premia', start)
 
         # FIXME: account for options already in pool
-        # 2.1) check enough capital in pool in case of short option (user short)
-        if long_short == 'short':
-            if type_ == 'call':
-                if self.call_pool_size < premia_after_fee:
-                    raise NotEnoughPoolCapitalError
-            if type_ == 'put':
-                if self.put_pool_size < premia_after_fee:
-                    raise NotEnoughPoolCapitalError
-        # 2.2) In case of long (user long) check enough capital
-        if long_short == 'long':
-            if type_ == 'call':
-                if self.call_pool_size < quantity:
-                    raise NotEnoughPoolCapitalError
-            if type_ == 'put':
-                if self.put_pool_size < quantity * strike_price:
-                    raise NotEnoughPoolCapitalError
+        # 2) check enough capital in pool, pool pays premia if user is short and locks capital if user is long
+        pool_size = self.call_pool_size if call else self.put_pool_size
+        if pool_size < (locked_capital if long else premia_after_fee):
+            raise NotEnoughPoolCapitalError
+        if timer is not None:
+            start = timer.lap('trade.check_capital', start)
 
         # 3) adjust volatility
+        volatility_before = self.call_volatility if call else self.put_volatility
         self._update_volatility(type_, long_short, quantity=quantity)
 
-        # 4) pay/receive premia
-        self._pay_receive_premia(type_, signed_premia_after_fee)
-
-        all_locked_capital = sum(option.locked_capital for option in existing_options)
-        # all_locked_capital_base = all_locked_capital if type_=='call' else all_locked_capital/strike_price
-        all_quantity = sum(option.quantity for option in existing_options)
-        if existing_options and (all_quantity >= quantity):
-            # 5.1) Aggregate existing_options into one:
-            # put the options together, so that they cover the required option
-            # quantity is in base (ETH) token, call's locked capital in base (ETH) and put's in (USDC)
-            existing_option = Option(
-                strike_price=existing_options[0].strike_price,
-                type_=existing_options[0].type_,
-                long_short=existing_options[0].long_short,
-                locked_capital=quantity if type_ == 'call' else quantity * strike_price,
-                quantity=quantity
-            )
-            # This below works thanks to mapping equal options (specifically equal strikes) on each other
-            if type_ == 'call':
-                if long_short == 'long':
-                    remaining_locked_capital = 0.
-                else:
-                    remaining_locked_capital = all_locked_capital - quantity
-            else:
-                if long_short == 'long':
-                    remaining_locked_capital = 0.
-                else:
-                    remaining_locked_capital = all_locked_capital - quantity * strike_price
-            remaining_quantity = all_quantity - quantity
-            complementary_option = Option(
-                strike_price=existing_options[0].strike_price,
-                type_=existing_options[0].type_,
-                long_short=existing_options[0].long_short,
-                locked_capital=remaining_locked_capital,
-                quantity=remaining_quantity
-            )
-
-            # 5.2) remove existing_options and add existing_option and complementary_option
-            for option in existing_options:
-                self._remove_option(option)
-            self._add_option(existing_option)
-            if remaining_quantity > 0:
-                self._add_option(complementary_option)
-            if remaining_quantity < 0.:
-                raise ValueError
-
-            # 5) remove option
-            self._remove_option(existing_option)
-
-            # 6) unlock capital (if some is locked)
-            if long_short == 'short':
-                # pool has to lock in capital
-                if type_ == 'call':
-                    self.call_pool_size += quantity
-                else:
-                    self.put_pool_size += quantity * strike_price
-
-            return existing_option
-
-        else:  # redundant else, but makes it easier to read
-            # 5) issue option
-            if type_ == 'call':
-                locked_capital = quantity
-            else:
-                locked_capital = quantity * strike_price
-            if long_short == 'long':
-                user_option = Option(strike_price, type_, long_short, locked_capital=0., quantity=quantity)
-                pool_option = Option(
-                    strike_price,
-                    type_,
-                    self.REVERSE_LONG_SHORT[long_short],
-                    locked_capital=locked_capital,
-                    quantity=quantity
-                )
-            else:
-                user_option = Option(strike_price, type_, long_short, locked_capital=locked_capital, quantity=quantity)
-                pool_option = Option(
-                    strike_price,
-                    type_,
-                    self.REVERSE_LONG_SHORT[long_short],
-                    locked_capital=0,
-                    quantity=quantity
-                )
-
-            # 6) add AMM's option to pool and return option
-            self._add_option(pool_option)
-
-            # 7) lock capital
-            if long_short == 'long':
-                # pool has to lock in capital since the pool is underwriting (user is long)
-                if type_ == 'call':
-                    self.call_pool_size -= quantity
-                else:
-                    self.put_pool_size -= quantity * strike_price
-
-            return user_option
+        # 4) pay/receive premia, if user goes long, pool receives fee, otherwise pays it
+        self._pay_receive_premia(type_, premia_after_fee if long else -premia_after_fee)
+        if timer is not None:
+            start = timer.lap('trade.update_volatility', start)
+
+        # 5) net against the pool's options of the user's side or issue new option to the pool
+        matched_strike_price = book.trade(strike_key, long, strike_price, locked_capital, quantity)
+        if matched_strike_price is not None:
+            # 6) unlock capital of the pool's short options
+            if not long:
+                self._pay_receive_premia(type_, locked_capital)
+            if timer is not None:
+                start = timer.lap('trade.match_options', start)
+        else:
+            # 6) lock capital since the pool is underwriting (user is long)
+            if long:
+                self._pay_receive_premia(type_, -locked_capital)
+            if timer is not None:
+                start = timer.lap('trade.issue_option', start)
+
+        self._record_trade(strike_price, type_, long_short, quantity, premia_after_fee, volatility_before)
+        if timer is not None:
+            timer.lap('trade.record', start)
+        return premia_after_fee, matched_strike_price
+
+    def _record_trade(
+            self,
+            strike_price: float,
+            type_: str,
+            long_short: str,
+            quantity: float,
+            premia_after_fee: float,
+            volatility_before: float
+    ) -> None:
+        if self.journal is None:
+            return
+        self.journal.record(
+            epoch=self.epoch,
+            strike_price=strike_price,
+            type_=type_,
+            long_short=long_short,
+            quantity=quantity,
+            premia=premia_after_fee,
+            volatility_before=volatility_before,
+            volatility_after=self.call_volatility if type_ == 'call' else self.put_volatility,
+            pool_size_after=self.call_pool_size if type_ == 'call' else self.put_pool_size,
+        )
 
     def clear(self) -> None:
         """Executes all options with current self.current_underlying_price."""
         if not math.isclose(self.time_till_maturity, 0., rel_tol=0.00001):
             raise ValueError
-        for call_option in list(self.call_issued_options):
-            # call's locked capital in base (ETH)
-            # call pool is in base (ETH)
-            if call_option.long_short == 'long':
-                if self.current_underlying_price > call_option.strike_price:
-                    # if in the money, pool gets profit
-                    profit = (self.current_underlying_price - call_option.strike_price) / self.current_underlying_price
-                    self.call_pool_size += call_option.quantity * profit
-                else:
-                    # if out of money, pool gets nothing
-                    self.call_pool_size += 0
-            else:
-                if self.current_underlying_price > call_option.strike_price:
-                    # if in the money, pool gets only part of the locked capital
-                    loss = (self.current_underlying_price - call_option.strike_price) / self.current_underlying_price
-                    self.call_pool_size += call_option.locked_capital - call_option.quantity * loss
-                else:
-                    # if out of money
-                    self.call_pool_size += call_option.locked_capital
-            self._remove_option(call_option)
-
-        for put_option in list(self.put_issued_options):
-            # put's locked capital in quote (USDC)
-            # put pool is in quote (USDC)
-            if put_option.long_short == 'long':
-                if self.current_underlying_price < put_option.strike_price:
-                    # if in the money, pool gets profit
-                    profit = (put_option.strike_price - self.current_underlying_price)
-                    self.put_pool_size += put_option.quantity * profit
-                else:
-                    # if out of moeny, pool gets nothing
-                    self.put_pool_size += 0
-            else:
-                if self.current_underlying_price < put_option.strike_price:
-                    # if in the money, pool gets only part of the locked capital
-                    loss = (put_option.strike_price - self.current_underlying_price)
-                    self.put_pool_size += put_option.locked_capital - put_option.quantity * loss
-                else:
-                    # if out of money
-                    self.put_pool_size += put_option.locked_capital
-            self._remove_option(put_option)
-
-    def __dict__(self) -> Dict[str, Any]:
+        # call's locked capital and call pool are in base (ETH), put's locked capital and put pool in quote (USDC)
+        # long options in the money bring the pool profit, short options return the locked capital less the loss
+        self.call_pool_size += self._call_book.payoff(self.current_underlying_price)
+        self.put_pool_size += self._put_book.payoff(self.current_underlying_price)
+        self._call_book.clear()
+        self._put_book.clear()
+
+    def fork(self) -> 'AMM':
+        """
+        Independent copy of the pool to branch the simulation.
+
+        Position books are forked copy-on-write, so forking does not depend on the number of positions.
+        The fork starts with an empty quote cache and without a journal.
+        """
+        # strike indexes are immutable and shared
+        forked = copy.copy(self)
+        forked._call_book = self._call_book.fork()
+        forked._put_book = self._put_book.fork()
+        forked.clear_quote_cache()
+        forked.quote_cache_hits = 0
+        forked.quote_cache_misses = 0
+        forked.journal = None
+        if self.exposure_series is not None:
+            forked.exposure_series = self.exposure_series.copy()
+        if self.nav_series is not None:
+            forked.nav_series = self.nav_series.copy()
+        return forked
+
+    def snapshot(self) -> AMMSnapshot:
+        call_positions, call_buckets = self._call_book.snapshot()
+        put_positions, put_buckets = self._put_book.snapshot()
+        return AMMSnapshot(
+            call_strikes=self.call_strikes,
+            put_strikes=self.put_strikes,
+            call_volatility=float(self.call_volatility),
+            put_volatility=float(self.put_volatility),
+            call_pool_size=float(self.call_pool_size),
+            put_pool_size=float(self.put_pool_size),
+            time_till_maturity=float(self.time_till_maturity),
+            current_underlying_price=float(self.current_underlying_price),
+            epoch=self.epoch,
+            call_positions=call_positions,
+            call_buckets=call_buckets,
+            put_positions=put_positions,
+            put_buckets=put_buckets,
+            fee_size=float(self.FEE_SIZE),
+            alpha=float(self.ALPHA),
+        )
+
+    def restore(self, snapshot: AMMSnapshot) -> None:
+        """Resets the pool to the snapshot, the journal (if any) is kept."""
+        self.call_strikes = snapshot.call_strikes
+        self.put_strikes = snapshot.put_strikes
+        self.call_volatility = snapshot.call_volatility
+        self.put_volatility = snapshot.put_volatility
+        self.call_pool_size = snapshot.call_pool_size
+        self.put_pool_size = snapshot.put_pool_size
+        self.time_till_maturity = snapshot.time_till_maturity
+        self.current_underlying_price = snapshot.current_underlying_price
+        self.epoch = snapshot.epoch
+        self.FEE_SIZE = snapshot.fee_size
+        self.ALPHA = snapshot.alpha
+        self._call_book = PositionBook.from_snapshot('call', snapshot.call_positions, snapshot.call_buckets)
+        self._put_book = PositionBook.from_snapshot('put', snapshot.put_positions, snapshot.put_buckets)
+        self.clear_quote_cache()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: AMMSnapshot, journal: Optional[TradeJournal] = None) -> 'AMM':
+        amm = cls(snapshot.time_till_maturity, snapshot.current_underlying_price, journal=journal)
+        amm.restore(snapshot)
+        return amm
+
+    def to_dict(self) -> Dict[str, Any]:
         return {
-            'call_strikes': self.call_strikes,
-            'put_strikes': self.put_strikes,
+            'call_strikes': self.call_strikes.tolist(),
+            'put_strikes': self.put_strikes.tolist(),
             'call_volatility': self.call_volatility,
             'put_volatility': self.put_volatility,
             'call_pool_size': self.call_pool_size,
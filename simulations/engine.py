@@ -0,0 +1,382 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from simulations.amm import AMM, NotEnoughPoolCapitalError, TRADE_EXECUTED
+from simulations.timing import StageTimer
+
+
+# Exceptions passed to clients of the localhost endpoint (by name)
+ENDPOINT_ERRORS = {
+    error.__name__: error for error in (NotEnoughPoolCapitalError, ValueError, KeyError, TypeError, RuntimeError)
+}
+
+
+@dataclass(frozen=True)
+class _Request:
+    kind: str
+    strike_price: float
+    type_: str
+    long_short: str
+    quantity: float
+    future: asyncio.Future
+
+
+class _Market:
+    """Queue, worker and statistics of one AMM hosted by a MarketEngine."""
+
+    def __init__(self, amm: AMM) -> None:
+        self.amm = amm
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        # latency of quotes and trades (from submission to result) and execution time of batches
+        self.timer = StageTimer()
+        self.batch_sizes: List[int] = []
+        self.rejected = 0
+
+
+@dataclass(frozen=True)
+class ClientResult:
+    """Requests of one simulated_client."""
+    quotes: int
+    trades: int
+    # trades the pool did not have enough capital for
+    rejected: int
+
+
+class MarketEngine:
+    """
+    Asyncio stand-in for the on-chain pools: many AMMs (markets) behind a quote/trade interface.
+
+    Requests of a market are executed one after another in the order they were submitted by a single
+    worker task per market, so concurrent clients of a market see the same serialized state changes as
+    transactions in a block, while different markets do not wait for each other. The worker takes all
+    requests waiting in the queue (at most max_batch_size) at once and executes consecutive trades with
+    AMM.trade_batch. Markets are traded in-process (quote, trade) or over a localhost JSON-lines endpoint
+    (serve, EngineConnection).
+
+        async with MarketEngine({'eth': AMM(...), 'btc': AMM(...)}) as engine:
+            premia = await engine.trade('eth', 1.2, 'call', 'long')
+        engine.report()
+    """
+
+    def __init__(self, markets: Dict[str, AMM], max_batch_size: int = 64) -> None:
+        if max_batch_size < 1:
+            raise ValueError
+        self.markets = markets
+        self.max_batch_size = max_batch_size
+        self._markets = {name: _Market(amm) for name, amm in markets.items()}
+        self._started: Optional[int] = None
+        self._stopped: Optional[int] = None
+
+    async def start(self) -> None:
+        if self._started is not None and self._stopped is None:
+            raise RuntimeError('engine is already running')
+        for market in self._markets.values():
+            market.queue = asyncio.Queue()
+            market.worker = asyncio.create_task(self._run_market(market))
+        self._started = time.perf_counter_ns()
+        self._stopped = None
+
+    async def stop(self) -> None:
+        """Executes the requests already submitted and stops the workers."""
+        if self._started is None or self._stopped is not None:
+            return
+        for market in self._markets.values():
+            await market.queue.join()
+            market.worker.cancel()
+        await asyncio.gather(*(market.worker for market in self._markets.values()), return_exceptions=True)
+        for market in self._markets.values():
+            market.queue = market.worker = None
+        self._stopped = time.perf_counter_ns()
+
+    async def __aenter__(self) -> 'MarketEngine':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    async def quote(
+            self, market: str, strike_price: float, type_: str, long_short: str, quantity: float = 1.
+    ) -> float:
+        """AMM.get_premia of the market after all requests submitted before."""
+        return await self._submit('quote', market, strike_price, type_, long_short, quantity)
+
+    async def trade(
+            self, market: str, strike_price: float, type_: str, long_short: str, quantity: float = 1.
+    ) -> float:
+        """
+        Executes the trade on the market, returns the premia (after fee) paid for going long
+        or received for going short. Raises NotEnoughPoolCapitalError when the trade was rejected.
+        """
+        return await self._submit('trade', market, strike_price, type_, long_short, quantity)
+
+    async def _submit(
+            self, kind: str, market_name: str, strike_price: float, type_: str, long_short: str, quantity: float
+    ) -> float:
+        market = self._markets[market_name]
+        if market.queue is None:
+            raise RuntimeError('engine is not running')
+        # invalid requests are rejected here, so they can not fail a whole batch
+        if type_ not in {'call', 'put'}:
+            raise ValueError
+        if long_short not in {'long', 'short'}:
+            raise ValueError
+        if not market.amm.is_listed(strike_price, type_):
+            raise ValueError
+
+        start = market.timer.now()
+        future = asyncio.get_running_loop().create_future()
+        market.queue.put_nowait(_Request(kind, strike_price, type_, long_short, quantity, future))
+        try:
+            return await future
+        finally:
+            market.timer.lap(kind, start)
+
+    async def _run_market(self, market: _Market) -> None:
+        queue = market.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            start = market.timer.now()
+            try:
+                self._execute_batch(market, batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            market.timer.lap('batch', start)
+            market.batch_sizes.append(len(batch))
+            for _ in batch:
+                queue.task_done()
+            # lets the clients served by this batch submit their next requests before the next batch is taken
+            await asyncio.sleep(0)
+
+    @staticmethod
+    def _execute_batch(market: _Market, batch: List[_Request]) -> None:
+        amm = market.amm
+        i = 0
+        while i < len(batch):
+            request = batch[i]
+            if request.kind == 'quote':
+                premia = amm.get_premia(request.strike_price, request.type_, request.long_short, request.quantity)
+                if not request.future.done():
+                    request.future.set_result(premia)
+                i += 1
+                continue
+
+            # consecutive trades are executed together
+            end = i
+            while end < len(batch) and batch[end].kind == 'trade':
+                end += 1
+            trades = batch[i:end]
+            result = amm.trade_batch(
+                [trade.strike_price for trade in trades],
+                [trade.type_ == 'call' for trade in trades],
+                [trade.long_short == 'long' for trade in trades],
+                [trade.quantity for trade in trades],
+            )
+            for trade, premia, status in zip(trades, result.premia.tolist(), result.status.tolist()):
+                if status != TRADE_EXECUTED:
+                    market.rejected += 1
+                # trades of cancelled clients are still executed, as a sent transaction would be
+                if trade.future.done():
+                    continue
+                if status == TRADE_EXECUTED:
+                    trade.future.set_result(premia)
+                else:
+                    trade.future.set_exception(NotEnoughPoolCapitalError())
+            i = end
+
+    def latency_histogram(
+            self, market: str, kind: str, bins: Union[int, Sequence[float]] = 20
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Counts and bin edges (in microseconds) of the latencies of quotes or trades (kind) of the market.
+        Integer bins are spaced logarithmically between the fastest and the slowest request.
+        """
+        latency_us = self._markets[market].timer.durations(kind) / 1_000
+        if isinstance(bins, int):
+            bins = np.geomspace(max(latency_us.min(), 1e-3), max(latency_us.max(), 1e-3) * (1 + 1e-9), bins + 1)
+        return np.histogram(latency_us, bins=bins)
+
+    def report(self) -> pd.DataFrame:
+        """
+        Requests, batching, throughput (requests per second of the engine's run time) and latency
+        percentiles per market, latencies in microseconds.
+        """
+        if self._started is None:
+            raise RuntimeError('engine was not started')
+        stopped = time.perf_counter_ns() if self._stopped is None else self._stopped
+        elapsed_s = (stopped - self._started) / 1e9
+        rows = {}
+        for name, market in self._markets.items():
+            summary = market.timer.summary()
+            counts = {kind: summary[kind]['count'] if kind in summary else 0 for kind in ('quote', 'trade')}
+            row = {
+                'quotes': counts['quote'],
+                'trades': counts['trade'],
+                'rejected': market.rejected,
+                'batches': len(market.batch_sizes),
+                'mean_batch_size': float(np.mean(market.batch_sizes)) if market.batch_sizes else np.nan,
+                'throughput_per_s': (counts['quote'] + counts['trade']) / elapsed_s,
+            }
+            for kind in ('quote', 'trade'):
+                for percentile in ('p50', 'p90', 'p99'):
+                    row[f'{kind}_{percentile}_us'] = summary[kind][f'{percentile}_us'] if kind in summary else np.nan
+            rows[name] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 0) -> asyncio.AbstractServer:
+        """
+        Starts the localhost endpoint, every line is a JSON request
+
+            {"op": "quote" | "trade", "market": ..., "strike_price": ..., "type_": ..., "long_short": ...,
+             "quantity": ...}
+
+        answered by a line {"premia": ...} or {"error": name of the exception} (see ENDPOINT_ERRORS).
+        With port 0 a free port is chosen, see server.sockets[0].getsockname().
+        """
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    submit = {'quote': self.quote, 'trade': self.trade}[request['op']]
+                    premia = await submit(
+                        request['market'],
+                        float(request['strike_price']),
+                        request['type_'],
+                        request['long_short'],
+                        float(request.get('quantity', 1.)),
+                    )
+                    response = {'premia': premia}
+                except tuple(ENDPOINT_ERRORS.values()) as e:
+                    # malformed requests (e.g. null fields or not an object) and requests to a stopped engine
+                    # are answered too, so that the connection stays usable
+                    response = {'error': next(name for name, error in ENDPOINT_ERRORS.items() if isinstance(e, error))}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class EngineConnection:
+    """Client of MarketEngine.serve with the same quote and trade coroutines as the engine."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader = reader
+        self._writer = writer
+        # requests of one connection are sent one at a time
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> 'EngineConnection':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def quote(
+            self, market: str, strike_price: float, type_: str, long_short: str, quantity: float = 1.
+    ) -> float:
+        return await self._request('quote', market, strike_price, type_, long_short, quantity)
+
+    async def trade(
+            self, market: str, strike_price: float, type_: str, long_short: str, quantity: float = 1.
+    ) -> float:
+        return await self._request('trade', market, strike_price, type_, long_short, quantity)
+
+    async def _request(
+            self, op: str, market: str, strike_price: float, type_: str, long_short: str, quantity: float
+    ) -> float:
+        request = {
+            'op': op,
+            'market': market,
+            'strike_price': strike_price,
+            'type_': type_,
+            'long_short': long_short,
+            'quantity': quantity,
+        }
+        async with self._lock:
+            self._writer.write(json.dumps(request).encode() + b'\n')
+            await self._writer.drain()
+            line = await self._reader.readline()
+        if not line:
+            raise ConnectionError
+        response = json.loads(line)
+        if 'error' in response:
+            raise ENDPOINT_ERRORS[response['error']]()
+        return response['premia']
+
+
+async def simulated_client(
+        client: Union[MarketEngine, EngineConnection],
+        market: str,
+        call_strikes: Sequence[float],
+        put_strikes: Sequence[float],
+        n_requests: int,
+        seed: Union[None, int, np.random.SeedSequence] = None,
+        quote_probability: float = 0.5,
+) -> ClientResult:
+    """
+    Trades n_requests random options (type, listed strike and side drawn uniformly, quantity 1) on the market,
+    with probability quote_probability a trade is preceded by a quote of the same option.
+    """
+    rng = np.random.default_rng(seed)
+    quotes = trades = rejected = 0
+    for _ in range(n_requests):
+        type_ = 'call' if rng.random() < 0.5 else 'put'
+        strikes = call_strikes if type_ == 'call' else put_strikes
+        strike_price = float(strikes[rng.integers(len(strikes))])
+        long_short = 'long' if rng.random() < 0.5 else 'short'
+        if rng.random() < quote_probability:
+            await client.quote(market, strike_price, type_, long_short)
+            quotes += 1
+        try:
+            await client.trade(market, strike_price, type_, long_short)
+            trades += 1
+        except NotEnoughPoolCapitalError:
+            rejected += 1
+    return ClientResult(quotes=quotes, trades=trades, rejected=rejected)
+
+
+async def run_clients(
+        engine: MarketEngine,
+        n_clients: int,
+        n_requests: int,
+        seed: Union[None, int, np.random.SeedSequence] = None,
+        quote_probability: float = 0.5,
+) -> List[ClientResult]:
+    """
+    Runs n_clients concurrent simulated_clients on the (running) engine, client i trades on the i-th market
+    (modulo the number of markets). Clients get independent seeds spawned from seed.
+    """
+    names = list(engine.markets)
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_clients)
+    return await asyncio.gather(*(
+        simulated_client(
+            engine,
+            names[i % len(names)],
+            engine.markets[names[i % len(names)]].call_strikes,
+            engine.markets[names[i % len(names)]].put_strikes,
+            n_requests,
+            seed_sequences[i],
+            quote_probability,
+        )
+        for i in range(n_clients)
+    ))
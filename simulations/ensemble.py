@@ -0,0 +1,290 @@
+from typing import Dict, List, Optional, Tuple, Union
+import math
+
+import numpy as np
+
+from simulations.amm import AMM, ArrayLike, get_new_volatility, quote_premia
+
+
+# Indexes of the side axis of the position arrays, the side is the pool's side
+POOL_LONG = 0
+POOL_SHORT = 1
+
+TYPES = ('call', 'put')
+LONG_SHORTS = ('long', 'short')
+
+
+class EnsembleAMM:
+    """
+    N independent AMM pools simulated in lockstep.
+
+    The state of every pool (volatilities, pool sizes, underlying price and issued options) is kept
+    in arrays with the pool as the first axis, and all operations act on all pools at once.
+    Pools share the listed strikes and the time till maturity, each pool has its own underlying price.
+
+    Issued options are kept aggregated per strike and side (quantity, locked capital and number of options
+    of the pool), which is all the trading and settlement of AMM depends on, so every pool evolves the same
+    as AMM would when given the same trades.
+    """
+
+    FEE_SIZE = AMM.FEE_SIZE
+    ALPHA = AMM.ALPHA
+    RISK_FREE_RATE = AMM.RISK_FREE_RATE
+
+    def __init__(
+            self,
+            n_pools: int,
+            time_till_maturity: float,
+            current_underlying_price: ArrayLike,
+            call_strikes: Optional[List[float]] = None,
+            put_strikes: Optional[List[float]] = None,
+            call_volatility: ArrayLike = 0.1,
+            put_volatility: ArrayLike = 0.1,
+            call_pool_size: ArrayLike = 100,
+            put_pool_size: ArrayLike = 100,
+    ) -> None:
+        if call_strikes is None:
+            call_strikes = [x / 10 for x in range(9, 20)]
+        if put_strikes is None:
+            put_strikes = [x / 10 for x in range(2, 12)]
+        self.n_pools = n_pools
+        self.strikes = {
+            'call': np.array(call_strikes, dtype=float),
+            'put': np.array(put_strikes, dtype=float),
+        }
+
+        self.volatility = {
+            'call': self._pool_array(call_volatility),
+            'put': self._pool_array(put_volatility),
+        }
+        self.pool_size = {
+            'call': self._pool_array(call_pool_size),
+            'put': self._pool_array(put_pool_size),
+        }
+
+        # [pool, strike, side of the pool]
+        self.position_quantity = {
+            type_: np.zeros((n_pools, len(self.strikes[type_]), 2)) for type_ in TYPES
+        }
+        self.position_locked_capital = {
+            type_: np.zeros((n_pools, len(self.strikes[type_]), 2)) for type_ in TYPES
+        }
+        self.position_count = {
+            type_: np.zeros((n_pools, len(self.strikes[type_]), 2), dtype=np.int64) for type_ in TYPES
+        }
+
+        self.time_till_maturity = time_till_maturity
+        self.current_underlying_price = self._pool_array(current_underlying_price)
+
+    def _pool_array(self, value: ArrayLike) -> np.ndarray:
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (self.n_pools,)))
+
+    def next_epoch(self, time_till_maturity: float, current_underlying_price: ArrayLike) -> None:
+        current_underlying_price = self._pool_array(current_underlying_price)
+        if time_till_maturity < 0.:
+            raise ValueError
+        if (current_underlying_price <= 0.).any():
+            raise ValueError
+        self.time_till_maturity = time_till_maturity
+        self.current_underlying_price = current_underlying_price
+
+    def _get_new_volatility(
+            self,
+            type_: str,
+            long_short: str,
+            quantity: ArrayLike,
+            pools: Union[slice, np.ndarray] = slice(None)
+    ) -> np.ndarray:
+        return get_new_volatility(
+            self.volatility[type_][pools],
+            self.pool_size[type_][pools],
+            type_,
+            long_short,
+            quantity,
+            self.current_underlying_price[pools],
+            self.ALPHA
+        )
+
+    def get_premia(
+            self,
+            strike_index: ArrayLike,
+            type_: str,
+            long_short: str,
+            quantity: ArrayLike = 1.,
+            pools: Union[slice, np.ndarray] = slice(None)
+    ) -> np.ndarray:
+        """Premia of given pools for the listed strike with given index, see AMM.get_premia."""
+        return quote_premia(
+            self.strikes[type_][strike_index],
+            type_,
+            long_short,
+            quantity,
+            volatility=self.volatility[type_][pools],
+            pool_size=self.pool_size[type_][pools],
+            underlying_price=self.current_underlying_price[pools],
+            time_till_maturity=self.time_till_maturity,
+            fee_size=self.FEE_SIZE,
+            alpha=self.ALPHA,
+            risk_free_rate=self.RISK_FREE_RATE,
+        )
+
+    def get_premia_surface(self, quantity: float = 1.) -> Dict[Tuple[str, str], np.ndarray]:
+        """Premia of all pools for all strikes, keyed by (type_, long_short), values of shape (n_pools, n_strikes)."""
+        surface = {}
+        for type_ in TYPES:
+            for long_short in LONG_SHORTS:
+                surface[(type_, long_short)] = quote_premia(
+                    self.strikes[type_][np.newaxis, :],
+                    type_,
+                    long_short,
+                    quantity,
+                    volatility=self.volatility[type_][:, np.newaxis],
+                    pool_size=self.pool_size[type_][:, np.newaxis],
+                    underlying_price=self.current_underlying_price[:, np.newaxis],
+                    time_till_maturity=self.time_till_maturity,
+                    fee_size=self.FEE_SIZE,
+                    alpha=self.ALPHA,
+                    risk_free_rate=self.RISK_FREE_RATE,
+                )
+        return surface
+
+    def trade(
+            self,
+            mask: np.ndarray,
+            strike_index: np.ndarray,
+            is_call: np.ndarray,
+            is_long: np.ndarray,
+            quantity: ArrayLike = 1.,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every pool with mask set trades one option, arguments are arrays of length n_pools
+        and describe WHAT THE USER WANTS TO DO, see AMM.trade.
+
+        Returns (executed, premia_after_fee). Trades of pools without enough capital are not executed
+        (AMM.trade raises NotEnoughPoolCapitalError in that case), premia of not executed trades are nan.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        strike_index = np.asarray(strike_index)
+        is_call = np.asarray(is_call, dtype=bool)
+        is_long = np.asarray(is_long, dtype=bool)
+        quantity = self._pool_array(quantity)
+
+        executed = np.zeros(self.n_pools, dtype=bool)
+        premia_after_fee = np.full(self.n_pools, np.nan)
+        for type_ in TYPES:
+            for long_short in LONG_SHORTS:
+                pools = np.flatnonzero(
+                    mask & (is_call == (type_ == 'call')) & (is_long == (long_short == 'long'))
+                )
+                if pools.size:
+                    executed[pools], premia_after_fee[pools] = self._trade(
+                        pools, strike_index[pools], type_, long_short, quantity[pools]
+                    )
+        premia_after_fee[~executed] = np.nan
+        return executed, premia_after_fee
+
+    def _trade(
+            self,
+            pools: np.ndarray,
+            strike_index: np.ndarray,
+            type_: str,
+            long_short: str,
+            quantity: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        strike_price = self.strikes[type_][strike_index]
+        pool_size = self.pool_size[type_]
+        # quantity of the pool's token the trade locks/unlocks
+        locked_quantity = quantity if type_ == 'call' else quantity * strike_price
+
+        # 1) get premia (for quantity 1, as AMM.trade does)
+        premia_after_fee = self.get_premia(strike_index, type_, long_short, pools=pools)
+
+        # 2) check enough capital in pool
+        if long_short == 'short':
+            has_capital = premia_after_fee <= pool_size[pools]
+        else:
+            has_capital = locked_quantity <= pool_size[pools]
+        executed = has_capital
+        pools, strike_index, quantity = pools[has_capital], strike_index[has_capital], quantity[has_capital]
+        locked_quantity = locked_quantity[has_capital]
+        signed_premia_after_fee = premia_after_fee[has_capital] * (1 if long_short == 'long' else -1)
+
+        # 3) adjust volatility
+        self.volatility[type_][pools] = self._get_new_volatility(type_, long_short, quantity, pools)
+
+        # 4) pay/receive premia
+        pool_size[pools] += signed_premia_after_fee
+
+        # 5) net against the pool's options of the user's side, or issue new option to the pool
+        user_side = POOL_LONG if long_short == 'long' else POOL_SHORT
+        pool_side = POOL_SHORT if long_short == 'long' else POOL_LONG
+        position_quantity = self.position_quantity[type_]
+        position_locked_capital = self.position_locked_capital[type_]
+        position_count = self.position_count[type_]
+
+        all_quantity = position_quantity[pools, strike_index, user_side]
+        matched = (position_count[pools, strike_index, user_side] > 0) & (all_quantity >= quantity)
+
+        matched_pools, matched_strikes = pools[matched], strike_index[matched]
+        remaining_quantity = all_quantity[matched] - quantity[matched]
+        if long_short == 'long':
+            remaining_locked_capital = np.zeros(len(matched_pools))
+        else:
+            remaining_locked_capital = (
+                position_locked_capital[matched_pools, matched_strikes, user_side] - locked_quantity[matched]
+            )
+            # unlock capital
+            pool_size[matched_pools] += locked_quantity[matched]
+        has_remaining = remaining_quantity > 0
+        position_quantity[matched_pools, matched_strikes, user_side] = np.where(has_remaining, remaining_quantity, 0.)
+        position_locked_capital[matched_pools, matched_strikes, user_side] = np.where(
+            has_remaining, remaining_locked_capital, 0.
+        )
+        position_count[matched_pools, matched_strikes, user_side] = has_remaining
+
+        issued_pools, issued_strikes = pools[~matched], strike_index[~matched]
+        position_quantity[issued_pools, issued_strikes, pool_side] += quantity[~matched]
+        position_count[issued_pools, issued_strikes, pool_side] += 1
+        if long_short == 'long':
+            # pool is underwriting and has to lock capital
+            position_locked_capital[issued_pools, issued_strikes, pool_side] += locked_quantity[~matched]
+            pool_size[issued_pools] -= locked_quantity[~matched]
+
+        return executed, premia_after_fee
+
+    def clear(self) -> None:
+        """Executes all options of all pools with their current underlying price, see AMM.clear."""
+        if not math.isclose(self.time_till_maturity, 0., rel_tol=0.00001):
+            raise ValueError
+        price = self.current_underlying_price[:, np.newaxis]
+        for type_ in TYPES:
+            if type_ == 'call':
+                intrinsic_value = np.maximum(price - self.strikes[type_], 0.) / price
+            else:
+                intrinsic_value = np.maximum(self.strikes[type_] - price, 0.)
+            quantity = self.position_quantity[type_]
+            locked_capital = self.position_locked_capital[type_]
+            payoff = (
+                quantity[:, :, POOL_LONG] * intrinsic_value
+                + locked_capital[:, :, POOL_SHORT] - quantity[:, :, POOL_SHORT] * intrinsic_value
+            )
+            self.pool_size[type_] += payoff.sum(axis=1)
+            quantity[:] = 0.
+            locked_capital[:] = 0.
+            self.position_count[type_][:] = 0
+
+    @property
+    def call_volatility(self) -> np.ndarray:
+        return self.volatility['call']
+
+    @property
+    def put_volatility(self) -> np.ndarray:
+        return self.volatility['put']
+
+    @property
+    def call_pool_size(self) -> np.ndarray:
+        return self.pool_size['call']
+
+    @property
+    def put_pool_size(self) -> np.ndarray:
+        return self.pool_size['put']
@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from simulations.amm import ArrayLike, black_scholes
+
+
+@dataclass(frozen=True)
+class ImpliedVolatility:
+    # nan where the premia is outside of the no-arbitrage bounds
+    volatility: np.ndarray
+    # number of black_scholes evaluations per element
+    iterations: np.ndarray
+    converged: np.ndarray
+
+
+def implied_volatility(
+        premia: ArrayLike,
+        type_: str,
+        s: ArrayLike,
+        k: ArrayLike,
+        r: ArrayLike,
+        t: ArrayLike,
+        tol: float = 1e-12,
+        max_iterations: int = 100,
+        lower: float = 1e-6,
+        upper: float = 10.,
+) -> ImpliedVolatility:
+    """
+    Volatilities for which black_scholes gives premia, all arguments broadcast against each other.
+
+    Premia are in the AMM's conventions, call premia in base token (black_scholes call premia divided by s)
+    and put premia in quote token, t is in the same units as AMM.time_till_maturity.
+    Every element is solved by Halley's method safeguarded by a bracket [lower, upper] that shrinks with every
+    evaluation, steps leaving the bracket or not halving the previous step are replaced by bisection.
+    Elements are solved at once and dropped from the batch when converged, i.e. premia are within tol * s
+    of the target or the bracket is narrower than tol.
+    """
+    if type_ not in {'call', 'put'}:
+        raise ValueError
+    premia, s, k, r, t = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (premia, s, k, r, t)))
+    shape = premia.shape
+    premia, s, k, r, t = (x.ravel() for x in (premia, s, k, r, t))
+
+    discounted_k = k * np.exp(-r * t)
+    if type_ == 'call':
+        target = premia * s
+        lower_bound, upper_bound = np.maximum(s - discounted_k, 0.), s
+    else:
+        target = premia
+        lower_bound, upper_bound = np.maximum(discounted_k - s, 0.), discounted_k
+
+    volatility = np.full(premia.shape, np.nan)
+    iterations = np.zeros(premia.shape, dtype=np.int64)
+    converged = np.zeros(premia.shape, dtype=bool)
+    active = np.flatnonzero((target > lower_bound) & (target < upper_bound) & (t > 0.))
+
+    # Brenner-Subrahmanyam approximation (exact at the money for small volatility) as the starting point
+    volatility[active] = np.clip(
+        np.sqrt(2 * np.pi / t[active]) * target[active] / s[active], 2 * lower, upper / 2
+    )
+    low = np.full(premia.shape, lower)
+    high = np.full(premia.shape, upper)
+    previous_step = np.full(premia.shape, upper - lower)
+
+    for _ in range(max_iterations):
+        if not active.size:
+            break
+        vol, s_, k_, r_, t_ = volatility[active], s[active], k[active], r[active], t[active]
+        call_premia, put_premia = black_scholes(vol, s_, k_, r_, t_)
+        diff = (call_premia if type_ == 'call' else put_premia) - target[active]
+        iterations[active] += 1
+
+        # premia increase with volatility
+        low_ = np.where(diff < 0., vol, low[active])
+        high_ = np.where(diff > 0., vol, high[active])
+        done = (np.abs(diff) <= tol * s_) | (high_ - low_ <= tol)
+
+        sqrt_t = np.sqrt(t_)
+        d_1 = (np.log(s_ / k_) + (r_ + vol ** 2 / 2) * t_) / (vol * sqrt_t)
+        d_2 = d_1 - vol * sqrt_t
+        vega = s_ * np.exp(-d_1 ** 2 / 2) / np.sqrt(2 * np.pi) * sqrt_t
+        volga = vega * d_1 * d_2 / vol
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton_step = diff / vega
+            new_vol = vol - newton_step / (1 - newton_step * volga / (2 * vega))
+        bisect = (
+            ~np.isfinite(new_vol) | (new_vol <= low_) | (new_vol >= high_)
+            | (np.abs(new_vol - vol) > previous_step[active] / 2)
+        )
+        new_vol = np.where(bisect, (low_ + high_) / 2, new_vol)
+
+        converged[active[done]] = True
+        previous_step[active] = np.abs(new_vol - vol)
+        volatility[active] = np.where(done, vol, new_vol)
+        low[active], high[active] = low_, high_
+        active = active[~done]
+
+    return ImpliedVolatility(
+        volatility=volatility.reshape(shape),
+        iterations=iterations.reshape(shape),
+        converged=converged.reshape(shape),
+    )
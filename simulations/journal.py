@@ -0,0 +1,141 @@
+from typing import Dict, List, Optional
+import os
+
+import numpy as np
+
+
+# Columns of the journal, type_ and long_short (of the user) are stored as codes
+TRADE_COLUMNS = {
+    'epoch': np.dtype(np.int64),
+    'strike_price': np.dtype(np.float64),
+    'type_': np.dtype(np.int8),
+    'long_short': np.dtype(np.int8),
+    'quantity': np.dtype(np.float64),
+    'premia': np.dtype(np.float64),
+    'volatility_before': np.dtype(np.float64),
+    'volatility_after': np.dtype(np.float64),
+    'pool_size_after': np.dtype(np.float64),
+}
+TYPE_CODES = {'call': 0, 'put': 1}
+LONG_SHORT_CODES = {'long': 0, 'short': 1}
+
+# .npy header is written with a fixed length (aligned to 64 bytes with the magic string and the length field),
+# so that it can be rewritten in place when rows are appended
+_NPY_HEADER_LEN = 120
+
+
+def _write_npy_header(f, dtype: np.dtype, length: int) -> None:
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (length,)})
+    header = header.ljust(_NPY_HEADER_LEN - 1) + '\n'
+    if len(header) != _NPY_HEADER_LEN:
+        raise ValueError
+    f.seek(0)
+    f.write(np.lib.format.magic(1, 0))
+    f.write(np.uint16(_NPY_HEADER_LEN).tobytes())
+    f.write(header.encode('latin1'))
+
+
+def _append_to_npy(path: str, values: np.ndarray, length_before: int) -> None:
+    """Appends values to the one dimensional .npy file at path holding length_before values."""
+    mode = 'r+b' if os.path.exists(path) else 'w+b'
+    with open(path, mode) as f:
+        if mode == 'w+b':
+            _write_npy_header(f, values.dtype, 0)
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(values).tobytes())
+        _write_npy_header(f, values.dtype, length_before + len(values))
+
+
+class TradeJournal:
+    """
+    Append-only columnar record of trades.
+
+    Trades are written into preallocated column buffers, full buffers are flushed either to one .npy file
+    per column in directory (which can be memory-mapped back with load_journal) or, without directory,
+    to in-memory segments.
+    """
+
+    def __init__(self, directory: Optional[str] = None, buffer_size: int = 65_536) -> None:
+        if buffer_size < 1:
+            raise ValueError
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            if any(os.path.exists(self._path(column)) for column in TRADE_COLUMNS):
+                raise FileExistsError(f'journal already exists in {directory}')
+        self._buffers = {column: np.empty(buffer_size, dtype=dtype) for column, dtype in TRADE_COLUMNS.items()}
+        self._buffered = 0
+        self._flushed = 0
+        self._segments: List[Dict[str, np.ndarray]] = []
+
+    def _path(self, column: str) -> str:
+        return os.path.join(self.directory, f'{column}.npy')
+
+    def record(
+            self,
+            epoch: int,
+            strike_price: float,
+            type_: str,
+            long_short: str,
+            quantity: float,
+            premia: float,
+            volatility_before: float,
+            volatility_after: float,
+            pool_size_after: float,
+    ) -> None:
+        row = self._buffered
+        buffers = self._buffers
+        buffers['epoch'][row] = epoch
+        buffers['strike_price'][row] = strike_price
+        buffers['type_'][row] = TYPE_CODES[type_]
+        buffers['long_short'][row] = LONG_SHORT_CODES[long_short]
+        buffers['quantity'][row] = quantity
+        buffers['premia'][row] = premia
+        buffers['volatility_before'][row] = volatility_before
+        buffers['volatility_after'][row] = volatility_after
+        buffers['pool_size_after'][row] = pool_size_after
+        self._buffered += 1
+        if self._buffered == len(buffers['epoch']):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffered:
+            return
+        if self.directory is None:
+            self._segments.append(
+                {column: buffer[:self._buffered].copy() for column, buffer in self._buffers.items()}
+            )
+        else:
+            for column, buffer in self._buffers.items():
+                _append_to_npy(self._path(column), buffer[:self._buffered], self._flushed)
+        self._flushed += self._buffered
+        self._buffered = 0
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """All recorded trades (flushed or not), file backed columns are memory-mapped."""
+        if self.directory is None:
+            flushed = {
+                column: np.concatenate([segment[column] for segment in self._segments] or [np.empty(0, dtype)])
+                for column, dtype in TRADE_COLUMNS.items()
+            }
+        elif self._flushed:
+            flushed = load_journal(self.directory)
+        else:
+            flushed = {column: np.empty(0, dtype) for column, dtype in TRADE_COLUMNS.items()}
+        if not self._buffered:
+            return flushed
+        return {
+            column: np.concatenate((flushed[column], self._buffers[column][:self._buffered]))
+            for column in TRADE_COLUMNS
+        }
+
+    def __len__(self) -> int:
+        return self._flushed + self._buffered
+
+
+def load_journal(directory: str, mmap_mode: Optional[str] = 'r') -> Dict[str, np.ndarray]:
+    """Columns of a journal flushed to directory, memory-mapped (no copy) by default."""
+    return {
+        column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode=mmap_mode)
+        for column in TRADE_COLUMNS
+    }
@@ -0,0 +1,209 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import random
+
+import numpy as np
+import pandas as pd
+
+from simulations.amm import AMM
+from simulations.path_cache import PathCache
+from simulations.price_time_series import generate_price_volatility_paths
+from simulations.timing import StageTimer
+from simulations.users import RandomUser, TraderUser
+
+
+@dataclass(frozen=True)
+class RoundConfig:
+    """Parameters of one round (one run of the simulation over all epochs) as in liquidity_pool_simulation.ipynb."""
+    epochs: int = 1_000
+    # the first observations are cut to have the series relatively stable
+    burn_in: int = 100
+    alpha: float = 0.3
+    beta: float = 0.1
+    random_user_trade_probability: float = 0.6
+    volatility_adjustments: Tuple[float, ...] = (-0.1, 0., 0.1)
+    # random user's decisions are pre-drawn for the whole round (see RandomUser.iter_schedule)
+    random_user_schedule: bool = False
+    # AMM parameters, None strikes are the AMM's default strikes
+    fee_size: float = AMM.FEE_SIZE
+    amm_alpha: float = AMM.ALPHA
+    call_pool_size: float = 100.
+    put_pool_size: float = 100.
+    call_strikes: Optional[Tuple[float, ...]] = None
+    put_strikes: Optional[Tuple[float, ...]] = None
+
+
+@dataclass(frozen=True)
+class RoundResult:
+    round_index: int
+    final_call_pool_size: float
+    final_put_pool_size: float
+    call_volume: float
+    put_volume: float
+
+
+@contextmanager
+def _seeded_global_random(seed_sequence: np.random.SeedSequence) -> Iterator[None]:
+    """
+    Users draw from the global `random` and `np.random` states, those are seeded for the duration of the round
+    and restored afterwards.
+    """
+    python_state = random.getstate()
+    numpy_state = np.random.get_state()
+    python_seed, numpy_seed = seed_sequence.generate_state(2)
+    random.seed(int(python_seed))
+    np.random.seed(numpy_seed)
+    try:
+        yield
+    finally:
+        random.setstate(python_state)
+        np.random.set_state(numpy_state)
+
+
+def round_seed_sequence(seed: int, round_index: int) -> np.random.SeedSequence:
+    """Seed of given round, it depends only on the experiment's seed and on the index of the round."""
+    return np.random.SeedSequence(seed, spawn_key=(round_index,))
+
+
+def run_round(
+        round_index: int,
+        seed: int,
+        config: RoundConfig = RoundConfig(),
+        path_cache: Optional[PathCache] = None,
+        timer: Optional[StageTimer] = None,
+) -> RoundResult:
+    """
+    Runs one round, price paths are read from (and stored to) path_cache if given.
+
+    If timer is given, the stages of the trades of the AMM and of the users are timed with it.
+    """
+    # the schedule's seed is spawned last, so that the other seeds do not depend on config.random_user_schedule
+    path_seed_sequence, users_seed_sequence, schedule_seed_sequence = round_seed_sequence(seed, round_index).spawn(3)
+    get_paths = generate_price_volatility_paths if path_cache is None else path_cache.get_paths
+    price, volatility = get_paths(
+        n_paths=1,
+        series_len=config.epochs,
+        burn_in=config.burn_in,
+        seed=path_seed_sequence,
+        alpha=config.alpha,
+        beta=config.beta,
+    )
+    price, volatility = price[0], volatility[0]
+
+    with _seeded_global_random(users_seed_sequence):
+        time_till_maturity_start = config.epochs
+        amm = AMM(
+            time_till_maturity=time_till_maturity_start,
+            current_underlying_price=1.,
+            call_strikes=None if config.call_strikes is None else list(config.call_strikes),
+            put_strikes=None if config.put_strikes is None else list(config.put_strikes),
+            call_pool_size=config.call_pool_size,
+            put_pool_size=config.put_pool_size,
+            fee_size=config.fee_size,
+            alpha=config.amm_alpha,
+            timer=timer,
+        )
+        users = [
+            RandomUser(
+                trade_probability=config.random_user_trade_probability,
+                put_strikes=amm.put_strikes,
+                call_strikes=amm.call_strikes,
+                timer=timer
+            )
+        ]
+        if config.random_user_schedule:
+            users[0].use_schedule(users[0].iter_schedule(config.epochs, seed=schedule_seed_sequence))
+        users += [
+            TraderUser(amm=amm, volatility_adjustment=volatility_adjustment, timer=timer)
+            for volatility_adjustment in config.volatility_adjustments
+        ]
+
+        total_volume = {'call': 0., 'put': 0.}
+        for current_price, current_volatility, time_till_maturity in zip(
+                price, volatility, range(time_till_maturity_start, 0, -1)
+        ):
+            amm.next_epoch(time_till_maturity=time_till_maturity, current_underlying_price=current_price)
+
+            # in each epoch the users are randomly ordered
+            np.random.shuffle(users)
+            for user in users:
+                trade = user.trade(current_price, current_volatility)
+                if trade is not None:
+                    amm.trade(
+                        strike_price=trade['strike_price'],
+                        type_=trade['type_'],
+                        long_short=trade['long_short'],
+                        quantity=trade['quantity']
+                    )
+                    total_volume[trade['type_']] += trade['quantity']
+        amm.next_epoch(time_till_maturity=0., current_underlying_price=price[-1])
+        amm.clear()
+
+    return RoundResult(
+        round_index=round_index,
+        final_call_pool_size=amm.call_pool_size,
+        final_put_pool_size=amm.put_pool_size,
+        call_volume=total_volume['call'],
+        put_volume=total_volume['put'],
+    )
+
+
+def iter_rounds(
+        n_rounds: int,
+        seed: int,
+        config: RoundConfig = RoundConfig(),
+        max_workers: Optional[int] = None,
+        chunksize: int = 1,
+        path_cache: Optional[PathCache] = None,
+) -> Iterator[RoundResult]:
+    """
+    Runs rounds 0, ..., n_rounds - 1 across a process pool and yields their results in order of the rounds
+    as soon as they are available.
+
+    Every round is fully determined by seed and its index, so the results do not depend on max_workers
+    or chunksize. max_workers=1 runs the rounds serially in the current process.
+    """
+    rounds = range(n_rounds)
+    if max_workers == 1:
+        yield from map(run_round, rounds, repeat(seed), repeat(config), repeat(path_cache))
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(
+            run_round, rounds, repeat(seed), repeat(config), repeat(path_cache), chunksize=chunksize
+        )
+
+
+def run_rounds(
+        n_rounds: int,
+        seed: int,
+        config: RoundConfig = RoundConfig(),
+        max_workers: Optional[int] = None,
+        chunksize: int = 1,
+        path_cache: Optional[PathCache] = None,
+) -> pd.DataFrame:
+    """Returns one row per round, see iter_rounds."""
+    return results_to_frame(iter_rounds(n_rounds, seed, config, max_workers, chunksize, path_cache))
+
+
+def results_to_frame(results: Iterable[RoundResult]) -> pd.DataFrame:
+    columns = list(RoundResult.__dataclass_fields__)
+    return pd.DataFrame([asdict(result) for result in results], columns=columns)
+
+
+def summarize_rounds(results: pd.DataFrame, epochs: int) -> Dict[str, Dict[str, Any]]:
+    """Statistics of the final pool sizes and volumes as printed in liquidity_pool_simulation.ipynb."""
+    summary = {}
+    for type_ in ('call', 'put'):
+        final_pool_sizes = results[f'final_{type_}_pool_size']
+        summary[type_] = {
+            'mean': np.mean(final_pool_sizes),
+            'min': np.min(final_pool_sizes),
+            '5th percentile': np.percentile(final_pool_sizes, 5),
+            '95th percentile': np.percentile(final_pool_sizes, 95),
+            'max': np.max(final_pool_sizes),
+            'mean total volume (trades) per round per epoch': np.mean(results[f'{type_}_volume']) / epochs,
+        }
+    return summary
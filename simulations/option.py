@@ -1,7 +1,11 @@
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 
 class Option:
+    """Option record, compared by value. Pools keep their options in PositionBook arrays, not as Option objects."""
+
+    __slots__ = ('strike_price', 'type_', 'long_short', 'locked_capital', 'quantity')
+
     def __init__(
             self,
             strike_price: float,
@@ -20,7 +24,19 @@ class Option:
         self.locked_capital = locked_capital
         self.quantity = quantity
 
-    def __dict__(self) -> Dict[str, Any]:
+    def _fields(self) -> Tuple[float, str, str, float, float]:
+        return self.strike_price, self.type_, self.long_short, self.locked_capital, self.quantity
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Option):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        # consistent with __eq__, options used as dict keys or in sets must not be modified
+        return hash(self._fields())
+
+    def to_dict(self) -> Dict[str, Any]:
         return {
             'strike_price': self.strike_price,
             'type_': self.type_,
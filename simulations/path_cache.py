@@ -0,0 +1,180 @@
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from simulations.price_time_series import (
+    SeedLike,
+    generate_price_volatility_paths,
+    iter_price_volatility_paths,
+)
+
+
+# Parameters of the process (alpha, beta, gamma, ...) with their defaults
+_PROCESS_DEFAULTS = {
+    name: parameter.default
+    for name, parameter in inspect.signature(iter_price_volatility_paths).parameters.items()
+    if name not in {'n_paths', 'series_len', 'burn_in', 'seed', 'paths_per_chunk', 'path_offset'}
+}
+
+
+def _seed_description(seed: SeedLike) -> Optional[Dict[str, Any]]:
+    """Seed in a hashable form, None for seeds that do not determine the paths (None or a Generator)."""
+    if isinstance(seed, (int, np.integer)) and not isinstance(seed, bool):
+        seed = np.random.SeedSequence(int(seed))
+    if not isinstance(seed, np.random.SeedSequence):
+        return None
+    entropy = seed.entropy if isinstance(seed.entropy, int) else [int(x) for x in seed.entropy]
+    return {'entropy': entropy, 'spawn_key': [int(x) for x in seed.spawn_key], 'pool_size': seed.pool_size}
+
+
+class PathCache:
+    """
+    Content-addressed cache of generate_price_volatility_paths results on disk.
+
+    Every entry is a directory (named by the hash of the generator parameters and the seed) with price.npy
+    and volatility.npy, which are returned memory-mapped read-only, so processes sharing the directory read
+    the same pages without copying or regenerating. Entries are written to a temporary directory and renamed,
+    so readers never see partially written paths. When the cache grows over max_bytes, least recently used
+    entries (by modification time of the entry, which is updated on every hit) are evicted.
+    Seeds that do not determine the paths (None or a Generator) are not cached.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 ** 30) -> None:
+        if max_bytes < 0:
+            raise ValueError
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(
+            self,
+            n_paths: int,
+            series_len: int,
+            burn_in: int,
+            seed: SeedLike,
+            **process_kwargs: float,
+    ) -> Optional[str]:
+        """Name of the entry of given paths, None if the seed does not determine them."""
+        seed_description = _seed_description(seed)
+        if seed_description is None:
+            return None
+        unknown = set(process_kwargs) - set(_PROCESS_DEFAULTS)
+        if unknown:
+            raise TypeError(f'unknown process parameters {sorted(unknown)}')
+        description = json.dumps(
+            {
+                'n_paths': n_paths,
+                'series_len': series_len,
+                'burn_in': burn_in,
+                'seed': seed_description,
+                'process': {**_PROCESS_DEFAULTS, **{name: float(value) for name, value in process_kwargs.items()}},
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+    def get_paths(
+            self,
+            n_paths: int,
+            series_len: int = 10_000,
+            burn_in: int = 0,
+            seed: SeedLike = None,
+            **process_kwargs: float,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Same as generate_price_volatility_paths, the arrays are read-only memory maps of the cache."""
+        key = self.key(n_paths, series_len, burn_in, seed, **process_kwargs)
+        if key is None:
+            return generate_price_volatility_paths(n_paths, series_len, burn_in, seed, **process_kwargs)
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            self._generate(entry, n_paths, series_len, burn_in, seed, **process_kwargs)
+            self._evict(keep=entry)
+        try:
+            os.utime(entry)
+            return self._load(entry)
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return self.get_paths(n_paths, series_len, burn_in, seed, **process_kwargs)
+
+    @staticmethod
+    def _load(entry: str) -> Tuple[np.ndarray, np.ndarray]:
+        return (
+            np.load(os.path.join(entry, 'price.npy'), mmap_mode='r'),
+            np.load(os.path.join(entry, 'volatility.npy'), mmap_mode='r'),
+        )
+
+    def _generate(
+            self,
+            entry: str,
+            n_paths: int,
+            series_len: int,
+            burn_in: int,
+            seed: SeedLike,
+            **process_kwargs: float,
+    ) -> None:
+        temporary_entry = os.path.join(self.directory, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(temporary_entry)
+        try:
+            # paths are written chunk by chunk, so the whole array is never held in memory
+            price = np.lib.format.open_memmap(
+                os.path.join(temporary_entry, 'price.npy'), mode='w+', shape=(n_paths, series_len)
+            )
+            volatility = np.lib.format.open_memmap(
+                os.path.join(temporary_entry, 'volatility.npy'), mode='w+', shape=(n_paths, series_len)
+            )
+            chunk_start = 0
+            for price_chunk, volatility_chunk in iter_price_volatility_paths(
+                    n_paths, series_len, burn_in, seed, **process_kwargs
+            ):
+                chunk_end = chunk_start + len(price_chunk)
+                price[chunk_start:chunk_end] = price_chunk
+                volatility[chunk_start:chunk_end] = volatility_chunk
+                chunk_start = chunk_end
+            price.flush()
+            volatility.flush()
+            del price, volatility
+            os.rename(temporary_entry, entry)
+        except OSError:
+            if not os.path.isdir(entry):
+                raise
+            # another process stored the same paths first
+        finally:
+            shutil.rmtree(temporary_entry, ignore_errors=True)
+
+    def _entries(self) -> Dict[str, Tuple[float, int]]:
+        """Entry -> (last use, size in bytes)."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.tmp-') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+                entries[entry] = (os.path.getmtime(entry), size)
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size in self._entries().values())
+
+    def _evict(self, keep: str) -> None:
+        entries = self._entries()
+        total = sum(size for _, size in entries.values())
+        for entry, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,347 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import copy
+
+import numpy as np
+
+from simulations.option import Option
+
+
+# Traded strikes are matched to listed strikes with this tolerance (see StrikeIndex), listed strikes are further apart
+STRIKE_TOLERANCE = 0.001
+
+# One row per open position of the pool, "long" is the side of the pool and strike_key the position's bucket
+POSITION_DTYPE = np.dtype([
+    ('strike_price', np.float64),
+    ('long', np.bool_),
+    ('strike_key', np.int64),
+    ('locked_capital', np.float64),
+    ('quantity', np.float64),
+])
+
+# Running totals of one bucket (quantized listed strike and side of the pool)
+BUCKET_DTYPE = np.dtype([
+    ('strike_key', np.int64),
+    ('long', np.bool_),
+    ('quantity', np.float64),
+    ('locked_capital', np.float64),
+])
+
+_MIN_CAPACITY = 16
+
+
+def quantize_strike(strike_price: float) -> int:
+    """Bucket of a listed strike, listed strikes (more than STRIKE_TOLERANCE apart) never share a bucket."""
+    return round(strike_price / STRIKE_TOLERANCE)
+
+
+def quantize_strikes(strike_prices: np.ndarray) -> np.ndarray:
+    """Vectorized quantize_strike (np.rint rounds half to even, as does round)."""
+    return np.rint(np.asarray(strike_prices, dtype=float) / STRIKE_TOLERANCE).astype(np.int64)
+
+
+class PositionBook:
+    """
+    Options owned by one pool (either calls or puts).
+
+    Positions are stored as rows of a structured numpy array (see POSITION_DTYPE), so bulk operations
+    (payoff, locked capital, exposure) run over arrays and an open position takes a few tens of bytes.
+    Rows are bucketed by the listed strike they were traded at and side, and every bucket keeps running totals
+    of quantity and locked capital, so that lookup, netting and removal do not need to scan all issued options.
+    A position's own strike may differ from its listed strike by up to STRIKE_TOLERANCE (AMM accepts such
+    trades), so methods taking a strike_price to find a bucket expect the listed strike. Positions added
+    without a listed strike are bucketed by their own strike.
+    Iteration materializes Option records in the order in which the options were added.
+
+    fork() returns a copy-on-write copy, the state is copied by whichever book is modified first.
+    """
+
+    def __init__(self, type_: str, options: Iterable[Option] = ()) -> None:
+        if type_ not in {'call', 'put'}:
+            raise ValueError
+        self.type_ = type_
+        self.clear()
+        for option in options:
+            self.add(option)
+
+    def clear(self) -> None:
+        self._rows = np.zeros(_MIN_CAPACITY, dtype=POSITION_DTYPE)
+        self._alive = np.zeros(_MIN_CAPACITY, dtype=np.bool_)
+        # number of used rows (alive or removed) and number of alive rows
+        self._size = 0
+        self._count = 0
+        # bucket -> row indices (dict is used as an ordered set)
+        self._buckets: Dict[Tuple[int, bool], Dict[int, None]] = {}
+        self._quantity: Dict[Tuple[int, bool], float] = {}
+        self._locked_capital: Dict[Tuple[int, bool], float] = {}
+        # position strike -> long less short quantity and number of open positions (see net_quantities)
+        self._net_quantity: Dict[float, float] = {}
+        self._strike_count: Dict[float, int] = {}
+        # state may be shared with a fork
+        self._shared = False
+
+    def fork(self) -> 'PositionBook':
+        forked = copy.copy(self)
+        self._shared = forked._shared = True
+        return forked
+
+    def _own(self) -> None:
+        """Copies the state shared with a fork before it is modified."""
+        if not self._shared:
+            return
+        self._rows = self._rows.copy()
+        self._alive = self._alive.copy()
+        self._buckets = {key: dict(rows) for key, rows in self._buckets.items()}
+        self._quantity = dict(self._quantity)
+        self._locked_capital = dict(self._locked_capital)
+        self._net_quantity = dict(self._net_quantity)
+        self._strike_count = dict(self._strike_count)
+        self._shared = False
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (positions, buckets), copies of the state as POSITION_DTYPE and BUCKET_DTYPE arrays."""
+        buckets = np.array(
+            [
+                (strike_key, long, self._quantity[(strike_key, long)], self._locked_capital[(strike_key, long)])
+                for strike_key, long in self._buckets
+            ],
+            dtype=BUCKET_DTYPE
+        )
+        return self.positions(), buckets
+
+    @classmethod
+    def from_snapshot(cls, type_: str, positions: np.ndarray, buckets: np.ndarray) -> 'PositionBook':
+        book = cls(type_)
+        capacity = max(_MIN_CAPACITY, len(positions))
+        book._rows = np.zeros(capacity, dtype=POSITION_DTYPE)
+        book._rows[:len(positions)] = positions
+        book._alive = np.zeros(capacity, dtype=np.bool_)
+        book._alive[:len(positions)] = True
+        book._size = book._count = len(positions)
+        for strike_key, long, quantity, locked_capital in buckets.tolist():
+            book._buckets[(strike_key, long)] = {}
+            book._quantity[(strike_key, long)] = quantity
+            book._locked_capital[(strike_key, long)] = locked_capital
+        for row, (strike_price, long, strike_key, _, quantity) in enumerate(positions.tolist()):
+            book._buckets[(strike_key, long)][row] = None
+            book._add_net_quantity(strike_price, quantity if long else -quantity)
+        return book
+
+    @staticmethod
+    def _key(strike_price: float, long_short: str) -> Tuple[int, bool]:
+        # the methods taking a key (_add_row, _totals, _drop) are used by AMM.trade_batch,
+        # which computes the keys of all orders at once (see quantize_strikes)
+        return quantize_strike(strike_price), long_short == 'long'
+
+    def _option(self, row: int) -> Option:
+        strike_price, long, _, locked_capital, quantity = self._rows[row].item()
+        return Option(strike_price, self.type_, 'long' if long else 'short', locked_capital, quantity)
+
+    def add(self, option: Option) -> None:
+        if option.type_ != self.type_:
+            raise ValueError
+        self.add_position(option.strike_price, option.long_short, option.locked_capital, option.quantity)
+
+    def add_position(
+            self,
+            strike_price: float,
+            long_short: str,
+            locked_capital: float,
+            quantity: float,
+            listed_strike_price: Optional[float] = None,
+    ) -> None:
+        """Same as add, without allocating the Option. The position is bucketed by listed_strike_price if given."""
+        if listed_strike_price is None:
+            listed_strike_price = strike_price
+        self._add_row(self._key(listed_strike_price, long_short), strike_price, locked_capital, quantity)
+
+    def _add_row(self, key: Tuple[int, bool], strike_price: float, locked_capital: float, quantity: float) -> None:
+        self._own()
+        if self._size == len(self._rows):
+            self._grow()
+        row = self._size
+        self._rows[row] = (strike_price, key[1], key[0], locked_capital, quantity)
+        self._alive[row] = True
+        self._size += 1
+        self._count += 1
+        self._buckets.setdefault(key, {})[row] = None
+        self._quantity[key] = self._quantity.get(key, 0.) + quantity
+        self._locked_capital[key] = self._locked_capital.get(key, 0.) + locked_capital
+        self._add_net_quantity(strike_price, quantity if key[1] else -quantity)
+
+    def _add_net_quantity(self, strike_price: float, signed_quantity: float) -> None:
+        self._net_quantity[strike_price] = self._net_quantity.get(strike_price, 0.) + signed_quantity
+        self._strike_count[strike_price] = self._strike_count.get(strike_price, 0) + 1
+
+    def _remove_net_quantity(self, strike_price: float, signed_quantity: float) -> None:
+        count = self._strike_count[strike_price] - 1
+        if count:
+            self._strike_count[strike_price] = count
+            self._net_quantity[strike_price] -= signed_quantity
+        else:
+            # no rounding error is carried over once the last position of the strike is closed
+            del self._strike_count[strike_price]
+            del self._net_quantity[strike_price]
+
+    def _grow(self) -> None:
+        if 2 * self._count <= self._size:
+            # at least half of the rows were removed, reuse the space instead of growing
+            self._compact()
+            if self._size < len(self._rows):
+                return
+        self._rows = np.concatenate((self._rows, np.zeros(len(self._rows), dtype=POSITION_DTYPE)))
+        self._alive = np.concatenate((self._alive, np.zeros(len(self._alive), dtype=np.bool_)))
+
+    def _compact(self) -> None:
+        alive_rows = np.flatnonzero(self._alive[:self._size])
+        new_rows = np.full(self._size, -1)
+        new_rows[alive_rows] = np.arange(len(alive_rows))
+        self._rows[:len(alive_rows)] = self._rows[alive_rows]
+        self._alive[:] = False
+        self._alive[:len(alive_rows)] = True
+        self._size = len(alive_rows)
+        self._buckets = {
+            key: {int(new_rows[row]): None for row in rows}
+            for key, rows in self._buckets.items()
+        }
+
+    def remove(self, option: Option) -> None:
+        """Removes one position equal to option."""
+        if option.type_ != self.type_:
+            raise ValueError
+        rows = self._rows[:self._size]
+        # the position's bucket does not follow from its own strike, rows with the same strike are compared
+        candidates = np.flatnonzero(
+            self._alive[:self._size]
+            & (rows['strike_price'] == option.strike_price)
+            & (rows['long'] == (option.long_short == 'long'))
+        )
+        for row in candidates.tolist():
+            if self._option(row) == option:
+                self._own()
+                self._remove_row((int(self._rows[row]['strike_key']), bool(self._rows[row]['long'])), row)
+                return
+        raise ValueError
+
+    def _remove_row(self, key: Tuple[int, bool], row: int) -> None:
+        self._alive[row] = False
+        self._count -= 1
+        bucket = self._buckets[key]
+        del bucket[row]
+        strike_price, long, _, _, quantity = self._rows[row].item()
+        self._remove_net_quantity(strike_price, quantity if long else -quantity)
+        if bucket:
+            self._quantity[key] -= self._rows[row]['quantity']
+            self._locked_capital[key] -= self._rows[row]['locked_capital']
+        else:
+            # reset the totals so that no rounding error is carried over
+            self._drop_bucket(key)
+
+    def _drop_bucket(self, key: Tuple[int, bool]) -> None:
+        del self._buckets[key]
+        del self._quantity[key]
+        del self._locked_capital[key]
+
+    def find(self, strike_price: float, long_short: str) -> List[Option]:
+        """Options in the bucket of given listed strike and side."""
+        return [self._option(row) for row in self._buckets.get(self._key(strike_price, long_short), ())]
+
+    def count(self, strike_price: float, long_short: str) -> int:
+        return len(self._buckets.get(self._key(strike_price, long_short), ()))
+
+    def totals(self, strike_price: float, long_short: str) -> Tuple[float, float]:
+        """Returns (quantity, locked_capital) summed over all options with given listed strike and side."""
+        return self._totals(self._key(strike_price, long_short))
+
+    def _totals(self, key: Tuple[int, bool]) -> Tuple[float, float]:
+        return self._quantity.get(key, 0.), self._locked_capital.get(key, 0.)
+
+    def net_quantities(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (strike_prices, net_quantities): the distinct strikes of open positions (their own strikes,
+        not the listed ones) and long less short quantity of the pool at each of them, from running totals.
+        """
+        return (
+            np.array(list(self._net_quantity), dtype=float),
+            np.array(list(self._net_quantity.values()), dtype=float),
+        )
+
+    def pop(self, strike_price: float, long_short: str) -> List[Option]:
+        """Removes and returns all options with given listed strike and side."""
+        options = self.find(strike_price, long_short)
+        self.drop(strike_price, long_short)
+        return options
+
+    def drop(self, strike_price: float, long_short: str) -> Optional[float]:
+        """Same as pop without materializing the options, returns the strike of the first one (None if none)."""
+        return self._drop(self._key(strike_price, long_short))
+
+    def _drop(self, key: Tuple[int, bool]) -> Optional[float]:
+        rows = self._buckets.get(key)
+        if not rows:
+            return None
+        self._own()
+        rows = self._buckets[key]
+        first_strike_price = float(self._rows[next(iter(rows))]['strike_price'])
+        for strike_price, long, _, _, quantity in self._rows[list(rows)].tolist():
+            self._remove_net_quantity(strike_price, quantity if long else -quantity)
+        self._alive[list(rows)] = False
+        self._count -= len(rows)
+        self._drop_bucket(key)
+        return first_strike_price
+
+    def trade(
+            self, strike_key: int, long: bool, strike_price: float, locked_capital: float, quantity: float
+    ) -> Optional[float]:
+        """
+        Nets a user's trade against the bucket strike_key (see quantize_strike), long is the user's side
+        and locked_capital the capital quantity locks in the pool's token.
+
+        If the pool's options of the user's side cover quantity, they are dropped, the remainder stays
+        in the pool as one position at the strike of the first of them and that strike is returned.
+        Otherwise the pool is issued the opposite option at strike_price and None is returned.
+        """
+        key = (strike_key, long)
+        all_quantity, all_locked_capital = self._totals(key)
+        matched_strike_price = self._drop(key) if all_quantity >= quantity else None
+        if matched_strike_price is None:
+            # pool locks capital if it is short (user is long)
+            self._add_row((strike_key, not long), strike_price, locked_capital if long else 0., quantity)
+            return None
+        remaining_quantity = all_quantity - quantity
+        if remaining_quantity > 0:
+            remaining_locked_capital = 0. if long else all_locked_capital - locked_capital
+            self._add_row(key, matched_strike_price, remaining_locked_capital, remaining_quantity)
+        return matched_strike_price
+
+    def positions(self) -> np.ndarray:
+        """Copy of the open positions as a structured array (POSITION_DTYPE) in the order they were added."""
+        return self._rows[:self._size][self._alive[:self._size]]
+
+    def locked_capital(self) -> float:
+        return float(sum(self._locked_capital.values()))
+
+    def exposure(self) -> float:
+        """Net quantity of the pool's options, long positions count positively and short negatively."""
+        positions = self.positions()
+        return float(np.where(positions['long'], positions['quantity'], -positions['quantity']).sum())
+
+    def payoff(self, underlying_price: float) -> float:
+        """
+        What the pool gets when all options are executed at given price.
+
+        Long options pay the pool their intrinsic value, short options return the locked capital reduced
+        by the intrinsic value. Call's values are in base token (as is the call pool), put's are in quote token.
+        """
+        positions = self.positions()
+        if self.type_ == 'call':
+            intrinsic_value = np.maximum(underlying_price - positions['strike_price'], 0.) / underlying_price
+        else:
+            intrinsic_value = np.maximum(positions['strike_price'] - underlying_price, 0.)
+        value = positions['quantity'] * intrinsic_value
+        return float(np.where(positions['long'], value, positions['locked_capital'] - value).sum())
+
+    def __iter__(self) -> Iterator[Option]:
+        return iter([self._option(row) for row in np.flatnonzero(self._alive[:self._size])])
+
+    def __len__(self) -> int:
+        return self._count
@@ -1,11 +1,11 @@
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+import scipy.signal
 import scipy.stats
 
 
-
 def _calc_volatility(alpha: float, beta: float, sigma: np.array) -> np.array:
     """
     Volatility for Black Scholes model is "is the standard deviation of the stock's returns".
@@ -48,37 +48,203 @@ def generate_price_volatility_process(
         epsilon_t ~ N(epsilon_mean, sigma_t)
         sigmq_t ~ gamma * sigma_{t-1} + e_t
         e_t ~ U[0, error_var]
+
+    All noise is drawn in bulk and the recursions are computed as linear filters.
     """
     e = scipy.stats.uniform.rvs(0, error_var, series_len)
-    latest_sigma = initial_sigma
-    sigma = []
-    for e_t in e:
-        latest_sigma = gamma * latest_sigma + e_t
-        sigma.append(latest_sigma)
     # by design, all sigma values are positive
-    sigma = np.array(sigma)
-
-    epsilon = []
-    for sigma_t in sigma:
-        epsilon_t = scipy.stats.norm.rvs(epsilon_mean, sigma_t, 1)[0]
-        epsilon.append(epsilon_t)
-    epsilon = np.array(epsilon)
-
-    r_1 = 0
-    r_2 = 0
-    r = []
-    for i, epsilon_t in enumerate(epsilon):
-        r_t = alpha * r_1 + beta * r_2 + epsilon_t
-        r.append(r_t)
-        r_2 = r_1
-        r_1 = r_t
-    r = np.array(r)
-
-    price_t = initial_price
-    price = []
-    for r_t in r:
-        price_t = (1 + r_t) * price_t
-        price.append(price_t)
-    price = np.array(price)
+    sigma = _ar_filter(e, [gamma], [initial_sigma])
+
+    epsilon = scipy.stats.norm.rvs(epsilon_mean, sigma)
+    r = _ar_filter(epsilon, [alpha, beta], [0., 0.])
+    price = _compound(initial_price, r)
 
     return price, _calc_volatility(alpha, beta, sigma)
+
+
+def _ar_filter(x: np.array, coefficients: List[float], initial_values: List[float]) -> np.array:
+    """
+    Runs the recursion y_t = coefficients[0] * y_{t-1} + coefficients[1] * y_{t-2} + ... + x_t
+    along the last axis of x as a linear filter.
+
+    initial_values are [y_{-1}, y_{-2}, ...], the values preceding the first element.
+    """
+    y, _ = _ar_filter_step(x, coefficients, _ar_initial_state(coefficients, initial_values, np.shape(x)[:-1]))
+    return y
+
+
+def _ar_initial_state(
+        coefficients: List[float],
+        initial_values: List[float],
+        batch_shape: Tuple[int, ...] = ()
+) -> np.array:
+    """lfilter's state holding the contributions of the initial values to the following outputs."""
+    zi = scipy.signal.lfiltic([1.], _ar_denominator(coefficients), initial_values)
+    return np.broadcast_to(zi, batch_shape + zi.shape)
+
+
+def _ar_denominator(coefficients: List[float]) -> np.array:
+    return np.concatenate(([1.], -np.asarray(coefficients, dtype=float)))
+
+
+def _ar_filter_step(x: np.array, coefficients: List[float], state: np.array) -> Tuple[np.array, np.array]:
+    """Same as _ar_filter starting from given lfilter state, returns also the state to continue with."""
+    return scipy.signal.lfilter([1.], _ar_denominator(coefficients), x, axis=-1, zi=state)
+
+
+def _compound(initial_price: float, r: np.array) -> np.array:
+    """price_t = (1 + r_t) * price_{t-1} along the last axis of r."""
+    growth = np.concatenate((np.full(np.shape(r)[:-1] + (1,), initial_price), 1 + r), axis=-1)
+    return np.multiply.accumulate(growth, axis=-1)[..., 1:]
+
+
+SeedLike = Union[None, int, np.random.SeedSequence, np.random.Generator]
+
+
+def _as_seed_sequence(seed: SeedLike) -> np.random.SeedSequence:
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        # derive the root seed from the generator, so that the same generator state gives the same paths
+        return np.random.SeedSequence([int(x) for x in seed.integers(0, 2 ** 32, size=4)])
+    return np.random.SeedSequence(seed)
+
+
+def _path_generators(
+        seed_sequence: np.random.SeedSequence,
+        path_index: int
+) -> Tuple[np.random.Generator, np.random.Generator]:
+    """
+    Independent generators of the sigma noise (e_t) and of the return noise (epsilon_t) of given path.
+
+    They depend only on the root seed and on the index of the path, so the path does not change
+    with the chunking or with the split of the paths among workers.
+    """
+    path_seed_sequence = np.random.SeedSequence(
+        seed_sequence.entropy,
+        spawn_key=tuple(seed_sequence.spawn_key) + (path_index,)
+    )
+    sigma_seed_sequence, epsilon_seed_sequence = path_seed_sequence.spawn(2)
+    return np.random.default_rng(sigma_seed_sequence), np.random.default_rng(epsilon_seed_sequence)
+
+
+def iter_price_volatility_paths(
+        n_paths: int,
+        series_len: int = 10_000,
+        burn_in: int = 0,
+        seed: SeedLike = None,
+        paths_per_chunk: int = 100,
+        path_offset: int = 0,
+        alpha: float = 0.3,
+        beta: float = 0.1,
+        gamma: float = 0.9,
+        epsilon_mean: float = 0.,
+        error_var: float = 0.002,
+        initial_sigma: float = 0.05,
+        initial_price: float = 1.,
+) -> Iterator[Tuple[np.array, np.array]]:
+    """
+    Yields (price, volatility) arrays of shape (paths_in_chunk, series_len) for paths
+    path_offset, ..., path_offset + n_paths - 1, at most paths_per_chunk paths at a time.
+
+    Every path follows the process described in generate_price_volatility_process. The first burn_in
+    observations of every path are generated and dropped (prices are not rescaled after the cut).
+    Paths are fully determined by seed and their index, so workers may generate disjoint ranges of paths
+    (via path_offset) of one seed independently.
+    """
+    if paths_per_chunk < 1:
+        raise ValueError
+    seed_sequence = _as_seed_sequence(seed)
+    total_len = series_len + burn_in
+
+    for chunk_start in range(0, n_paths, paths_per_chunk):
+        chunk_size = min(paths_per_chunk, n_paths - chunk_start)
+        e = np.empty((chunk_size, total_len))
+        z = np.empty((chunk_size, total_len))
+        for i in range(chunk_size):
+            sigma_generator, epsilon_generator = _path_generators(seed_sequence, path_offset + chunk_start + i)
+            e[i] = sigma_generator.uniform(0, error_var, total_len)
+            z[i] = epsilon_generator.standard_normal(total_len)
+
+        sigma = _ar_filter(e, [gamma], [initial_sigma])
+        epsilon = epsilon_mean + sigma * z
+        r = _ar_filter(epsilon, [alpha, beta], [0., 0.])
+        price = _compound(initial_price, r)
+
+        yield price[:, burn_in:], _calc_volatility(alpha, beta, sigma[:, burn_in:])
+
+
+def generate_price_volatility_paths(
+        n_paths: int,
+        series_len: int = 10_000,
+        burn_in: int = 0,
+        seed: SeedLike = None,
+        paths_per_chunk: int = 100,
+        **process_kwargs: float,
+) -> Tuple[np.array, np.array]:
+    """
+    Returns prices and volatilities of n_paths independent paths as (n_paths, series_len) arrays.
+
+    See iter_price_volatility_paths, the result does not depend on paths_per_chunk,
+    which only bounds the size of the temporary arrays.
+    """
+    price = np.empty((n_paths, series_len))
+    volatility = np.empty((n_paths, series_len))
+    chunk_start = 0
+    for price_chunk, volatility_chunk in iter_price_volatility_paths(
+            n_paths, series_len, burn_in, seed, paths_per_chunk, **process_kwargs
+    ):
+        chunk_end = chunk_start + len(price_chunk)
+        price[chunk_start:chunk_end] = price_chunk
+        volatility[chunk_start:chunk_end] = volatility_chunk
+        chunk_start = chunk_end
+    return price, volatility
+
+
+def iter_price_volatility_process(
+        chunk_len: int = 10_000,
+        series_len: Optional[int] = None,
+        burn_in: int = 0,
+        seed: SeedLike = None,
+        path_index: int = 0,
+        alpha: float = 0.3,
+        beta: float = 0.1,
+        gamma: float = 0.9,
+        epsilon_mean: float = 0.,
+        error_var: float = 0.002,
+        initial_sigma: float = 0.05,
+        initial_price: float = 1.,
+) -> Iterator[Tuple[np.array, np.array]]:
+    """
+    Yields (price, volatility) of one path in consecutive chunks of chunk_len observations (the last one may be
+    shorter), series_len observations in total or indefinitely if series_len is None.
+
+    The state of the sigma and AR(2) recursions and the last price are carried over between the chunks, so memory
+    does not grow with the length of the path and the path does not depend on chunk_len. For the same seed and
+    parameters the path is the same as path number path_index of generate_price_volatility_paths.
+    """
+    if chunk_len < 1:
+        raise ValueError
+    sigma_generator, epsilon_generator = _path_generators(_as_seed_sequence(seed), path_index)
+    sigma_state = _ar_initial_state([gamma], [initial_sigma])
+    r_state = _ar_initial_state([alpha, beta], [0., 0.])
+    last_price = initial_price
+
+    generated = -burn_in
+    while series_len is None or generated < series_len:
+        if generated < 0:
+            # burn in is generated in chunks too and thrown away
+            n = min(chunk_len, -generated)
+        else:
+            n = chunk_len if series_len is None else min(chunk_len, series_len - generated)
+
+        e = sigma_generator.uniform(0, error_var, n)
+        z = epsilon_generator.standard_normal(n)
+        sigma, sigma_state = _ar_filter_step(e, [gamma], sigma_state)
+        r, r_state = _ar_filter_step(epsilon_mean + sigma * z, [alpha, beta], r_state)
+        price = _compound(last_price, r)
+        last_price = price[-1]
+
+        if generated >= 0:
+            yield price, _calc_volatility(alpha, beta, sigma)
+        generated += n
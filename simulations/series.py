@@ -0,0 +1,44 @@
+from typing import Dict, Iterable
+
+import numpy as np
+
+
+class EpochSeries:
+    """
+    Preallocated float columns with one row per epoch.
+
+    Columns are numpy arrays that double their capacity when full, so appending a row does not allocate
+    and the recorded values can be read as arrays (views, without copying) for plotting and analysis.
+    """
+
+    def __init__(self, columns: Iterable[str], capacity: int = 1024) -> None:
+        if capacity < 1:
+            raise ValueError
+        self._columns = {column: np.empty(capacity) for column in columns}
+        self._length = 0
+
+    def append(self, **values: float) -> None:
+        if values.keys() != self._columns.keys():
+            raise ValueError
+        if self._length == len(next(iter(self._columns.values()))):
+            for column, array in self._columns.items():
+                self._columns[column] = np.concatenate((array, np.empty(len(array))))
+        for column, value in values.items():
+            self._columns[column][self._length] = value
+        self._length += 1
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {column: array[:self._length] for column, array in self._columns.items()}
+
+    def copy(self) -> 'EpochSeries':
+        copied = EpochSeries(self._columns, capacity=len(next(iter(self._columns.values()))))
+        for column, array in self._columns.items():
+            copied._columns[column][:self._length] = array[:self._length]
+        copied._length = self._length
+        return copied
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._columns[column][:self._length]
+
+    def __len__(self) -> int:
+        return self._length
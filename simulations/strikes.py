@@ -0,0 +1,55 @@
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+import numpy as np
+
+from simulations.position_book import STRIKE_TOLERANCE
+
+
+class StrikeIndex:
+    """
+    Listed strikes of one option type, immutable and in the order they were listed.
+
+    The id of a strike is its position in strikes, prices within STRIKE_TOLERANCE of a listed strike map to its id.
+    Strikes that could not be told apart (within STRIKE_TOLERANCE of a strike listed before them, duplicates
+    in particular) are merged into the first of them. Lookups are binary searches over a sorted copy,
+    so their cost grows only logarithmically with the number of strikes.
+    """
+
+    def __init__(self, strikes: Iterable[float]) -> None:
+        listed = []
+        # listed strikes sorted, bisect on a list is faster than np.searchsorted for single values
+        self._values = []
+        for strike_price in np.array(list(strikes), dtype=float).tolist():
+            i = bisect_left(self._values, strike_price - STRIKE_TOLERANCE)
+            if i < len(self._values) and self._values[i] <= strike_price + STRIKE_TOLERANCE:
+                continue
+            insort(self._values, strike_price)
+            listed.append(strike_price)
+        strikes = np.array(listed, dtype=float)
+        strikes.flags.writeable = False
+        self.strikes = strikes
+        # ids of the sorted strikes
+        self._ids = np.argsort(strikes, kind='stable')
+        self._sorted_strikes = strikes[self._ids]
+        self._id_list = self._ids.tolist()
+
+    def find(self, strike_price: float) -> Optional[int]:
+        """Id of the listed strike within the tolerance of strike_price, None if there is none."""
+        i = bisect_left(self._values, strike_price - STRIKE_TOLERANCE)
+        if i < len(self._values) and self._values[i] <= strike_price + STRIKE_TOLERANCE:
+            return self._id_list[i]
+        return None
+
+    def ids(self, strike_prices: np.ndarray) -> np.ndarray:
+        """Vectorized find, -1 for prices that are not listed."""
+        strike_prices = np.asarray(strike_prices, dtype=float)
+        if not len(self.strikes):
+            return np.full(strike_prices.shape, -1)
+        i = np.searchsorted(self._sorted_strikes, strike_prices - STRIKE_TOLERANCE, side='left')
+        i_listed = np.minimum(i, len(self.strikes) - 1)
+        listed = (i < len(self.strikes)) & (self._sorted_strikes[i_listed] <= strike_prices + STRIKE_TOLERANCE)
+        return np.where(listed, self._ids[i_listed], -1)
+
+    def __len__(self) -> int:
+        return len(self._values)
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from itertools import product
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from simulations.monte_carlo import RoundConfig, RoundResult, run_round
+from simulations.path_cache import PathCache
+
+
+def config_grid(base: RoundConfig = RoundConfig(), **grid: Iterable[Any]) -> List[RoundConfig]:
+    """
+    Cartesian product of the given values of RoundConfig fields, other fields are taken from base.
+
+    E.g. config_grid(fee_size=[0.01, 0.03], call_pool_size=[50., 100.]) returns 4 configurations.
+    """
+    names = list(grid)
+    return [replace(base, **dict(zip(names, values))) for values in product(*grid.values())]
+
+
+def config_key(config: RoundConfig, seed: int) -> str:
+    """Hash of the configuration and the seed, results of its rounds are cached under it."""
+    description = json.dumps({'config': asdict(config), 'seed': seed}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def _cache_path(cache_dir: str, config: RoundConfig, seed: int, round_index: int) -> str:
+    return os.path.join(cache_dir, config_key(config, seed), f'round_{round_index}.json')
+
+
+def _load_cached(path: str) -> Optional[RoundResult]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return RoundResult(**json.load(f))
+
+
+def _store_cached(path: str, result: RoundResult) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written to a temporary file first, so that an interrupted sweep does not leave a corrupted result
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(asdict(result), f)
+    os.replace(temporary_path, path)
+
+
+def run_sweep(
+        configs: Sequence[RoundConfig],
+        n_rounds: int,
+        seed: int,
+        cache_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        chunksize: int = 1,
+        path_cache: Optional[PathCache] = None,
+) -> pd.DataFrame:
+    """
+    Runs rounds 0, ..., n_rounds - 1 of every configuration across a process pool.
+
+    All configurations use the same seed, i.e. the same price paths and user randomness per round index,
+    so differences between configurations are not blurred by sampling noise. With cache_dir, every
+    (configuration, seed, round) result is stored on disk and only the missing ones are computed,
+    so extending the grid or the number of rounds only runs the new cells. Configurations differing only
+    in AMM or user parameters share their price paths through path_cache.
+
+    Returns a tidy table, one row per configuration and round with the configuration's fields
+    (and its index in configs) followed by the fields of RoundResult.
+    """
+    cells = [(config_index, round_index) for config_index in range(len(configs)) for round_index in range(n_rounds)]
+    results: Dict[Tuple[int, int], RoundResult] = {}
+    if cache_dir is not None:
+        for config_index, round_index in cells:
+            result = _load_cached(_cache_path(cache_dir, configs[config_index], seed, round_index))
+            if result is not None:
+                results[(config_index, round_index)] = result
+
+    missing = [cell for cell in cells if cell not in results]
+    round_indexes = [round_index for _, round_index in missing]
+    seeds = [seed] * len(missing)
+    missing_configs = [configs[config_index] for config_index, _ in missing]
+    path_caches = [path_cache] * len(missing)
+    if max_workers == 1:
+        computed = map(run_round, round_indexes, seeds, missing_configs, path_caches)
+        _collect(computed, missing, configs, seed, cache_dir, results)
+    elif missing:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            computed = executor.map(
+                run_round, round_indexes, seeds, missing_configs, path_caches, chunksize=chunksize
+            )
+            _collect(computed, missing, configs, seed, cache_dir, results)
+
+    config_columns = list(RoundConfig.__dataclass_fields__)
+    result_columns = list(RoundResult.__dataclass_fields__)
+    rows = []
+    for config_index, round_index in cells:
+        row = {'config_index': config_index}
+        row.update({field: getattr(configs[config_index], field) for field in config_columns})
+        row.update(asdict(results[(config_index, round_index)]))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['config_index'] + config_columns + result_columns)
+
+
+def _collect(
+        computed: Iterable[RoundResult],
+        cells: List[Tuple[int, int]],
+        configs: Sequence[RoundConfig],
+        seed: int,
+        cache_dir: Optional[str],
+        results: Dict[Tuple[int, int], RoundResult],
+) -> None:
+    """Stores results as they arrive, so that results computed before an interruption are kept."""
+    for (config_index, round_index), result in zip(cells, computed):
+        results[(config_index, round_index)] = result
+        if cache_dir is not None:
+            _store_cached(_cache_path(cache_dir, configs[config_index], seed, round_index), result)
@@ -0,0 +1,77 @@
+from array import array
+from typing import Dict
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Columns of StageTimer.summary, times in microseconds except for total_s
+SUMMARY_COLUMNS = ('count', 'total_s', 'mean_us', 'p50_us', 'p90_us', 'p99_us', 'max_us')
+
+
+class StageTimer:
+    """
+    Opt-in timing of the stages of AMM.trade and of the users' trade methods.
+
+    Instrumented code keeps the timer in an attribute that is None by default and times its stages as
+
+        timer = self.timer
+        if timer is not None:
+            start = timer.now()
+        ...  # stage
+        if timer is not None:
+            start = timer.lap('stage', start)
+
+    so a disabled timer costs one comparison per stage. Every duration is kept (8 bytes per lap)
+    to have exact percentiles.
+    """
+
+    def __init__(self) -> None:
+        self._durations: Dict[str, array] = {}
+
+    @staticmethod
+    def now() -> int:
+        return time.perf_counter_ns()
+
+    def lap(self, stage: str, start: int) -> int:
+        """Records the time since start as a call of stage and returns the start of the next stage."""
+        duration = time.perf_counter_ns() - start
+        durations = self._durations.get(stage)
+        if durations is None:
+            durations = self._durations[stage] = array('q')
+        durations.append(duration)
+        # the bookkeeping above is not counted to the next stage
+        return time.perf_counter_ns()
+
+    def durations(self, stage: str) -> np.ndarray:
+        """Durations of all calls of stage in nanoseconds."""
+        return np.frombuffer(self._durations[stage], dtype=np.int64).copy()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Call count, total and percentile times of every stage (see SUMMARY_COLUMNS)."""
+        summary = {}
+        for stage, durations in self._durations.items():
+            durations_us = np.frombuffer(durations, dtype=np.int64) / 1_000
+            p50, p90, p99 = np.percentile(durations_us, [50, 90, 99])
+            summary[stage] = {
+                'count': len(durations_us),
+                'total_s': float(durations_us.sum()) / 1_000_000,
+                'mean_us': float(durations_us.mean()),
+                'p50_us': float(p50),
+                'p90_us': float(p90),
+                'p99_us': float(p99),
+                'max_us': float(durations_us.max()),
+            }
+        return summary
+
+    def to_frame(self) -> pd.DataFrame:
+        """summary as a table, one row per stage."""
+        return pd.DataFrame.from_dict(self.summary(), orient='index', columns=list(SUMMARY_COLUMNS))
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def reset(self) -> None:
+        self._durations.clear()
@@ -1,20 +1,103 @@
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
 import math
 
 import numpy as np
 import random
 
-from simulations.amm import AMM
+from simulations.amm import AMM, ArrayLike, quote_premia_surface
+from simulations.timing import StageTimer
+
+
+@dataclass(frozen=True)
+class TradeSchedule:
+    """Decisions of a RandomUser for epochs start, ..., start + len - 1, one element per epoch."""
+    start: int
+    trade_mask: np.ndarray
+    is_call: np.ndarray
+    is_long: np.ndarray
+    # index into call_strikes or put_strikes (depending on is_call)
+    strike_index: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.trade_mask)
 
 
 class RandomUser:
 
-    def __init__(self, trade_probability: float, put_strikes: List[float], call_strikes: List[float]) -> None:
+    def __init__(
+            self,
+            trade_probability: float,
+            put_strikes: List[float],
+            call_strikes: List[float],
+            timer: Optional[StageTimer] = None
+    ) -> None:
         self.trade_probability = trade_probability
         self.put_strikes = put_strikes
         self.call_strikes = call_strikes
+        self.timer = timer
+        # set by use_schedule
+        self._schedules: Optional[Iterator[TradeSchedule]] = None
+        self._schedule: Optional[TradeSchedule] = None
+        self._schedule_index = 0
+
+    def iter_schedule(
+            self,
+            n_epochs: int,
+            seed: Any = None,
+            chunk_len: int = 100_000
+    ) -> Iterator[TradeSchedule]:
+        """
+        Yields the decisions of the user for n_epochs epochs in schedules of at most chunk_len epochs.
+
+        All decisions are derived from one stream of uniforms (four per epoch) of a generator seeded by seed,
+        so they do not depend on chunk_len and the same order flow can be reused across configurations.
+        """
+        if chunk_len < 1:
+            raise ValueError
+        generator = np.random.default_rng(seed)
+        for start in range(0, n_epochs, chunk_len):
+            u = generator.random((min(chunk_len, n_epochs - start), 4))
+            is_call = u[:, 1] < .5
+            n_strikes = np.where(is_call, len(self.call_strikes), len(self.put_strikes))
+            yield TradeSchedule(
+                start=start,
+                trade_mask=u[:, 0] < self.trade_probability,
+                is_call=is_call,
+                is_long=u[:, 2] < .5,
+                strike_index=(u[:, 3] * n_strikes).astype(np.int64),
+            )
+
+    def draw_schedule(self, n_epochs: int, seed: Any = None) -> TradeSchedule:
+        """Decisions of the user for all n_epochs at once, see iter_schedule."""
+        if n_epochs == 0:
+            # iter_schedule yields no schedule for no epochs
+            empty = np.zeros(0, dtype=bool)
+            return TradeSchedule(
+                start=0, trade_mask=empty, is_call=empty, is_long=empty, strike_index=np.zeros(0, dtype=np.int64)
+            )
+        return next(self.iter_schedule(n_epochs, seed, chunk_len=n_epochs))
+
+    def use_schedule(self, schedules: Iterator[TradeSchedule]) -> None:
+        """
+        Every following call of trade consumes the next epoch of schedules instead of drawing from random,
+        trade raises ValueError once schedules are exhausted.
+        """
+        self._schedules = iter(schedules)
+        self._schedule = None
+        self._schedule_index = 0
 
     def trade(self, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        if self.timer is None:
+            return self._trade()
+        start = self.timer.now()
+        trade = self._trade()
+        self.timer.lap('random_user.trade', start)
+        return trade
+
+    def _trade(self) -> Optional[Dict[str, Any]]:
+        if self._schedules is not None:
+            return self._scheduled_trade()
         if random.random() < self.trade_probability:
             # user trades
             type_ = random.choice(['call', 'put'])
@@ -31,6 +114,25 @@ class RandomUser:
             }
         return None
 
+    def _scheduled_trade(self) -> Optional[Dict[str, Any]]:
+        while self._schedule is None or self._schedule_index == len(self._schedule):
+            # StopIteration would end a generator calling trade silently (or as RuntimeError, see PEP 479)
+            self._schedule = next(self._schedules, None)
+            if self._schedule is None:
+                raise ValueError('trade schedule exhausted')
+            self._schedule_index = 0
+        schedule, i = self._schedule, self._schedule_index
+        self._schedule_index += 1
+        if not schedule.trade_mask[i]:
+            return None
+        is_call = schedule.is_call[i]
+        return {
+            'type_': 'call' if is_call else 'put',
+            'long_short': 'long' if schedule.is_long[i] else 'short',
+            'strike_price': (self.call_strikes if is_call else self.put_strikes)[schedule.strike_index[i]],
+            'quantity': 1.
+        }
+
 
 class TraderUser:
 
@@ -41,13 +143,15 @@ class TraderUser:
     def __init__(
             self,
             amm: AMM,
-            volatility_adjustment: float
+            volatility_adjustment: float,
+            timer: Optional[StageTimer] = None
     ) -> None:
         if volatility_adjustment < -1:
             raise ValueError
 
         self.amm = amm
         self.volatility_adjustment = volatility_adjustment
+        self.timer = timer
 
     def trade(self, current_price: float, current_volatility: float) -> Optional[Dict[str, Any]]:
         """
@@ -55,6 +159,8 @@ class TraderUser:
 
         If trader sees profitable option (based on current adjusted volatility) it executes given option with
         probability (amm.premia - trader.premia) / trader.premia for shorts and with opposite sign for longs.
+        Profitability of all options is evaluated at once, the first option (in the random order) that passes
+        its acceptance draw is executed.
         """
         if not math.isclose(self.amm.current_underlying_price, current_price, rel_tol=0.00001):
             raise ValueError(
@@ -62,50 +168,210 @@ class TraderUser:
                 f' should be equal to current_price {current_price}'
             )
 
+        timer = self.timer
+        if timer is not None:
+            start = timer.now()
+
         adjusted_volatility = current_volatility * (1 + self.volatility_adjustment)
-        # fake_amm is used to calculate the "what if premia"...
-        fake_amm = AMM(
-            time_till_maturity=self.amm.time_till_maturity,
-            current_underlying_price=self.amm.current_underlying_price,
-            call_strikes=self.amm.call_strikes,
-            put_strikes=self.amm.put_strikes,
+        amm_premia = self.amm.get_premia_surface()
+        # "what if premia" - AMM's state with volatility the trader believes in
+        trader_premia = quote_premia_surface(
+            self.amm.call_strikes,
+            self.amm.put_strikes,
+            1.,
             call_volatility=adjusted_volatility,
             put_volatility=adjusted_volatility,
             call_pool_size=self.amm.call_pool_size,
             put_pool_size=self.amm.put_pool_size,
+            underlying_price=self.amm.current_underlying_price,
+            time_till_maturity=self.amm.time_till_maturity,
+            fee_size=self.amm.FEE_SIZE,
+            alpha=self.amm.ALPHA,
+            risk_free_rate=self.amm.RISK_FREE_RATE,
         )
+        if timer is not None:
+            start = timer.lap('trader_user.quote', start)
 
         types = ['call', 'put']
         long_shorts = ['long', 'short']
         np.random.shuffle(types)
         np.random.shuffle(long_shorts)
 
+        # All options in the order in which the trader goes through them, in blocks of one type and side
+        blocks = []
+        candidate_strikes = []
+        acceptance_probabilities = []
         for type_ in types:
             for long_short in long_shorts:
                 strike_prices = self.amm.call_strikes if type_ == 'call' else self.amm.put_strikes
-                np.random.shuffle(strike_prices)
-
-                for strike_price in strike_prices:
-                    amm_premia = self.amm.get_premia(strike_price, type_, long_short)
-                    trader_premia = fake_amm.get_premia(strike_price, type_, long_short)
-                    profitability = (amm_premia - trader_premia) / trader_premia
-
-                    if 0 < profitability and long_short == 'short':
-                        # if profitability is > 1... user believes the option has double the price
-                        if random.random() < profitability:
-                            return {
-                                'type_': type_,
-                                'long_short': long_short,
-                                'strike_price': strike_price,
-                                'quantity': 1.
-                            }
-                    elif profitability < 0 and long_short == 'long':
-                        # if profitability is < -1... user believes the option should have double the price
-                        if random.random() < -profitability:
-                            return {
-                                'type_': type_,
-                                'long_short': long_short,
-                                'strike_price': strike_price,
-                                'quantity': 1.
-                            }
-        return None
+                order = np.random.permutation(len(strike_prices))
+
+                # worthless options (trader premia of 0) give nan/inf profitability, same as scalar division would
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    profitability = amm_premia[(type_, long_short)] - trader_premia[(type_, long_short)]
+                    profitability = (profitability / trader_premia[(type_, long_short)])[order]
+
+                if long_short == 'short':
+                    # if profitability is > 1... user believes the option has double the price
+                    probability = np.where(0 < profitability, profitability, 0.)
+                else:
+                    # if profitability is < -1... user believes the option should have double the price
+                    probability = np.where(profitability < 0, -profitability, 0.)
+
+                blocks.append((type_, long_short))
+                candidate_strikes.append(strike_prices[order])
+                acceptance_probabilities.append(probability)
+        block_end = np.cumsum([len(strikes) for strikes in candidate_strikes])
+
+        # Trader executes the first option that passes the random acceptance
+        accepted = np.flatnonzero(np.random.random(block_end[-1]) < np.concatenate(acceptance_probabilities))
+        if timer is not None:
+            timer.lap('trader_user.select', start)
+        if not accepted.size:
+            return None
+        type_, long_short = blocks[np.searchsorted(block_end, accepted[0], side='right')]
+        strike_price = np.concatenate(candidate_strikes)[accepted[0]]
+        return {
+            'type_': type_,
+            'long_short': long_short,
+            'strike_price': strike_price,
+            'quantity': 1.
+        }
+
+
+@dataclass(frozen=True)
+class TradeIntents:
+    """Trades of one epoch of a UserPopulation, in the order in which they are to be executed."""
+    # index of the user, random users first, then trader users
+    user_index: np.ndarray
+    is_call: np.ndarray
+    is_long: np.ndarray
+    strike_index: np.ndarray
+    strike_price: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.user_index)
+
+
+class UserPopulation:
+    """
+    Many RandomUsers and TraderUsers trading with one AMM, with their parameters stored as arrays.
+
+    Intents of all users in an epoch are evaluated at once against the AMM's state at the start
+    of the epoch (a single quote surface), unlike a list of users where every user sees the trades
+    of the users before it. Random users trade as RandomUser, traders as TraderUser: every trader goes
+    through the options in its own random order (types, sides and strikes shuffled) and executes the first
+    one that passes its acceptance draw. Users are executed in a random order.
+    """
+
+    def __init__(
+            self,
+            amm: AMM,
+            trade_probabilities: ArrayLike = (),
+            volatility_adjustments: ArrayLike = (),
+            seed: Any = None,
+    ) -> None:
+        self.amm = amm
+        self.trade_probabilities = np.asarray(trade_probabilities, dtype=float).ravel()
+        self.volatility_adjustments = np.asarray(volatility_adjustments, dtype=float).ravel()
+        if (self.volatility_adjustments < -1).any():
+            raise ValueError
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.trade_probabilities) + len(self.volatility_adjustments)
+
+    def trade_intents(self, current_price: float, current_volatility: float) -> TradeIntents:
+        if not math.isclose(self.amm.current_underlying_price, current_price, rel_tol=0.00001):
+            raise ValueError(
+                f'amm current price: {self.amm.current_underlying_price}'
+                f' should be equal to current_price {current_price}'
+            )
+        rng = self._rng
+        n_random = len(self.trade_probabilities)
+        n_call_strikes, n_put_strikes = len(self.amm.call_strikes), len(self.amm.put_strikes)
+
+        # random users
+        u = rng.random((n_random, 4))
+        random_trades = u[:, 0] < self.trade_probabilities
+        random_is_call = u[:, 1] < .5
+        random_is_long = u[:, 2] < .5
+        random_strike_index = (
+            u[:, 3] * np.where(random_is_call, n_call_strikes, n_put_strikes)
+        ).astype(np.int64)
+
+        # traders, candidates are the options of all blocks (type_, long_short) next to each other
+        blocks = [(type_, long_short) for type_ in ('call', 'put') for long_short in ('long', 'short')]
+        amm_premia = self.amm.get_premia_surface()
+        adjusted_volatility = (current_volatility * (1 + self.volatility_adjustments))[:, np.newaxis]
+        trader_premia = quote_premia_surface(
+            self.amm.call_strikes,
+            self.amm.put_strikes,
+            1.,
+            call_volatility=adjusted_volatility,
+            put_volatility=adjusted_volatility,
+            call_pool_size=self.amm.call_pool_size,
+            put_pool_size=self.amm.put_pool_size,
+            underlying_price=self.amm.current_underlying_price,
+            time_till_maturity=self.amm.time_till_maturity,
+            fee_size=self.amm.FEE_SIZE,
+            alpha=self.amm.ALPHA,
+            risk_free_rate=self.amm.RISK_FREE_RATE,
+        )
+        probabilities = []
+        for type_, long_short in blocks:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                profitability = (amm_premia[(type_, long_short)] - trader_premia[(type_, long_short)])
+                profitability = profitability / trader_premia[(type_, long_short)]
+            if long_short == 'short':
+                probabilities.append(np.where(0 < profitability, profitability, 0.))
+            else:
+                probabilities.append(np.where(profitability < 0, -profitability, 0.))
+        probability = np.concatenate(probabilities, axis=-1)
+        block = np.repeat(np.arange(4), [n_call_strikes, n_call_strikes, n_put_strikes, n_put_strikes])
+        block_is_call = np.array([type_ == 'call' for type_, _ in blocks])
+        block_is_long = np.array([long_short == 'long' for _, long_short in blocks])
+        block_start = np.array([0, n_call_strikes, 2 * n_call_strikes, 2 * n_call_strikes + n_put_strikes])
+
+        # every trader's order of the candidates: blocks by shuffled types and sides, strikes shuffled within
+        n_traders = len(self.volatility_adjustments)
+        type_rank = rng.permuted(np.tile(np.arange(2), (n_traders, 1)), axis=1)
+        side_rank = rng.permuted(np.tile(np.arange(2), (n_traders, 1)), axis=1)
+        block_rank = 2 * type_rank[:, block // 2] + side_rank[:, block % 2]
+        order_key = block_rank + rng.random((n_traders, len(block)))
+        accepted = rng.random((n_traders, len(block))) < probability
+        first_accepted = np.argmin(np.where(accepted, order_key, np.inf), axis=1)
+        trader_trades = accepted.any(axis=1)
+        trader_block = block[first_accepted]
+
+        is_trading = np.concatenate((random_trades, trader_trades))
+        is_call = np.concatenate((random_is_call, block_is_call[trader_block]))
+        is_long = np.concatenate((random_is_long, block_is_long[trader_block]))
+        strike_index = np.concatenate((random_strike_index, first_accepted - block_start[trader_block]))
+
+        # users are executed in a random order
+        user_index = rng.permutation(len(self))
+        user_index = user_index[is_trading[user_index]]
+        is_call, is_long, strike_index = is_call[user_index], is_long[user_index], strike_index[user_index]
+        # both strikes are looked up for every trade, indexes of the other type are clipped
+        strike_price = np.where(
+            is_call,
+            np.asarray(self.amm.call_strikes, dtype=float)[np.minimum(strike_index, n_call_strikes - 1)],
+            np.asarray(self.amm.put_strikes, dtype=float)[np.minimum(strike_index, n_put_strikes - 1)],
+        )
+        return TradeIntents(user_index, is_call, is_long, strike_index, strike_price)
+
+    def trade(self, current_price: float, current_volatility: float) -> List[Dict[str, Any]]:
+        """Trades of the epoch in the same format as RandomUser.trade and TraderUser.trade, in execution order."""
+        intents = self.trade_intents(current_price, current_volatility)
+        return [
+            {
+                'type_': 'call' if is_call else 'put',
+                'long_short': 'long' if is_long else 'short',
+                'strike_price': strike_price,
+                'quantity': 1.
+            }
+            for is_call, is_long, strike_price in zip(
+                intents.is_call.tolist(), intents.is_long.tolist(), intents.strike_price.tolist()
+            )
+        ]
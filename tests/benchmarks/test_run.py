@@ -0,0 +1,50 @@
+"""benchmarks/run.py test file."""
+import json
+
+from benchmarks.run import compare, main, run
+
+
+TINY_SIZES = {
+    'repeat': 3,
+    'strikes': [5],
+    'book_sizes': [0, 10],
+    'series_lengths': [100],
+    'round_epochs': 5,
+}
+
+
+def test_run_reports_all_benchmarks() -> None:
+    results = run(TINY_SIZES)
+
+    assert results['meta']['sizes'] == TINY_SIZES
+    assert {'black_scholes[scalar]', 'AMM.trade[book=10]', 'AMM.clear[book=0]', 'TraderUser.trade'} <= set(
+        results['results']
+    )
+    for result in results['results'].values():
+        assert result['p50_s'] <= result['p90_s'] <= result['p99_s']
+        assert result['throughput_per_s'] > 0
+    json.dumps(results)
+
+
+def test_compare() -> None:
+    baseline = {'results': {'a': {'p50_s': 1.}, 'b': {'p50_s': 1.}}}
+    current = {'results': {'a': {'p50_s': 1.1}, 'b': {'p50_s': 2.}, 'c': {'p50_s': 5.}}}
+
+    regressions = compare(current, baseline, tolerance=0.25)
+
+    assert [regression['name'] for regression in regressions] == ['b']
+
+
+def test_main_baseline(tmp_path) -> None:
+    output = tmp_path / 'bench.json'
+    sizes = json.dumps(TINY_SIZES)
+    assert main(['--output', str(output), '--sizes', sizes, '--only', 'black_scholes']) == 0
+
+    baseline = json.loads(output.read_text())
+    for result in baseline['results'].values():
+        result['p50_s'] /= 1000
+    (tmp_path / 'baseline.json').write_text(json.dumps(baseline))
+    assert main([
+        '--output', str(output), '--sizes', sizes, '--only', 'black_scholes',
+        '--baseline', str(tmp_path / 'baseline.json')
+    ]) == 1
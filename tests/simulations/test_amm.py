@@ -1,10 +1,15 @@
 """simulations/option.py test file."""
 import math
+import numpy as np
 import pytest
 from unittest.mock import MagicMock
 
 from simulations.option import Option
-from simulations.amm import AMM, black_scholes, NotEnoughPoolCapitalError
+from simulations.amm import (
+    AMM, AMMSnapshot, black_scholes, black_scholes_greeks, NotEnoughPoolCapitalError, quote_premia,
+    TRADE_EXECUTED, TRADE_NOT_ENOUGH_CAPITAL, TRADE_NOT_RUN
+)
+from simulations.timing import StageTimer
 
 
 REVERSE_SIDE = {'long': 'short', 'short': 'long'}
@@ -35,6 +40,22 @@ def test_black_scholes(
     assert math.isclose(put_premia, expected_put_premia, rel_tol=0.001)
 
 
+def test_black_scholes_vectorized() -> None:
+    vol = np.array([.2, .2, .02])
+    s = np.array([100., 100., 100.])
+    k = np.array([100., 100., 100.])
+    r = np.array([.2, .2, 0.])
+    t = np.array([0.128767, 0.257534, 100])
+
+    call_premia, put_premia = black_scholes(vol=vol, s=s, k=k, r=r, t=t)
+
+    assert call_premia.shape == (3,)
+    for i in range(3):
+        expected_call_premia, expected_put_premia = black_scholes(vol=vol[i], s=s[i], k=k[i], r=r[i], t=t[i])
+        assert math.isclose(call_premia[i], expected_call_premia, rel_tol=1e-12)
+        assert math.isclose(put_premia[i], expected_put_premia, rel_tol=1e-12)
+
+
 def test_amm_init() -> None:
     amm = AMM(time_till_maturity=10., current_underlying_price=1.)
 
@@ -164,6 +185,110 @@ def test_get_premia(
         rel_tol=0.0001
     )
 
+def test_get_premia_surface() -> None:
+    amm = AMM(
+        time_till_maturity=100.,
+        current_underlying_price=105.,
+        call_strikes=[float(x) for x in range(90, 160, 10)],
+        put_strikes=[float(x) for x in range(50, 120, 10)],
+        call_volatility=0.01,
+        put_volatility=0.02,
+        call_pool_size=100,
+        put_pool_size=10_000,
+    )
+    quantities = [1., 2., 5.]
+
+    surface = amm.get_premia_surface(quantities)
+
+    assert set(surface) == {('call', 'long'), ('call', 'short'), ('put', 'long'), ('put', 'short')}
+    for (type_, long_short), premia in surface.items():
+        strikes = amm.call_strikes if type_ == 'call' else amm.put_strikes
+        assert premia.shape == (len(quantities), len(strikes))
+        for i, quantity in enumerate(quantities):
+            for j, strike in enumerate(strikes):
+                assert math.isclose(
+                    premia[i, j],
+                    amm.get_premia(strike, type_, long_short, quantity),
+                    rel_tol=1e-9
+                )
+
+    assert amm.get_premia_surface()[('put', 'short')].shape == (len(amm.put_strikes),)
+
+
+@pytest.mark.parametrize('type_', ['call', 'put'])
+@pytest.mark.parametrize('long_short', ['long', 'short'])
+def test_quote_premia(type_: str, long_short: str) -> None:
+    amm = AMM(
+        time_till_maturity=100.,
+        current_underlying_price=105.,
+        call_strikes=[float(x) for x in range(90, 160, 10)],
+        put_strikes=[float(x) for x in range(50, 120, 10)],
+        call_volatility=0.01,
+        put_volatility=0.02,
+        call_pool_size=100,
+        put_pool_size=10_000,
+    )
+    strikes = np.array(amm.call_strikes if type_ == 'call' else amm.put_strikes)
+
+    premia = quote_premia(
+        strikes,
+        type_,
+        long_short,
+        2.,
+        volatility=amm.call_volatility if type_ == 'call' else amm.put_volatility,
+        pool_size=amm.call_pool_size if type_ == 'call' else amm.put_pool_size,
+        underlying_price=amm.current_underlying_price,
+        time_till_maturity=amm.time_till_maturity,
+        fee_size=amm.FEE_SIZE,
+        alpha=amm.ALPHA,
+        risk_free_rate=amm.RISK_FREE_RATE,
+    )
+
+    for strike, strike_premia in zip(strikes, premia):
+        assert math.isclose(strike_premia, amm.get_premia(strike, type_, long_short, 2.), rel_tol=1e-12)
+
+
+def test_get_premia_cache() -> None:
+    amm = AMM(
+        time_till_maturity=100.,
+        current_underlying_price=100.,
+        call_strikes=[float(x) for x in range(90, 160, 10)],
+        put_strikes=[float(x) for x in range(50, 120, 10)],
+        call_volatility=0.01,
+        put_volatility=0.01,
+        call_pool_size=100,
+        put_pool_size=10_000,
+    )
+    call_premia = amm.get_premia(100., 'call', 'long')
+    put_premia = amm.get_premia(90., 'put', 'short')
+    assert (amm.quote_cache_hits, amm.quote_cache_misses) == (0, 2)
+
+    assert amm.get_premia(100., 'call', 'long') == call_premia
+    assert amm.get_premia(90., 'put', 'short') == put_premia
+    assert (amm.quote_cache_hits, amm.quote_cache_misses) == (2, 2)
+
+    # trade in the call pool keeps the put quotes
+    amm.trade(strike_price=110., type_='call', long_short='long', quantity=1.)
+    assert amm.get_premia(90., 'put', 'short') == put_premia
+    assert amm.quote_cache_hits == 3
+    new_call_premia = amm.get_premia(100., 'call', 'long')
+    assert amm.quote_cache_hits == 3
+    assert new_call_premia > call_premia
+    assert math.isclose(new_call_premia, amm._calculate_premia(100., 'call', 'long'), rel_tol=1e-12)
+
+    # new epoch invalidates everything
+    amm.next_epoch(time_till_maturity=99., current_underlying_price=100.)
+    hits = amm.quote_cache_hits
+    amm.get_premia(90., 'put', 'short')
+    amm.get_premia(100., 'call', 'long')
+    assert amm.quote_cache_hits == hits
+
+    # direct changes of the state are picked up as well
+    amm.put_volatility = 0.02
+    assert math.isclose(amm.get_premia(90., 'put', 'short'), amm._calculate_premia(90., 'put', 'short'))
+    assert amm.quote_cache_hits == hits
+
+
 @pytest.mark.parametrize(
     'strike_price, long_short, quantity, expected_call_volatility, expected_call_pool_size',
     [
@@ -877,3 +1002,328 @@ def test_clear(
     assert math.isclose(amm.time_till_maturity, 0., rel_tol=0.00001)
     assert math.isclose(amm.current_underlying_price, current_underlying_price, rel_tol=0.00001)
 
+
+
+def test_clear_many_options() -> None:
+    rng = np.random.default_rng(0)
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    call_options = [
+        Option(
+            strike_price=float(strike), type_='call', long_short=long_short,
+            locked_capital=float(quantity) if long_short == 'short' else 0., quantity=float(quantity)
+        )
+        for strike, long_short, quantity in zip(
+            rng.choice(amm.call_strikes, 1000), rng.choice(['long', 'short'], 1000), rng.uniform(0, 2, 1000)
+        )
+    ]
+    put_options = [
+        Option(
+            strike_price=float(strike), type_='put', long_short=long_short,
+            locked_capital=float(quantity * strike) if long_short == 'short' else 0., quantity=float(quantity)
+        )
+        for strike, long_short, quantity in zip(
+            rng.choice(amm.put_strikes, 1000), rng.choice(['long', 'short'], 1000), rng.uniform(0, 2, 1000)
+        )
+    ]
+    amm.call_issued_options = call_options
+    amm.put_issued_options = put_options
+
+    price = 1.05
+    expected_call_pool_size = amm.call_pool_size
+    for option in call_options:
+        value = option.quantity * max(price - option.strike_price, 0.) / price
+        expected_call_pool_size += value if option.long_short == 'long' else option.locked_capital - value
+    expected_put_pool_size = amm.put_pool_size
+    for option in put_options:
+        value = option.quantity * max(option.strike_price - price, 0.)
+        expected_put_pool_size += value if option.long_short == 'long' else option.locked_capital - value
+
+    amm.next_epoch(time_till_maturity=0., current_underlying_price=price)
+    amm.clear()
+
+    assert math.isclose(amm.call_pool_size, expected_call_pool_size, rel_tol=1e-9)
+    assert math.isclose(amm.put_pool_size, expected_put_pool_size, rel_tol=1e-9)
+    assert not amm.call_issued_options
+    assert not amm.put_issued_options
+
+
+def _trade_randomly(amm: AMM, rng: np.random.Generator, n_trades: int) -> None:
+    for _ in range(n_trades):
+        type_ = rng.choice(['call', 'put'])
+        strikes = amm.call_strikes if type_ == 'call' else amm.put_strikes
+        try:
+            amm.trade(float(rng.choice(strikes)), type_, rng.choice(['long', 'short']), float(rng.uniform(0, 2)))
+        except NotEnoughPoolCapitalError:
+            pass
+
+
+def test_fork_is_independent() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    _trade_randomly(amm, np.random.default_rng(0), 200)
+    state = amm.to_dict()
+
+    forked = amm.fork()
+    assert forked.to_dict() == state
+    _trade_randomly(forked, np.random.default_rng(1), 50)
+    forked.call_strikes = list(forked.call_strikes) + [2.]
+    assert amm.to_dict() == state
+
+    forked_state = forked.to_dict()
+    _trade_randomly(amm, np.random.default_rng(2), 50)
+    assert forked.to_dict() == forked_state
+
+
+def test_snapshot_restore() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    _trade_randomly(amm, np.random.default_rng(0), 200)
+    amm.next_epoch(time_till_maturity=99., current_underlying_price=1.01)
+    snapshot = AMMSnapshot.from_bytes(amm.snapshot().to_bytes())
+
+    restored = AMM.from_snapshot(snapshot)
+    assert restored.to_dict() == amm.to_dict()
+    assert restored.epoch == amm.epoch
+
+    _trade_randomly(amm, np.random.default_rng(1), 100)
+    _trade_randomly(restored, np.random.default_rng(1), 100)
+    assert restored.to_dict() == amm.to_dict()
+
+    restored.restore(snapshot)
+    assert AMM.from_snapshot(snapshot).to_dict() == restored.to_dict()
+
+
+def test_black_scholes_scalar_same_as_vectorized() -> None:
+    rng = np.random.default_rng(0)
+    vol, s = rng.uniform(.01, 1., 100), rng.uniform(.5, 2., 100)
+    k, t = rng.uniform(.2, 2., 100), rng.uniform(1, 500, 100)
+    call_premia, put_premia = black_scholes(vol, s, k, .01, t)
+    for i in range(100):
+        scalar_call_premia, scalar_put_premia = black_scholes(float(vol[i]), float(s[i]), float(k[i]), .01, float(t[i]))
+        assert math.isclose(scalar_call_premia, call_premia[i], rel_tol=1e-12, abs_tol=1e-15)
+        assert math.isclose(scalar_put_premia, put_premia[i], rel_tol=1e-12, abs_tol=1e-15)
+
+
+def test_black_scholes_greeks() -> None:
+    vol, s, k, r, t = .2, 100., np.array([80., 100., 120.]), .05, .5
+    call_delta, put_delta, gamma, vega = black_scholes_greeks(vol, s, k, r, t)
+
+    h = 1e-4
+    call_up, put_up = black_scholes(vol, s + h, k, r, t)
+    call_down, put_down = black_scholes(vol, s - h, k, r, t)
+    call, _ = black_scholes(vol, s, k, r, t)
+    np.testing.assert_allclose(call_delta, (call_up - call_down) / 2 / h, rtol=1e-6)
+    np.testing.assert_allclose(put_delta, (put_up - put_down) / 2 / h, rtol=1e-6)
+    np.testing.assert_allclose(gamma, (call_up - 2 * call + call_down) / h ** 2, rtol=1e-3)
+    vega_up, _ = black_scholes(vol + h, s, k, r, t)
+    vega_down, _ = black_scholes(vol - h, s, k, r, t)
+    np.testing.assert_allclose(vega, (vega_up - vega_down) / 2 / h, rtol=1e-6)
+
+
+def test_get_exposure() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., record_exposure=True)
+    _trade_randomly(amm, np.random.default_rng(0), 200)
+
+    exposure = amm.get_exposure()
+    for type_, options, volatility in (
+            ('call', amm.call_issued_options, amm.call_volatility),
+            ('put', amm.put_issued_options, amm.put_volatility),
+    ):
+        expected = {'delta': 0., 'gamma': 0., 'vega': 0.}
+        for option in options:
+            call_delta, put_delta, gamma, vega = black_scholes_greeks(
+                volatility, 1., option.strike_price, 0., 100.
+            )
+            sign = 1 if option.long_short == 'long' else -1
+            expected['delta'] += sign * option.quantity * (call_delta if type_ == 'call' else put_delta)
+            expected['gamma'] += sign * option.quantity * gamma
+            expected['vega'] += sign * option.quantity * vega
+        for greek, value in expected.items():
+            assert math.isclose(exposure[f'{type_}_{greek}'], value, rel_tol=1e-9, abs_tol=1e-9)
+
+    amm.next_epoch(time_till_maturity=99., current_underlying_price=1.1)
+    amm.next_epoch(time_till_maturity=98., current_underlying_price=1.2)
+    assert amm.exposure_series['epoch'].tolist() == [0, 1]
+    assert amm.exposure_series['call_delta'][0] == exposure['call_delta']
+    assert AMM(time_till_maturity=100., current_underlying_price=1.).exposure_series is None
+
+
+def test_get_nav() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., record_nav=True, series_capacity=1)
+    initial_nav = amm.get_nav()
+    assert initial_nav == {'call_nav': 100., 'put_nav': 100.}
+    _trade_randomly(amm, np.random.default_rng(0), 200)
+
+    nav = amm.get_nav()
+    expected = {'call_nav': amm.call_pool_size, 'put_nav': amm.put_pool_size}
+    for option in amm.call_issued_options + amm.put_issued_options:
+        call_premia, put_premia = black_scholes(
+            amm.call_volatility if option.type_ == 'call' else amm.put_volatility, 1., option.strike_price, 0., 100.
+        )
+        value = option.quantity * (call_premia if option.type_ == 'call' else put_premia)
+        if option.long_short == 'long':
+            expected[f'{option.type_}_nav'] += value
+        else:
+            expected[f'{option.type_}_nav'] += option.locked_capital - value
+    for key, value in expected.items():
+        assert math.isclose(nav[key], value, rel_tol=1e-9)
+
+    for epoch in range(1, 4):
+        amm.next_epoch(time_till_maturity=100. - epoch, current_underlying_price=1. + epoch / 100)
+    amm.next_epoch(time_till_maturity=0., current_underlying_price=1.05)
+    assert amm.nav_series['epoch'].tolist() == [0, 1, 2, 3]
+    assert amm.nav_series['call_nav'][0] == nav['call_nav']
+
+    nav_at_maturity = amm.get_nav()
+    amm.clear()
+    assert math.isclose(nav_at_maturity['call_nav'], amm.call_pool_size, rel_tol=1e-9)
+    assert math.isclose(nav_at_maturity['put_nav'], amm.put_pool_size, rel_tol=1e-9)
+    assert amm.get_nav() == {'call_nav': amm.call_pool_size, 'put_nav': amm.put_pool_size}
+
+
+def test_fee_size_and_alpha_override() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., fee_size=0.05, alpha=2)
+    assert (amm.FEE_SIZE, amm.ALPHA) == (0.05, 2)
+    assert (AMM.FEE_SIZE, AMM.ALPHA) == (0.03, 1)
+    expected = quote_premia(1.2, 'call', 'long', 1., 0.1, 100, 1., 100., 0.05, 2, 0.)
+    assert math.isclose(amm.get_premia(1.2, 'call', 'long'), expected)
+
+    restored = AMM.from_snapshot(amm.snapshot())
+    assert (restored.FEE_SIZE, restored.ALPHA) == (0.05, 2)
+
+
+@pytest.mark.parametrize('timed', [False, True])
+@pytest.mark.parametrize('on_not_enough_capital', ['skip', 'stop'])
+def test_trade_batch(on_not_enough_capital: str, timed: bool) -> None:
+    rng = np.random.default_rng(0)
+    n_orders = 300
+    is_call = rng.random(n_orders) < .5
+    is_long = rng.random(n_orders) < .8
+    call_strikes = [x / 10 for x in range(9, 20)]
+    put_strikes = [x / 10 for x in range(2, 12)]
+    strike_price = np.where(is_call, rng.choice(call_strikes, n_orders), rng.choice(put_strikes, n_orders))
+    # some strikes are accepted off the grid
+    strike_price += rng.choice([0., 0., -0.0004, 0.0006], n_orders)
+    quantity = rng.uniform(0, 2, n_orders)
+
+    # small pools, so that some orders are rejected
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., call_pool_size=5, put_pool_size=5)
+    # timing the stages of every order does not change the results
+    amm.timer = StageTimer() if timed else None
+    expected_amm = AMM(time_till_maturity=100., current_underlying_price=1., call_pool_size=5, put_pool_size=5)
+    result = amm.trade_batch(strike_price, is_call, is_long, quantity, on_not_enough_capital=on_not_enough_capital)
+
+    stopped = False
+    for i in range(n_orders):
+        if stopped:
+            assert result.status[i] == TRADE_NOT_RUN
+            assert np.isnan(result.premia[i]) and np.isnan(result.volatility[i])
+            continue
+        type_ = 'call' if is_call[i] else 'put'
+        long_short = 'long' if is_long[i] else 'short'
+        premia = expected_amm.get_premia(strike_price[i], type_, long_short)
+        try:
+            expected_amm.trade(strike_price[i], type_, long_short, quantity[i])
+            assert result.status[i] == TRADE_EXECUTED
+            assert result.premia[i] == premia
+        except NotEnoughPoolCapitalError:
+            assert result.status[i] == TRADE_NOT_ENOUGH_CAPITAL
+            assert np.isnan(result.premia[i])
+            stopped = on_not_enough_capital == 'stop'
+        volatility = expected_amm.call_volatility if type_ == 'call' else expected_amm.put_volatility
+        assert result.volatility[i] == volatility
+
+    assert (result.status == TRADE_NOT_ENOUGH_CAPITAL).any()
+    assert amm.to_dict() == expected_amm.to_dict()
+
+    with pytest.raises(ValueError):
+        amm.trade_batch([1.05], [True], [True])
+    with pytest.raises(ValueError):
+        amm.trade_batch([1.], [True], [True], on_not_enough_capital='raise')
+
+
+def test_fine_strike_grid() -> None:
+    call_strikes = np.round(0.5 + 0.01 * np.arange(2_000), 2)
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., call_strikes=call_strikes[::-1])
+    assert amm.call_strikes.tolist() == call_strikes[::-1].tolist()
+    duplicated = AMM(time_till_maturity=100., current_underlying_price=1., call_strikes=[1., 1.2, 1.])
+    assert duplicated.call_strikes.tolist() == [1., 1.2]
+    with pytest.raises(ValueError):
+        amm.call_strikes[0] = 1.
+
+    amm.trade(1.2305, 'call', 'long', 1.)
+    amm.trade(1.2305, 'call', 'long', 1.)
+    amm.trade(1.5, 'call', 'short', 1.)
+    with pytest.raises(ValueError):
+        amm.trade(1.235, 'call', 'long', 1.)
+
+    assert amm.call_issued_options[0].strike_price == 1.2305
+    strikes, net_quantity = amm._call_book.net_quantities()
+    assert strikes.tolist() == [1.2305, 1.5]
+    assert net_quantity.tolist() == [-2., 1.]
+
+
+@pytest.mark.parametrize('strike_price, type_, long_short, price', [
+    (1.2009, 'call', 'long', 2.),
+    (1.2009, 'call', 'short', 2.),
+    (0.7009, 'put', 'long', 0.5),
+    (0.7009, 'put', 'short', 0.5),
+])
+def test_exposure_and_nav_of_strikes_off_the_grid(
+        strike_price: float, type_: str, long_short: str, price: float
+) -> None:
+    amm = AMM(time_till_maturity=10., current_underlying_price=1.)
+    amm.trade(strike_price, type_, long_short, 1.)
+    amm.trade(round(strike_price, 1), type_, long_short, 1.)
+    # greeks are those of the options' own strikes
+    strikes, net_quantity = amm._get_book(type_).net_quantities()
+    assert strikes.tolist() == [strike_price, round(strike_price, 1)]
+    call_delta, put_delta, _, _ = black_scholes_greeks(
+        amm.put_volatility if type_ == 'put' else amm.call_volatility, 1., strikes, AMM.RISK_FREE_RATE, 10.
+    )
+    delta = float(net_quantity @ (call_delta if type_ == 'call' else put_delta))
+    assert amm.get_exposure()[f'{type_}_delta'] == delta
+
+    amm.next_epoch(0., price)
+    nav = amm.get_nav()
+    amm.clear()
+    assert math.isclose(nav['call_nav'], amm.call_pool_size, rel_tol=1e-12)
+    assert math.isclose(nav['put_nav'], amm.put_pool_size, rel_tol=1e-12)
+
+
+def test_trades_matched_by_listed_strike() -> None:
+    # 1.2006 and 1.2004 are both accepted as the listed strike 1.2 and net against each other
+    amm = AMM(time_till_maturity=10., current_underlying_price=1.)
+    amm.trade(1.2006, 'call', 'long', 1.)
+    amm.trade(1.2004, 'call', 'short', 1.)
+    assert amm.call_issued_options == []
+    assert math.isclose(amm.call_pool_size, 100.0036, abs_tol=1e-4)
+
+    amm.trade(1.2006, 'call', 'long', 1.)
+    amm.trade(1.1996, 'call', 'long', 1.)
+    assert [option.strike_price for option in amm.call_issued_options] == [1.2006, 1.1996]
+    restored = AMM.from_snapshot(amm.snapshot())
+    restored.trade(1.2, 'call', 'short', 2.)
+    assert restored.call_issued_options == []
+
+
+def test_trade_at_maturity() -> None:
+    amm = AMM(time_till_maturity=0., current_underlying_price=1.)
+    with pytest.raises(ValueError):
+        amm.trade(1.0, 'call', 'long', 1.)
+    with pytest.raises(ValueError):
+        amm.trade_batch([1.0], [True], [True])
+    with pytest.raises(ValueError):
+        amm.get_premia_surface()
+    assert amm.call_pool_size == 100
+    assert amm.call_issued_options == []
+
+    amm = AMM(time_till_maturity=10., current_underlying_price=1.)
+    amm.trade(1.0, 'put', 'long', 1.)
+    amm.next_epoch(0., 1.)
+    put_pool_size = amm.put_pool_size
+    with pytest.raises(ValueError):
+        amm.trade(1.0, 'put', 'short', 1.)
+    assert amm.put_pool_size == put_pool_size
+    with pytest.raises(ValueError):
+        black_scholes(0., 1., 1., 0., 1.)
+    with pytest.raises(ValueError):
+        black_scholes(np.array([.1, .2]), 1., 1., 0., 0.)
@@ -0,0 +1,161 @@
+"""simulations/engine.py test file."""
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from simulations.amm import AMM, NotEnoughPoolCapitalError
+from simulations.engine import EngineConnection, MarketEngine, run_clients, simulated_client
+
+
+def _amm(**kwargs) -> AMM:
+    return AMM(time_till_maturity=100., current_underlying_price=1., **kwargs)
+
+
+def test_serialized_batches() -> None:
+    amm = _amm()
+    expected_amm = amm.fork()
+    orders = [(1.2, 'call', 'long'), (0.5, 'put', 'short'), (1.4, 'call', 'short'), (0.9, 'put', 'long')] * 5
+
+    async def run():
+        async with MarketEngine({'eth': amm}, max_batch_size=8) as engine:
+            # all orders are submitted before the worker takes the first batch
+            trades = [engine.trade('eth', *order) for order in orders]
+            quote = engine.quote('eth', 1.2, 'call', 'long')
+            results = await asyncio.gather(*trades, quote)
+        return engine, results
+
+    engine, results = asyncio.run(run())
+
+    expected = []
+    for strike_price, type_, long_short in orders:
+        expected.append(expected_amm.get_premia(strike_price, type_, long_short))
+        expected_amm.trade(strike_price, type_, long_short, 1.)
+    expected.append(expected_amm.get_premia(1.2, 'call', 'long'))
+    assert results == pytest.approx(expected, rel=1e-12)
+    assert amm.call_volatility == expected_amm.call_volatility
+    assert amm.put_pool_size == expected_amm.put_pool_size
+
+    report = engine.report()
+    assert report.loc['eth', 'trades'] == 20
+    assert report.loc['eth', 'quotes'] == 1
+    assert report.loc['eth', 'batches'] == 3
+    assert report.loc['eth', 'mean_batch_size'] == 7
+    assert report.loc['eth', 'throughput_per_s'] > 0
+    assert report.loc['eth', 'trade_p50_us'] <= report.loc['eth', 'trade_p99_us']
+    counts, edges = engine.latency_histogram('eth', 'trade', bins=10)
+    assert counts.sum() == 20
+    assert len(edges) == 11
+
+
+def test_invalid_and_rejected_requests() -> None:
+    amm = _amm(call_pool_size=0.01)
+
+    async def run():
+        async with MarketEngine({'eth': amm}) as engine:
+            with pytest.raises(ValueError):
+                await engine.trade('eth', 1.25, 'call', 'long')
+            with pytest.raises(ValueError):
+                await engine.quote('eth', 1.2, 'calls', 'long')
+            with pytest.raises(KeyError):
+                await engine.trade('btc', 1.2, 'call', 'long')
+            with pytest.raises(NotEnoughPoolCapitalError):
+                await engine.trade('eth', 1., 'call', 'long')
+            # the rejection does not stop the market
+            await engine.trade('eth', 1.9, 'call', 'short')
+        return engine
+
+    engine = asyncio.run(run())
+    assert engine.report().loc['eth', 'rejected'] == 1
+    assert len(amm.call_issued_options) == 1
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.trade('eth', 1.2, 'call', 'long'))
+
+
+def test_run_clients() -> None:
+    markets = {'eth': _amm(), 'btc': _amm(call_pool_size=1_000., put_pool_size=1_000.)}
+
+    async def run():
+        async with MarketEngine(markets) as engine:
+            results = await run_clients(engine, n_clients=6, n_requests=20, seed=0)
+        return engine, results
+
+    engine, results = asyncio.run(run())
+    assert len(results) == 6
+    assert all(result.trades + result.rejected == 20 for result in results)
+
+    report = engine.report()
+    assert report.index.tolist() == ['eth', 'btc']
+    assert report['trades'].sum() == 120
+    assert report['quotes'].sum() == sum(result.quotes for result in results)
+    assert report['rejected'].sum() == sum(result.rejected for result in results)
+    # concurrent clients are served in batches
+    assert (report['mean_batch_size'] > 1).all()
+    issued = sum(len(amm.call_issued_options) + len(amm.put_issued_options) for amm in markets.values())
+    assert 0 < issued <= report['trades'].sum() - report['rejected'].sum()
+
+
+def test_endpoint() -> None:
+    amm = _amm()
+    expected_amm = amm.fork()
+
+    async def run():
+        async with MarketEngine({'eth': amm}) as engine:
+            server = await engine.serve()
+            host, port = server.sockets[0].getsockname()[:2]
+            connection = await EngineConnection.open(host, port)
+            try:
+                premia = await connection.trade('eth', 1.2, 'call', 'long')
+                with pytest.raises(ValueError):
+                    await connection.quote('eth', 1.25, 'call', 'long')
+                with pytest.raises(KeyError):
+                    await connection.trade('btc', 1.2, 'call', 'long')
+                result = await simulated_client(
+                    connection, 'eth', amm.call_strikes, amm.put_strikes, n_requests=10, seed=1
+                )
+            finally:
+                await connection.close()
+                server.close()
+                await server.wait_closed()
+        return premia, result
+
+    premia, result = asyncio.run(run())
+    assert premia == expected_amm.get_premia(1.2, 'call', 'long')
+    assert result.trades + result.rejected == 10
+    assert np.isfinite(amm.call_volatility)
+
+
+def test_endpoint_malformed_requests() -> None:
+    engine = MarketEngine({'eth': _amm()})
+
+    async def run():
+        await engine.start()
+        server = await engine.serve()
+        host, port = server.sockets[0].getsockname()[:2]
+        reader, writer = await asyncio.open_connection(host, port)
+        lines = [
+            b'{"op": "trade", "market": "eth", "strike_price": null, "type_": "call", "long_short": "long"}\n',
+            b'[1, 2]\n',
+            b'not json\n',
+            b'{"op": "trade", "market": "eth", "strike_price": 1.2, "type_": "call", "long_short": "long"}\n',
+        ]
+        responses = []
+        for line in lines:
+            writer.write(line)
+            responses.append(json.loads(await reader.readline()))
+        await engine.stop()
+        # the connection is still answered after the engine was stopped
+        writer.write(lines[-1])
+        responses.append(json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    responses = asyncio.run(run())
+    assert [response.get('error') for response in responses] == [
+        'TypeError', 'TypeError', 'ValueError', None, 'RuntimeError'
+    ]
+    assert responses[3]['premia'] > 0.
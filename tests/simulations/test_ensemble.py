@@ -0,0 +1,96 @@
+"""simulations/ensemble.py test file."""
+import math
+
+import numpy as np
+import pytest
+
+from simulations.amm import AMM, NotEnoughPoolCapitalError
+from simulations.ensemble import EnsembleAMM
+
+
+def test_ensemble_init() -> None:
+    ensemble = EnsembleAMM(n_pools=3, time_till_maturity=10., current_underlying_price=[1., 1.1, 1.2])
+
+    assert ensemble.call_volatility.shape == (3,)
+    assert np.allclose(ensemble.put_pool_size, 100.)
+    assert ensemble.position_quantity['call'].shape == (3, 11, 2)
+    assert ensemble.position_quantity['put'].shape == (3, 10, 2)
+
+    with pytest.raises(ValueError):
+        ensemble.next_epoch(time_till_maturity=-1., current_underlying_price=1.)
+    with pytest.raises(ValueError):
+        ensemble.next_epoch(time_till_maturity=1., current_underlying_price=[1., 0., 1.])
+
+
+def test_ensemble_matches_scalar_amms() -> None:
+    n_pools = 6
+    epochs = 60
+    rng = np.random.default_rng(5)
+    prices = np.cumprod(1 + rng.normal(0, 0.02, (epochs, n_pools)), axis=0)
+    pool_sizes = dict(call_pool_size=[100., 100., 3., 100., 100., 100.], put_pool_size=[100., 100., 100., 2., 100., 100.])
+
+    ensemble = EnsembleAMM(n_pools=n_pools, time_till_maturity=epochs, current_underlying_price=1., **pool_sizes)
+    amms = [
+        AMM(
+            time_till_maturity=epochs,
+            current_underlying_price=1.,
+            call_pool_size=pool_sizes['call_pool_size'][i],
+            put_pool_size=pool_sizes['put_pool_size'][i],
+        )
+        for i in range(n_pools)
+    ]
+
+    rejected = 0
+    for epoch in range(epochs):
+        time_till_maturity = epochs - epoch
+        ensemble.next_epoch(time_till_maturity, prices[epoch])
+        for amm, price in zip(amms, prices[epoch]):
+            amm.next_epoch(time_till_maturity, price)
+
+        for _ in range(2):
+            mask = rng.random(n_pools) < 0.8
+            is_call = rng.random(n_pools) < 0.5
+            is_long = rng.random(n_pools) < 0.5
+            strike_index = np.where(is_call, rng.integers(0, 11, n_pools), rng.integers(0, 10, n_pools))
+            quantity = rng.choice([0.5, 1., 2.], n_pools)
+
+            surface = ensemble.get_premia_surface()
+            executed, premia = ensemble.trade(mask, strike_index, is_call, is_long, quantity)
+
+            for i, amm in enumerate(amms):
+                type_ = 'call' if is_call[i] else 'put'
+                long_short = 'long' if is_long[i] else 'short'
+                strikes = amm.call_strikes if is_call[i] else amm.put_strikes
+                assert math.isclose(
+                    surface[(type_, long_short)][i, strike_index[i]],
+                    amm.get_premia(strikes[strike_index[i]], type_, long_short),
+                    rel_tol=1e-9
+                )
+                if not mask[i]:
+                    assert not executed[i]
+                    continue
+                try:
+                    amm.trade(strikes[strike_index[i]], type_, long_short, quantity[i])
+                except NotEnoughPoolCapitalError:
+                    rejected += 1
+                    assert not executed[i]
+                    assert np.isnan(premia[i])
+                else:
+                    assert executed[i]
+
+            for i, amm in enumerate(amms):
+                assert math.isclose(ensemble.call_volatility[i], amm.call_volatility, rel_tol=1e-9)
+                assert math.isclose(ensemble.put_volatility[i], amm.put_volatility, rel_tol=1e-9)
+                assert math.isclose(ensemble.call_pool_size[i], amm.call_pool_size, rel_tol=1e-9)
+                assert math.isclose(ensemble.put_pool_size[i], amm.put_pool_size, rel_tol=1e-9)
+    assert rejected > 0
+
+    ensemble.next_epoch(0., prices[-1])
+    ensemble.clear()
+    for i, amm in enumerate(amms):
+        amm.next_epoch(0., prices[-1, i])
+        amm.clear()
+        assert math.isclose(ensemble.call_pool_size[i], amm.call_pool_size, rel_tol=1e-9)
+        assert math.isclose(ensemble.put_pool_size[i], amm.put_pool_size, rel_tol=1e-9)
+    assert not ensemble.position_count['call'].any()
+    assert not ensemble.position_quantity['put'].any()
@@ -0,0 +1,46 @@
+"""simulations/implied_volatility.py test file."""
+import numpy as np
+import pytest
+
+from simulations.amm import AMM, black_scholes, get_new_volatility
+from simulations.implied_volatility import implied_volatility
+
+
+@pytest.mark.parametrize('type_', ['call', 'put'])
+def test_implied_volatility_surface(type_: str) -> None:
+    rng = np.random.default_rng(0)
+    volatility = rng.uniform(0.005, 0.5, (50, 1))
+    s = rng.uniform(0.8, 1.2, (50, 1))
+    k = np.linspace(0.5, 1.9, 15)
+    t = rng.uniform(1., 500., (50, 1))
+    call_premia, put_premia = black_scholes(volatility, s, k, 0., t)
+    premia = call_premia / s if type_ == 'call' else put_premia
+
+    result = implied_volatility(premia, type_, s, k, 0., t)
+    # premia with (almost) no time value do not determine the volatility
+    time_value = call_premia - np.maximum(s - k, 0.) if type_ == 'call' else put_premia - np.maximum(k - s, 0.)
+    determined = time_value > 1e-6
+    assert result.volatility.shape == (50, 15)
+    assert result.converged[determined].all()
+    np.testing.assert_allclose(
+        result.volatility[determined], np.broadcast_to(volatility, (50, 15))[determined], rtol=1e-6
+    )
+    assert result.iterations[determined].max() < 30
+
+
+def test_implied_volatility_invalid_premia() -> None:
+    result = implied_volatility([-1., 0., 1.5, 0.05], 'call', 1., 1., 0., 100.)
+    assert np.isnan(result.volatility[:3]).all()
+    assert not result.converged[:3].any()
+    assert (result.iterations[:3] == 0).all()
+    assert result.converged[3]
+
+
+def test_implied_volatility_of_amm_quote() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    premia = amm.get_premia(1.2, 'call', 'long')
+    result = implied_volatility(premia / (1 + AMM.FEE_SIZE), 'call', 1., 1.2, 0., 100.)
+    # trades are priced at the mean of the volatility before and after the trade
+    new_volatility = get_new_volatility(amm.call_volatility, amm.call_pool_size, 'call', 'long', 1., 1., AMM.ALPHA)
+    assert result.converged
+    assert np.isclose(result.volatility, (amm.call_volatility + new_volatility) / 2, rtol=1e-9)
@@ -0,0 +1,71 @@
+"""simulations/journal.py test file."""
+import math
+
+import numpy as np
+import pytest
+
+from simulations.amm import AMM
+from simulations.journal import LONG_SHORT_CODES, TYPE_CODES, TradeJournal, load_journal
+
+
+def _trade_many(amm: AMM, n_epochs: int) -> list:
+    trades = []
+    for epoch in range(n_epochs):
+        amm.next_epoch(time_till_maturity=100. - epoch, current_underlying_price=1. + epoch / 100)
+        for strike_price, type_, long_short in [(1., 'call', 'long'), (.9, 'put', 'short'), (1.1, 'call', 'short')]:
+            volatility_before = amm.call_volatility if type_ == 'call' else amm.put_volatility
+            premia = amm.get_premia(strike_price, type_, long_short)
+            amm.trade(strike_price, type_, long_short, quantity=1.)
+            trades.append((amm.epoch, strike_price, type_, long_short, premia, volatility_before,
+                           amm.call_volatility if type_ == 'call' else amm.put_volatility,
+                           amm.call_pool_size if type_ == 'call' else amm.put_pool_size))
+    return trades
+
+
+def _assert_columns(columns: dict, trades: list) -> None:
+    assert len(columns['epoch']) == len(trades)
+    for i, (epoch, strike_price, type_, long_short, premia, vol_before, vol_after, pool_size) in enumerate(trades):
+        assert columns['epoch'][i] == epoch
+        assert columns['strike_price'][i] == strike_price
+        assert columns['type_'][i] == TYPE_CODES[type_]
+        assert columns['long_short'][i] == LONG_SHORT_CODES[long_short]
+        assert columns['quantity'][i] == 1.
+        assert math.isclose(columns['premia'][i], premia)
+        assert columns['volatility_before'][i] == vol_before
+        assert columns['volatility_after'][i] == vol_after
+        assert columns['pool_size_after'][i] == pool_size
+
+
+def test_journal_on_disk(tmp_path) -> None:
+    journal = TradeJournal(directory=str(tmp_path / 'journal'), buffer_size=4)
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., journal=journal)
+
+    trades = _trade_many(amm, 5)
+    assert len(journal) == 15
+
+    # unflushed trades are included
+    _assert_columns(journal.columns(), trades)
+
+    journal.flush()
+    columns = load_journal(str(tmp_path / 'journal'))
+    assert isinstance(columns['premia'], np.memmap)
+    _assert_columns(columns, trades)
+
+    with pytest.raises(FileExistsError):
+        TradeJournal(directory=str(tmp_path / 'journal'))
+
+
+def test_journal_in_memory() -> None:
+    journal = TradeJournal(buffer_size=2)
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., journal=journal)
+    assert len(journal) == 0
+    assert len(journal.columns()['epoch']) == 0
+
+    trades = _trade_many(amm, 3)
+    _assert_columns(journal.columns(), trades)
+
+
+def test_amm_without_journal() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    amm.trade(1., 'call', 'long', quantity=1.)
+    assert amm.journal is None
@@ -0,0 +1,37 @@
+"""simulations/monte_carlo.py test file."""
+import pandas as pd
+
+from simulations.monte_carlo import RoundConfig, iter_rounds, run_round, run_rounds, summarize_rounds
+
+
+CONFIG = RoundConfig(epochs=50, burn_in=10)
+
+
+def test_run_round_reproducible() -> None:
+    result = run_round(round_index=3, seed=7, config=CONFIG)
+    assert result == run_round(round_index=3, seed=7, config=CONFIG)
+    assert result != run_round(round_index=4, seed=7, config=CONFIG)
+    assert result.round_index == 3
+    assert result.call_volume + result.put_volume > 0
+
+
+def test_run_rounds_independent_of_workers() -> None:
+    serial = run_rounds(n_rounds=4, seed=11, config=CONFIG, max_workers=1)
+    parallel = run_rounds(n_rounds=4, seed=11, config=CONFIG, max_workers=2, chunksize=3)
+
+    assert isinstance(serial, pd.DataFrame)
+    assert list(serial['round_index']) == [0, 1, 2, 3]
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    assert [result.round_index for result in iter_rounds(n_rounds=2, seed=11, config=CONFIG, max_workers=1)] == [0, 1]
+
+    summary = summarize_rounds(serial, epochs=CONFIG.epochs)
+    assert set(summary) == {'call', 'put'}
+    assert summary['call']['min'] <= summary['call']['mean'] <= summary['call']['max']
+
+
+def test_run_round_random_user_schedule() -> None:
+    config = RoundConfig(epochs=50, burn_in=10, random_user_schedule=True)
+    result = run_round(round_index=1, seed=7, config=config)
+    assert result == run_round(round_index=1, seed=7, config=config)
+    assert result != run_round(round_index=1, seed=7, config=CONFIG)
@@ -35,3 +35,19 @@ def test_option_init(type_: str, long_short: str, fails: bool) -> None:
                 locked_capital=1.1,
                 quantity=1.1
             )
+
+
+def test_option_record() -> None:
+    option = Option(strike_price=1., type_='call', long_short='long', locked_capital=0., quantity=2.)
+
+    assert option == Option(strike_price=1., type_='call', long_short='long', locked_capital=0., quantity=2.)
+    assert option != Option(strike_price=1., type_='call', long_short='short', locked_capital=0., quantity=2.)
+    equal_option = Option(strike_price=1., type_='call', long_short='long', locked_capital=0., quantity=2.)
+    assert hash(option) == hash(equal_option)
+    assert len({option, equal_option}) == 1
+    assert option.to_dict() == {
+        'strike_price': 1., 'type_': 'call', 'long_short': 'long', 'locked_capital': 0., 'quantity': 2.
+    }
+    # slotted, no per-instance __dict__
+    with pytest.raises(AttributeError):
+        option.expiry = 1
@@ -0,0 +1,55 @@
+"""simulations/path_cache.py test file."""
+import os
+
+import numpy as np
+import pytest
+
+from simulations.monte_carlo import RoundConfig, run_round
+from simulations.path_cache import PathCache
+from simulations.price_time_series import generate_price_volatility_paths
+
+
+def test_path_cache_hit(tmp_path) -> None:
+    cache = PathCache(str(tmp_path))
+    price, volatility = cache.get_paths(n_paths=3, series_len=50, burn_in=5, seed=1, alpha=0.2)
+    expected_price, expected_volatility = generate_price_volatility_paths(
+        n_paths=3, series_len=50, burn_in=5, seed=1, alpha=0.2
+    )
+    assert isinstance(price, np.memmap)
+    assert not price.flags.writeable
+    np.testing.assert_array_equal(price, expected_price)
+    np.testing.assert_array_equal(volatility, expected_volatility)
+
+    # explicit default parameters and an equal seed sequence address the same entry
+    assert cache.key(3, 50, 5, np.random.SeedSequence(1), alpha=0.2, beta=0.1) == cache.key(3, 50, 5, 1, alpha=0.2)
+    assert cache.key(3, 50, 5, 1, alpha=0.2) != cache.key(3, 50, 5, 2, alpha=0.2)
+    assert cache.key(3, 50, 5, None) is None
+    with pytest.raises(TypeError):
+        cache.key(3, 50, 5, 1, alpha_=0.2)
+
+    cached_price, _ = PathCache(str(tmp_path)).get_paths(n_paths=3, series_len=50, burn_in=5, seed=1, alpha=0.2)
+    assert cached_price.filename == price.filename
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_path_cache_evicts_least_recently_used(tmp_path) -> None:
+    entry_size = 2 * (10 * 100 * 8 + 128)
+    cache = PathCache(str(tmp_path), max_bytes=2 * entry_size)
+    for seed in range(2):
+        cache.get_paths(n_paths=10, series_len=100, seed=seed)
+        # modification times (last uses) of the entries in the past
+        os.utime(os.path.join(tmp_path, cache.key(10, 100, 0, seed)), (seed, seed))
+    # hit makes the entry of seed 0 the most recently used one
+    cache.get_paths(n_paths=10, series_len=100, seed=0)
+    cache.get_paths(n_paths=10, series_len=100, seed=2)
+
+    assert cache.size() == 2 * entry_size
+    assert sorted(os.listdir(tmp_path)) == sorted(cache.key(10, 100, 0, seed) for seed in (0, 2))
+
+
+def test_run_round_with_path_cache(tmp_path) -> None:
+    config = RoundConfig(epochs=30, burn_in=10)
+    cache = PathCache(str(tmp_path))
+    assert run_round(2, seed=5, config=config, path_cache=cache) == run_round(2, seed=5, config=config)
+    assert run_round(2, seed=5, config=config, path_cache=cache) == run_round(2, seed=5, config=config)
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,157 @@
+"""simulations/position_book.py test file."""
+import math
+
+import pytest
+
+from simulations.option import Option
+from simulations.position_book import PositionBook, quantize_strike
+
+
+def test_position_book_totals_and_order() -> None:
+    option_1 = Option(strike_price=1., type_='call', long_short='long', locked_capital=0., quantity=1.)
+    option_2 = Option(strike_price=1.1, type_='call', long_short='short', locked_capital=2., quantity=2.)
+    option_3 = Option(strike_price=1.0004, type_='call', long_short='long', locked_capital=0., quantity=3.)
+    book = PositionBook('call', [option_1, option_2, option_3])
+
+    assert list(book) == [option_1, option_2, option_3]
+    assert len(book) == 3
+    assert book.count(1., 'long') == 2
+    assert book.find(1., 'long') == [option_1, option_3]
+    assert book.find(1., 'short') == []
+
+    quantity, locked_capital = book.totals(1.1, 'short')
+    assert math.isclose(quantity, 2.)
+    assert math.isclose(locked_capital, 2.)
+    assert book.totals(1.2, 'short') == (0., 0.)
+
+    book.remove(option_1)
+    assert list(book) == [option_2, option_3]
+    assert math.isclose(book.totals(1., 'long')[0], 3.)
+
+    with pytest.raises(ValueError):
+        book.remove(option_1)
+    with pytest.raises(ValueError):
+        book.add(Option(strike_price=1., type_='put', long_short='long', locked_capital=0., quantity=1.))
+    with pytest.raises(ValueError):
+        PositionBook('long')
+
+
+def test_position_book_pop() -> None:
+    option_1 = Option(strike_price=1., type_='put', long_short='short', locked_capital=1., quantity=1.)
+    option_2 = Option(strike_price=.9, type_='put', long_short='short', locked_capital=.9, quantity=1.)
+    option_3 = Option(strike_price=1., type_='put', long_short='short', locked_capital=2., quantity=2.)
+    book = PositionBook('put', [option_1, option_2, option_3])
+
+    assert book.pop(1., 'short') == [option_1, option_3]
+    assert list(book) == [option_2]
+    assert book.count(1., 'short') == 0
+    assert book.totals(1., 'short') == (0., 0.)
+    assert book.pop(1., 'short') == []
+
+    book.clear()
+    assert not list(book)
+
+
+def test_position_book_grows_and_compacts() -> None:
+    book = PositionBook('call')
+    options = [
+        Option(strike_price=1. + i % 7 / 10, type_='call', long_short='long', locked_capital=0., quantity=float(i))
+        for i in range(1000)
+    ]
+    for option in options:
+        book.add(option)
+    for option in options[::2]:
+        book.remove(option)
+    for option in options[:100]:
+        book.add(option)
+
+    expected = options[1::2] + options[:100]
+    assert len(book) == len(expected)
+    assert list(book) == expected
+    assert math.isclose(book.totals(1., 'long')[0], sum(o.quantity for o in expected if o.strike_price == 1.))
+
+
+@pytest.mark.parametrize('underlying_price', [80., 95., 105., 115., 125., 135.])
+def test_position_book_bulk_operations(underlying_price: float) -> None:
+    call_book = PositionBook('call', [
+        Option(strike_price=100., type_='call', long_short='long', locked_capital=0., quantity=1.),
+        Option(strike_price=100., type_='call', long_short='short', locked_capital=2., quantity=2.),
+        Option(strike_price=120., type_='call', long_short='long', locked_capital=0., quantity=3.),
+        Option(strike_price=130., type_='call', long_short='short', locked_capital=4., quantity=4.),
+    ])
+    put_book = PositionBook('put', [
+        Option(strike_price=90., type_='put', long_short='long', locked_capital=0., quantity=1.),
+        Option(strike_price=90., type_='put', long_short='short', locked_capital=180., quantity=2.),
+        Option(strike_price=110., type_='put', long_short='long', locked_capital=0., quantity=3.),
+        Option(strike_price=120., type_='put', long_short='short', locked_capital=480., quantity=4.),
+    ])
+
+    assert math.isclose(call_book.locked_capital(), 6.)
+    assert math.isclose(put_book.locked_capital(), 660.)
+    assert math.isclose(call_book.exposure(), -2.)
+    assert math.isclose(put_book.exposure(), -2.)
+
+    s = underlying_price
+    expected_call_payoff = (
+        max(s - 100, 0) / s + 2. - 2 * max(s - 100, 0) / s + 3 * max(s - 120, 0) / s + 4. - 4 * max(s - 130, 0) / s
+    )
+    expected_put_payoff = (
+        max(90 - s, 0) + 180. - 2 * max(90 - s, 0) + 3 * max(110 - s, 0) + 480. - 4 * max(120 - s, 0)
+    )
+    assert math.isclose(call_book.payoff(underlying_price), expected_call_payoff)
+    assert math.isclose(put_book.payoff(underlying_price), expected_put_payoff)
+
+
+def test_position_book_fork_and_snapshot() -> None:
+    options = [
+        Option(strike_price=1. + i % 3 / 10, type_='put', long_short='short', locked_capital=1., quantity=float(i))
+        for i in range(10)
+    ]
+    book = PositionBook('put', options)
+    forked = book.fork()
+    forked.pop(1., 'short')
+    book.remove(options[1])
+    assert list(forked) == [option for option in options if option.strike_price != 1.]
+    assert list(book) == options[:1] + options[2:]
+
+    restored = PositionBook.from_snapshot('put', *book.snapshot())
+    assert list(restored) == list(book)
+    assert restored.totals(1.1, 'short') == book.totals(1.1, 'short')
+    restored.add(options[1])
+    assert restored.count(1.1, 'short') == book.count(1.1, 'short') + 1
+
+
+def test_position_book_listed_strike() -> None:
+    book = PositionBook('call')
+    book.add_position(1.2006, 'short', locked_capital=1., quantity=1., listed_strike_price=1.2)
+    book.add_position(1.1996, 'short', locked_capital=2., quantity=2., listed_strike_price=1.2)
+    book.add_position(1.2006, 'long', locked_capital=0., quantity=1.)
+
+    assert book.count(1.2, 'short') == 2
+    assert book.totals(1.2, 'short') == (3., 3.)
+    assert book.count(1.2, 'long') == 0
+    book.remove(Option(strike_price=1.1996, type_='call', long_short='short', locked_capital=2., quantity=2.))
+    assert book.totals(1.2, 'short') == (1., 1.)
+    assert book.drop(1.2, 'short') == 1.2006
+    assert [option.strike_price for option in book] == [1.2006]
+
+
+def test_position_book_trade() -> None:
+    book = PositionBook('put')
+    strike_key = quantize_strike(1.)
+    # user long, the pool is issued a short put locking the capital
+    assert book.trade(strike_key, True, 1.0004, locked_capital=2.0008, quantity=2.) is None
+    assert list(book) == [
+        Option(strike_price=1.0004, type_='put', long_short='short', locked_capital=2.0008, quantity=2.)
+    ]
+    # user short less than the pool's short, the remainder stays at the strike of the pool's options
+    assert book.trade(strike_key, False, 0.9996, locked_capital=0.4998, quantity=.5) == 1.0004
+    assert book.totals(1., 'short') == (1.5, 2.0008 - 0.4998)
+    assert [option.strike_price for option in book] == [1.0004]
+    # user short more than the pool's short, the pool is issued a long put
+    assert book.trade(strike_key, False, 1., locked_capital=2., quantity=2.) is None
+    assert book.count(1., 'short') == 1
+    assert book.totals(1., 'long') == (2., 0.)
+    # user long all of it
+    assert book.trade(strike_key, True, 1., locked_capital=2., quantity=2.) == 1.
+    assert book.count(1., 'long') == 0
@@ -3,8 +3,15 @@ import math
 
 import numpy as np
 import pandas as pd
+import scipy.stats
 
-from simulations.price_time_series import generate_price_volatility_process
+from simulations.price_time_series import (
+    _calc_volatility,
+    generate_price_volatility_paths,
+    generate_price_volatility_process,
+    iter_price_volatility_paths,
+    iter_price_volatility_process,
+)
 
 
 def test_generate_price_variance_process() -> None:
@@ -21,3 +28,115 @@ def test_generate_price_variance_process() -> None:
 
     assert (price > 0).all()
     assert (volatility > 0).all()
+
+
+def _generate_price_volatility_process_loop(
+        alpha: float,
+        beta: float,
+        gamma: float,
+        series_len: int,
+        epsilon_mean: float,
+        error_var: float,
+        initial_sigma: float,
+        initial_price: float,
+):
+    """Reference implementation computing the process element by element."""
+    e = scipy.stats.uniform.rvs(0, error_var, series_len)
+    sigma = []
+    latest_sigma = initial_sigma
+    for e_t in e:
+        latest_sigma = gamma * latest_sigma + e_t
+        sigma.append(latest_sigma)
+    epsilon = [scipy.stats.norm.rvs(epsilon_mean, sigma_t, 1)[0] for sigma_t in sigma]
+    r_1, r_2 = 0, 0
+    price_t = initial_price
+    price = []
+    for epsilon_t in epsilon:
+        r_t = alpha * r_1 + beta * r_2 + epsilon_t
+        r_2, r_1 = r_1, r_t
+        price_t = (1 + r_t) * price_t
+        price.append(price_t)
+    return np.array(price), _calc_volatility(alpha, beta, np.array(sigma))
+
+
+def test_generate_price_variance_process_matches_loop() -> None:
+    params = dict(
+        alpha=.4, beta=.2, gamma=.8, series_len=1_000, epsilon_mean=0.001, error_var=0.003, initial_sigma=.1,
+        initial_price=2.
+    )
+    np.random.seed(42)
+    price, volatility = generate_price_volatility_process(**params)
+    np.random.seed(42)
+    expected_price, expected_volatility = _generate_price_volatility_process_loop(**params)
+
+    assert np.allclose(price, expected_price, rtol=1e-9, atol=0)
+    assert np.allclose(volatility, expected_volatility, rtol=1e-9, atol=0)
+
+
+def test_generate_price_volatility_paths() -> None:
+    price, volatility = generate_price_volatility_paths(n_paths=7, series_len=500, burn_in=50, seed=1)
+    assert price.shape == (7, 500)
+    assert volatility.shape == (7, 500)
+    assert (price > 0).all()
+    assert (volatility > 0).all()
+    # paths are independent
+    assert not np.allclose(price[0], price[1])
+
+    # same seed gives the same paths regardless of chunking
+    same_price, same_volatility = generate_price_volatility_paths(
+        n_paths=7, series_len=500, burn_in=50, seed=1, paths_per_chunk=3
+    )
+    assert np.array_equal(price, same_price)
+    assert np.array_equal(volatility, same_volatility)
+
+    # paths can be split among workers
+    chunks = list(iter_price_volatility_paths(n_paths=3, series_len=500, burn_in=50, seed=1, path_offset=4))
+    assert len(chunks) == 1
+    assert np.array_equal(chunks[0][0], price[4:])
+    assert np.array_equal(chunks[0][1], volatility[4:])
+
+    # burn in drops the beginning of the paths
+    full_price, full_volatility = generate_price_volatility_paths(n_paths=7, series_len=550, seed=1)
+    assert np.array_equal(full_price[:, 50:], price)
+    assert np.array_equal(full_volatility[:, 50:], volatility)
+
+    other_price, _ = generate_price_volatility_paths(n_paths=7, series_len=500, burn_in=50, seed=2)
+    assert not np.allclose(price, other_price)
+
+
+def test_generate_price_volatility_paths_generator_seed() -> None:
+    price, _ = generate_price_volatility_paths(n_paths=2, series_len=100, seed=np.random.default_rng(3))
+    same_price, _ = generate_price_volatility_paths(n_paths=2, series_len=100, seed=np.random.default_rng(3))
+    assert np.array_equal(price, same_price)
+
+
+def test_iter_price_volatility_process() -> None:
+    params = dict(seed=9, burn_in=30, alpha=.35, beta=.15)
+    chunks = list(iter_price_volatility_process(chunk_len=64, series_len=1000, **params))
+    assert [len(price) for price, _ in chunks] == [64] * 15 + [40]
+    price = np.concatenate([price for price, _ in chunks])
+    volatility = np.concatenate([volatility for _, volatility in chunks])
+
+    # chunk boundaries do not change the path
+    for chunk_len in (1, 7, 1000, 5000):
+        other_chunks = list(iter_price_volatility_process(chunk_len=chunk_len, series_len=1000, **params))
+        assert np.array_equal(np.concatenate([p for p, _ in other_chunks]), price)
+        assert np.array_equal(np.concatenate([v for _, v in other_chunks]), volatility)
+
+    # and the path is the same as the one of the batch generator
+    paths_price, paths_volatility = generate_price_volatility_paths(n_paths=3, series_len=1000, **params)
+    assert np.allclose(paths_price[0], price, rtol=1e-12, atol=0)
+    assert np.allclose(paths_volatility[0], volatility, rtol=1e-12, atol=0)
+    path_2 = np.concatenate([p for p, _ in iter_price_volatility_process(
+        chunk_len=100, series_len=1000, path_index=2, **params
+    )])
+    assert np.allclose(paths_price[2], path_2, rtol=1e-12, atol=0)
+
+
+def test_iter_price_volatility_process_unbounded() -> None:
+    chunks = iter_price_volatility_process(chunk_len=10, seed=1)
+    for _ in range(100):
+        price, volatility = next(chunks)
+        assert price.shape == (10,)
+        assert (price > 0).all()
+        assert (volatility > 0).all()
@@ -0,0 +1,24 @@
+"""simulations/series.py test file."""
+import pytest
+
+from simulations.series import EpochSeries
+
+
+def test_epoch_series_grows() -> None:
+    series = EpochSeries(('epoch', 'value'), capacity=2)
+    for epoch in range(5):
+        series.append(epoch=epoch, value=epoch / 2)
+
+    assert len(series) == 5
+    assert series['epoch'].tolist() == [0, 1, 2, 3, 4]
+    assert series.columns()['value'].tolist() == [0., .5, 1., 1.5, 2.]
+
+    copied = series.copy()
+    copied.append(epoch=5, value=2.5)
+    assert len(series) == 5
+    assert copied['epoch'].tolist() == [0, 1, 2, 3, 4, 5]
+
+    with pytest.raises(ValueError):
+        series.append(epoch=5)
+    with pytest.raises(ValueError):
+        EpochSeries(('epoch',), capacity=0)
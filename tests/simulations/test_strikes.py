@@ -0,0 +1,36 @@
+"""simulations/strikes.py test file."""
+import numpy as np
+
+from simulations.strikes import StrikeIndex
+
+
+def test_strike_index() -> None:
+    # ids are positions in the listed order
+    index = StrikeIndex([1.2, 0.9, 1., 1.1])
+    assert index.strikes.tolist() == [1.2, 0.9, 1., 1.1]
+    assert not index.strikes.flags.writeable
+    assert len(index) == 4
+
+    assert index.find(1.) == 2
+    assert index.find(1.0009) == 2
+    assert index.find(0.8991) == 1
+    assert index.find(1.2009) == 0
+    assert index.find(1.05) is None
+    assert index.find(0.5) is None
+    assert index.find(2.) is None
+
+    strike_prices = np.array([1.0009, 1.05, 0.5, 2., 0.9, 1.2])
+    assert index.ids(strike_prices).tolist() == [2, -1, -1, -1, 1, 0]
+    assert index.ids(strike_prices).tolist() == [
+        -1 if index.find(x) is None else index.find(x) for x in strike_prices
+    ]
+    assert StrikeIndex([]).ids(strike_prices).tolist() == [-1] * 6
+
+
+def test_strike_index_merges_strikes() -> None:
+    # duplicates and strikes within the tolerance of a strike listed before them are merged into it
+    index = StrikeIndex([1.1, 1., 1.1, 1.0005, 0.9995, 1.0015])
+    assert index.strikes.tolist() == [1.1, 1., 1.0015]
+    assert index.find(1.0005) == 1
+    assert index.find(1.0012) == 2
+    assert index.ids(np.array([1.0005, 0.9995, 1.0015, 1.1])).tolist() == [1, 1, 2, 0]
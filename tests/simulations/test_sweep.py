@@ -0,0 +1,42 @@
+"""simulations/sweep.py test file."""
+import os
+from unittest.mock import patch
+
+import pandas as pd
+
+from simulations.monte_carlo import RoundConfig, run_round
+from simulations.sweep import config_grid, config_key, run_sweep
+
+
+BASE = RoundConfig(epochs=30, burn_in=10)
+
+
+def test_config_grid() -> None:
+    configs = config_grid(BASE, fee_size=[0.01, 0.03], call_strikes=[None, (1., 1.1)])
+    assert len(configs) == 4
+    assert configs[1] == RoundConfig(epochs=30, burn_in=10, fee_size=0.01, call_strikes=(1., 1.1))
+    assert len({config_key(config, seed=1) for config in configs}) == 4
+    assert config_key(configs[0], seed=1) != config_key(configs[0], seed=2)
+
+
+def test_run_sweep_uses_cache(tmp_path) -> None:
+    configs = config_grid(BASE, fee_size=[0.01, 0.05])
+    table = run_sweep(configs, n_rounds=2, seed=3, cache_dir=str(tmp_path), max_workers=1)
+
+    assert list(table['config_index']) == [0, 0, 1, 1]
+    assert list(table['round_index']) == [0, 1, 0, 1]
+    assert list(table['fee_size']) == [0.01, 0.01, 0.05, 0.05]
+    assert table.iloc[3]['final_call_pool_size'] == run_round(1, seed=3, config=configs[1]).final_call_pool_size
+    assert len(os.listdir(tmp_path)) == 2
+
+    extended_configs = configs + config_grid(BASE, fee_size=[0.1])
+    with patch('simulations.sweep.run_round', side_effect=run_round) as run_round_mock:
+        extended = run_sweep(extended_configs, n_rounds=3, seed=3, cache_dir=str(tmp_path), max_workers=1)
+    # only the new round of the old configurations and the rounds of the new configuration are computed
+    assert run_round_mock.call_count == 5
+    pd.testing.assert_frame_equal(
+        extended[extended['round_index'] < 2].iloc[:4].reset_index(drop=True), table
+    )
+
+    parallel = run_sweep(extended_configs, n_rounds=3, seed=3, max_workers=2)
+    pd.testing.assert_frame_equal(parallel, extended)
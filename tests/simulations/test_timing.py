@@ -0,0 +1,57 @@
+"""simulations/timing.py test file."""
+import json
+
+from simulations.amm import AMM
+from simulations.monte_carlo import RoundConfig, run_round
+from simulations.timing import SUMMARY_COLUMNS, StageTimer
+
+
+def test_stage_timer() -> None:
+    timer = StageTimer()
+    for _ in range(10):
+        start = timer.now()
+        start = timer.lap('a', start)
+        timer.lap('b', start)
+    timer.lap('a', timer.now())
+
+    summary = timer.summary()
+    assert summary['a']['count'] == 11
+    assert summary['b']['count'] == 10
+    assert 0 <= summary['a']['p50_us'] <= summary['a']['p99_us'] <= summary['a']['max_us']
+    assert len(timer.durations('b')) == 10
+
+    frame = timer.to_frame()
+    assert list(frame.columns) == list(SUMMARY_COLUMNS)
+    assert list(frame.index) == ['a', 'b']
+    assert json.loads(timer.to_json()) == summary
+
+    timer.reset()
+    assert timer.summary() == {}
+
+
+def test_amm_trade_stages() -> None:
+    timer = StageTimer()
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., timer=timer)
+    amm.trade(1.1, 'call', 'long', 1.)
+    amm.trade(1.1, 'call', 'short', 1.)
+    counts = {stage: stage_summary['count'] for stage, stage_summary in timer.summary().items()}
+    assert counts == {
+        'trade.validate': 2,
+        'trade.find_options': 2,
+        'trade.get_premia': 2,
+        'trade.check_capital': 2,
+        'trade.update_volatility': 2,
+        'trade.issue_option': 1,
+        'trade.match_options': 1,
+        'trade.record': 2,
+    }
+
+
+def test_run_round_timer() -> None:
+    timer = StageTimer()
+    config = RoundConfig(epochs=20, burn_in=10)
+    assert run_round(0, seed=1, config=config, timer=timer) == run_round(0, seed=1, config=config)
+    summary = timer.summary()
+    assert summary['random_user.trade']['count'] == 20
+    assert summary['trader_user.quote']['count'] == 60
+    assert summary['trader_user.select']['count'] == 60
@@ -1,7 +1,11 @@
 """simulations/users.py test file."""
 import math
 
-from simulations.users import RandomUser
+import numpy as np
+import pytest
+
+from simulations.amm import AMM
+from simulations.users import RandomUser, TraderUser, UserPopulation
 
 
 def test_random_user_no_trades() -> None:
@@ -40,3 +44,116 @@ def test_random_user_sometimes_trade() -> None:
 
     # There is incredibly small probability that this all user.trade() will be None or not None
     assert 0 < sum(trades) < 1000
+
+
+@pytest.mark.parametrize(
+    'volatility_adjustment, expected_long_short',
+    [
+        # trader believes options are much more expensive than AMM quotes -> buys
+        (10., 'long'),
+        # trader believes options are almost worthless -> sells
+        (-0.9, 'short'),
+    ]
+)
+def test_trader_user_trade(volatility_adjustment: float, expected_long_short: str) -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., call_volatility=0.01, put_volatility=0.01)
+    call_strikes, put_strikes = list(amm.call_strikes), list(amm.put_strikes)
+    user = TraderUser(amm=amm, volatility_adjustment=volatility_adjustment)
+
+    for _ in range(100):
+        trade = user.trade(1., 0.01)
+        assert trade is not None
+        assert trade['long_short'] == expected_long_short
+        if trade['type_'] == 'call':
+            assert trade['strike_price'] in call_strikes
+        else:
+            assert trade['strike_price'] in put_strikes
+        assert math.isclose(trade['quantity'], 1.)
+
+    # AMM's strikes are not reordered by the trader
+    assert amm.call_strikes.tolist() == call_strikes
+    assert amm.put_strikes.tolist() == put_strikes
+
+
+def test_trader_user_no_trades() -> None:
+    """Trader believing AMM's volatility sees no profitable option because of the fees."""
+    amm = AMM(time_till_maturity=100., current_underlying_price=1., call_volatility=0.01, put_volatility=0.01)
+    user = TraderUser(amm=amm, volatility_adjustment=0.)
+
+    for _ in range(100):
+        assert user.trade(1., 0.01) is None
+
+
+def test_random_user_schedule() -> None:
+    put_strikes = [.8, .9, 1., 1.1]
+    call_strikes = [.9, 1., 1.1, 1.2, 1.3]
+    user = RandomUser(trade_probability=.5, put_strikes=put_strikes, call_strikes=call_strikes)
+
+    schedule = user.draw_schedule(10_000, seed=1)
+    chunks = list(user.iter_schedule(10_000, seed=1, chunk_len=3_000))
+    assert [chunk.start for chunk in chunks] == [0, 3_000, 6_000, 9_000]
+    for field in ('trade_mask', 'is_call', 'is_long', 'strike_index'):
+        assert (np.concatenate([getattr(chunk, field) for chunk in chunks]) == getattr(schedule, field)).all()
+    assert math.isclose(schedule.trade_mask.mean(), .5, abs_tol=.02)
+    assert schedule.strike_index[schedule.is_call].max() == len(call_strikes) - 1
+    assert schedule.strike_index[~schedule.is_call].max() == len(put_strikes) - 1
+
+    empty = user.draw_schedule(0, seed=1)
+    assert len(empty) == 0
+    assert empty.strike_index.dtype == schedule.strike_index.dtype
+
+    user.use_schedule(iter(chunks))
+    for i in range(10_000):
+        trade = user.trade(1.)
+        assert (trade is not None) == schedule.trade_mask[i]
+        if trade is not None:
+            assert trade['type_'] == ('call' if schedule.is_call[i] else 'put')
+            assert trade['long_short'] == ('long' if schedule.is_long[i] else 'short')
+            strikes = call_strikes if schedule.is_call[i] else put_strikes
+            assert trade['strike_price'] == strikes[schedule.strike_index[i]]
+    with pytest.raises(ValueError):
+        user.trade(1.)
+
+    # empty schedules are skipped
+    user.use_schedule([empty, chunks[0], empty])
+    assert (user.trade(1.) is not None) == schedule.trade_mask[0]
+
+
+def test_user_population_random_users() -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    population = UserPopulation(amm, trade_probabilities=[1.] * 500 + [0.] * 500, seed=1)
+    assert len(population) == 1000
+
+    intents = population.trade_intents(1., 0.1)
+    assert len(intents) == 500
+    assert sorted(intents.user_index.tolist()) == list(range(500))
+    assert intents.user_index.tolist() != list(range(500))
+    assert math.isclose(intents.is_call.mean(), .5, abs_tol=.1)
+    assert math.isclose(intents.is_long.mean(), .5, abs_tol=.1)
+    for is_call, strike_index, strike_price in zip(intents.is_call, intents.strike_index, intents.strike_price):
+        assert strike_price == (amm.call_strikes if is_call else amm.put_strikes)[strike_index]
+
+    trades = population.trade(1., 0.1)
+    for trade in trades:
+        amm.trade(**trade)
+
+
+@pytest.mark.parametrize('volatility_adjustment,expected_is_long', [(1., True), (-.9, False)])
+def test_user_population_traders(volatility_adjustment: float, expected_is_long: bool) -> None:
+    amm = AMM(time_till_maturity=100., current_underlying_price=1.)
+    population = UserPopulation(amm, volatility_adjustments=[volatility_adjustment] * 200, seed=2)
+
+    intents = population.trade_intents(1., 0.1)
+    # traders believing in much higher (lower) volatility find the AMM's options cheap (expensive)
+    assert len(intents) > 100
+    assert (intents.is_long == expected_is_long).all()
+    assert intents.is_call.any() and not intents.is_call.all()
+    assert (intents.user_index < 200).all()
+
+    same_seed = UserPopulation(amm, volatility_adjustments=[volatility_adjustment] * 200, seed=2)
+    assert same_seed.trade_intents(1., 0.1).user_index.tolist() == intents.user_index.tolist()
+
+    with pytest.raises(ValueError):
+        population.trade_intents(1.1, 0.1)
+    with pytest.raises(ValueError):
+        UserPopulation(amm, volatility_adjustments=[-2.])